@@ -92,6 +92,10 @@ def build_parser():
                         help='corpus name')
     parser.add_argument('--n_gpus', type=int, default=1,
                         help='number of GPUs (0 indicates CPU)')
+    parser.add_argument('--rank', type=int, default=0,
+                        help='index of this process to shard the training set over world_size processes')
+    parser.add_argument('--world_size', type=int, default=1,
+                        help='number of processes to shard the training set')
     parser.add_argument('--cudnn_benchmark', type=strtobool, default=True,
                         help='use CuDNN benchmark mode')
     parser.add_argument("--train_dtype", default="float32",
@@ -108,6 +112,10 @@ def build_parser():
     # dataset
     parser.add_argument('--train_set', type=str,
                         help='tsv file path for the training set')
+    parser.add_argument('--streaming', type=strtobool, default=False,
+                        help='read the training set (glob pattern of tsv shards) lazily (no auxiliary tasks, prefetching, frame budget, label cache, sharding over ranks, discourse-aware or bucket-shuffled batches)')
+    parser.add_argument('--n_buffer_batches', type=int, default=100,
+                        help='number of mini-batches to shuffle in the streaming mode')
     parser.add_argument('--train_set_sub1', type=str, default=False,
                         help='tsv file path for the training set for the 1st auxiliary task')
     parser.add_argument('--train_set_sub2', type=str, default=False,
@@ -159,6 +167,18 @@ def build_parser():
                         help='minimum number of input frames')
     parser.add_argument('--dynamic_batching', type=strtobool, default=True,
                         help='')
+    parser.add_argument('--max_frames_per_batch', type=int, default=0,
+                        help='make mini-batches up to this number of padded input frames (overrides batch_size)')
+    parser.add_argument('--max_tokens_per_batch', type=int, default=0,
+                        help='maximum number of padded output tokens per mini-batch with --max_frames_per_batch')
+    parser.add_argument('--cache_labels', type=strtobool, default=False,
+                        help='save token IDs parsed from tsv files to sidecar cache files (*.labels.npz)')
+    parser.add_argument('--n_workers', type=int, default=0,
+                        help='number of background threads to load mini-batches in the training set')
+    parser.add_argument('--n_prefetch', type=int, default=2,
+                        help='maximum number of mini-batches loaded in advance by background threads')
+    parser.add_argument('--feat_cache_size', type=int, default=0,
+                        help='maximum memory size [MB] of the in-memory float16 feature cache for each of the dev/eval sets (0 to disable)')
     parser.add_argument('--input_noise_std', type=float, default=0,
                         help='standard deviation of Gaussian noise to input features')
     parser.add_argument('--weight_noise_std', type=float, default=0,
@@ -402,9 +422,9 @@ def build_parser():
     parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
                         help='weight of CTC score')
     parser.add_argument('--recog_lm', type=str, default=False, nargs='?',
-                        help='path to first path LM for shallow fusion')
+                        help='path to first path LM for shallow fusion (or ARPA file: *.arpa, *.arpa.gz, not for the RNN-T decoder)')
     parser.add_argument('--recog_lm_second', type=str, default=False, nargs='?',
-                        help='path to second path LM for rescoring')
+                        help='(or ARPA file) path to second path LM for rescoring')
     parser.add_argument('--recog_lm_bwd', type=str, default=False, nargs='?',
                         help='path to second path LM in the reverse direction for rescoring')
     parser.add_argument('--recog_resolving_unk', type=strtobool, default=False,
@@ -427,6 +447,16 @@ def build_parser():
                         help='number of models for the model averaging of Transformer')
     parser.add_argument('--recog_streaming', type=strtobool, default=False,
                         help='streaming decoding')
+    parser.add_argument('--recog_eout_cache_size', type=int, default=0,
+                        help='maximum memory size [MB] of the encoder output cache shared across decoding passes (0 to disable)')
+    parser.add_argument('--recog_freeze_encoder', type=strtobool, default=False,
+                        help='fold batch normalization and remove dropout in the encoder for inference')
+    parser.add_argument('--recog_lc_parallel_chunks', type=strtobool, default=False,
+                        help='encode all chunks in parallel in the latency-controlled RNN encoder during offline decoding')
+    parser.add_argument('--recog_enc_skip_layers', type=str, default='',
+                        help='delimited list of (0-indexed) Transformer/Conformer encoder layers skipped at inference, e.g., 8_10')
+    parser.add_argument('--recog_enc_early_exit_threshold', type=float, default=0.,
+                        help='exit the Transformer/Conformer encoder early when the average maximum CTC posterior of intermediate outputs exceeds this value, decided per utterance (0 to disable)')
     parser.add_argument('--recog_chunk_sync', type=strtobool, default=False,
                         help='chunk-synchronous beam search decoding for MoChA')
     parser.add_argument('--recog_ctc_spike_forced_decoding', type=strtobool, default=False,
@@ -443,4 +473,10 @@ def build_parser():
                         help='delay threshold for MMA decoder')
     parser.add_argument('--recog_mem_len', type=int, default=0,
                         help='number of tokens for memory in TransformerXL decoder during evaluation')
+    parser.add_argument('--recog_lm_state_cache_size', type=int, default=0,
+                        help='maximum number of token prefixes in the LM state cache shared across hypotheses and utterances (0 to disable, not used with replace_sos)')
+    parser.add_argument('--recog_lm_state_cache_device', type=str, default=None,
+                        help='device to store the LM state cache (e.g., cpu). The LM device is used by default.')
+    parser.add_argument('--recog_kv_cache_len', type=int, default=0,
+                        help='maximum number of cached keys and values per layer in TransformerLM/TransformerXL during evaluation (0: unlimited)')
     return parser
@@ -69,6 +69,10 @@ def build_parser():
                         help='corpus name')
     parser.add_argument('--n_gpus', type=int, default=1,
                         help='number of GPUs (0 indicates CPU)')
+    parser.add_argument('--rank', type=int, default=0,
+                        help='index of this process to shard the training set over world_size processes')
+    parser.add_argument('--world_size', type=int, default=1,
+                        help='number of processes to shard the training set')
     parser.add_argument('--cudnn_benchmark', type=strtobool, default=True,
                         help='use CuDNN benchmark mode')
     parser.add_argument("--train_dtype", default="float32",
@@ -200,7 +204,7 @@ def build_parser():
     parser.add_argument('--recog_dir', type=str, default=False,
                         help='directory to save decoding results')
     parser.add_argument('--recog_batch_size', type=int, default=1,
-                        help='size of mini-batch in evaluation')
+                        help='size of mini-batch in evaluation (number of contiguous streams for perplexity)')
     parser.add_argument('--recog_n_average', type=int, default=5,
                         help='number of models for the model averaging of Transformer')
     parser.add_argument('--recog_n_caches', type=int, default=0,
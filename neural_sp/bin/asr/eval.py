@@ -27,6 +27,12 @@ from neural_sp.evaluators.word import eval_word
 from neural_sp.evaluators.wordpiece import eval_wordpiece
 from neural_sp.evaluators.wordpiece_bleu import eval_wordpiece_bleu
 from neural_sp.models.lm.build import build_lm
+from neural_sp.models.lm.ngram import is_arpa
+from neural_sp.models.lm.ngram import NgramLM
+from neural_sp.models.lm.lm_base import LMStateCache
+from neural_sp.models.lm.rnnlm import RNNLM
+from neural_sp.models.lm.transformer_xl import TransformerXL
+from neural_sp.models.seq2seq.encoders.cache import EncoderOutputCache
 from neural_sp.models.seq2seq.speech2text import Speech2Text
 
 logger = logging.getLogger(__name__)
@@ -97,28 +103,44 @@ def main():
             # Load the LM for shallow fusion
             if not args.lm_fusion:
                 # first path
-                if args.recog_lm is not None and args.recog_lm_weight > 0:
+                ctc_only = args.ctc_weight == 1 or (args.ctc_weight > 0 and args.recog_ctc_weight == 1)
+                if is_arpa(args.recog_lm) and args.recog_lm_weight > 0:
+                    # NOTE: the RNN-T beam search assumes RNNLM states
+                    if args.dec_type in ['lstm_transducer', 'gru_transducer'] and not ctc_only:
+                        raise ValueError('ARPA LM for shallow fusion is not supported by the RNN-T decoder.')
+                    model.lm_fwd = NgramLM(args.recog_lm, os.path.join(dir_name, 'dict.txt'))
+                elif args.recog_lm is not None and args.recog_lm_weight > 0:
                     conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
                     args_lm = argparse.Namespace()
                     for k, v in conf_lm.items():
                         setattr(args_lm, k, v)
                     args_lm.recog_mem_len = args.recog_mem_len
+                    args_lm.recog_kv_cache_len = args.recog_kv_cache_len
                     lm = build_lm(args_lm, wordlm=args.recog_wordlm,
                                   lm_dict_path=os.path.join(os.path.dirname(args.recog_lm), 'dict.txt'),
                                   asr_dict_path=os.path.join(dir_name, 'dict.txt'))
                     load_checkpoint(args.recog_lm, lm)
+                    # NOTE: the RNN-T beam search keeps LM states of hypotheses with different lengths
+                    # and only batchfies those of RNNLM
+                    if args.dec_type in ['lstm_transducer', 'gru_transducer'] and not ctc_only:
+                        if not isinstance(lm, RNNLM):
+                            raise ValueError('%s for shallow fusion is not supported by the RNN-T decoder.'
+                                             % lm.__class__.__name__)
                     if args_lm.backward:
                         model.lm_bwd = lm
                     else:
                         model.lm_fwd = lm
 
                 # second path (forward)
-                if args.recog_lm_second is not None and args.recog_lm_second_weight > 0:
+                if is_arpa(args.recog_lm_second) and args.recog_lm_second_weight > 0:
+                    model.lm_second = NgramLM(args.recog_lm_second, os.path.join(dir_name, 'dict.txt'))
+                elif args.recog_lm_second is not None and args.recog_lm_second_weight > 0:
                     conf_lm_second = load_config(os.path.join(os.path.dirname(args.recog_lm_second), 'conf.yml'))
                     args_lm_second = argparse.Namespace()
                     for k, v in conf_lm_second.items():
                         setattr(args_lm_second, k, v)
                     args_lm_second.recog_mem_len = args.recog_mem_len
+                    args_lm_second.recog_kv_cache_len = args.recog_kv_cache_len
                     lm_second = build_lm(args_lm_second)
                     load_checkpoint(args.recog_lm_second, lm_second)
                     model.lm_second = lm_second
@@ -130,10 +152,55 @@ def main():
                     for k, v in conf_lm.items():
                         setattr(args_lm_bwd, k, v)
                     args_lm_bwd.recog_mem_len = args.recog_mem_len
+                    args_lm_bwd.recog_kv_cache_len = args.recog_kv_cache_len
                     lm_bwd = build_lm(args_lm_bwd)
                     load_checkpoint(args.recog_lm_bwd, lm_bwd)
                     model.lm_bwd = lm_bwd
 
+            # LM state cache shared across hypotheses and utterances
+            # NOTE: prefixes are keyed from <eos>, so the cache cannot be shared
+            # when <sos> is replaced with the utterance-dependent token
+            lm_state_caches = []
+            if args.recog_lm_state_cache_size > 0 and not args.recog_lm_state_carry_over and not args.replace_sos:
+                for lm in [getattr(model, 'lm_fwd', None), getattr(model, 'lm_bwd', None)]:
+                    if lm is None or isinstance(lm, TransformerXL):
+                        continue
+                    flops_per_token = 2 * sum(p.numel() for p in lm.parameters())  # approx.
+                    lm.state_cache = LMStateCache(args.recog_lm_state_cache_size,
+                                                  device=args.recog_lm_state_cache_device,
+                                                  flops_per_token=flops_per_token)
+                    lm_state_caches.append(lm.state_cache)
+
+            # Fold normalization layers into the encoder for inference
+            if args.recog_freeze_encoder:
+                for m in ensemble_models:
+                    m.enc = m.enc.freeze_for_inference()
+
+            # Encoder output cache shared across decoding passes
+            eout_cache = None
+            if args.recog_eout_cache_size > 0:
+                eout_cache = EncoderOutputCache(max_bytes=args.recog_eout_cache_size * 1024 ** 2)
+                for m in ensemble_models:
+                    m.eout_cache = eout_cache
+
+            # Offline chunkwise encoding for the latency-controlled RNN encoder
+            if args.recog_lc_parallel_chunks and not args.recog_streaming:
+                for m in ensemble_models:
+                    if hasattr(m.enc, 'lc_parallel_chunks'):
+                        m.enc.lc_parallel_chunks = True
+
+            # Inference-time layer skipping and early exit in the Transformer/Conformer encoder
+            skip_layer_ids = [int(lth) for lth in args.recog_enc_skip_layers.split('_') if lth != '']
+            if len(skip_layer_ids) > 0 or args.recog_enc_early_exit_threshold > 0:
+                for m in ensemble_models:
+                    if not hasattr(m.enc, 'skip_layer_ids'):
+                        continue
+                    ctc_probe = None
+                    if getattr(m.dec_fwd, 'ctc_weight', 0) > 0:
+                        ctc_probe = m.dec_fwd.ctc_probs
+                    m.enc.set_layer_skipping(skip_layer_ids, ctc_probe,
+                                             args.recog_enc_early_exit_threshold)
+
             if not args.recog_unit:
                 args.recog_unit = args.unit
 
@@ -163,6 +230,10 @@ def main():
             logger.info('ASR decoder state carry over: %s' % (args.recog_asr_state_carry_over))
             logger.info('LM state carry over: %s' % (args.recog_lm_state_carry_over))
             logger.info('model average (Transformer): %d' % (args.recog_n_average))
+            logger.info('LC-BLSTM parallel chunks: %s' % (args.recog_lc_parallel_chunks))
+            logger.info('freeze encoder: %s' % (args.recog_freeze_encoder))
+            logger.info('skipped encoder layers: %s' % (args.recog_enc_skip_layers))
+            logger.info('encoder early exit threshold: %.3f' % (args.recog_enc_early_exit_threshold))
 
             # GPU setting
             if args.recog_n_gpus >= 1:
@@ -224,6 +295,15 @@ def main():
         elasped_time = time.time() - start_time
         logger.info('Elasped time: %.3f [sec]' % elasped_time)
         logger.info('RTF: %.3f' % (elasped_time / (dataset.n_frames * 0.01)))
+        if eout_cache is not None:
+            logger.info('Encoder output cache: hit rate %.2f %%, peak memory %.2f [MB]' %
+                        (eout_cache.hit_rate * 100, eout_cache.peak_bytes / 1024 ** 2))
+        for lm_state_cache in lm_state_caches:
+            logger.info('LM state cache: hit rate %.2f %%, %d entries, saved %.3f [GFLOPs] (approx.)' %
+                        (lm_state_cache.hit_rate * 100, len(lm_state_cache), lm_state_cache.saved_flops / 1e9))
+        if args.recog_enc_early_exit_threshold > 0:
+            logger.info('Encoder early exit (layer: #utterances): %s' %
+                        (getattr(model.enc, 'exit_layer_counts', {})))
 
     if args.recog_metric == 'edit_distance':
         if 'phone' in args.recog_unit:
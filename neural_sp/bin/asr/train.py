@@ -29,6 +29,7 @@ from neural_sp.bin.train_utils import (
     set_save_path
 )
 from neural_sp.datasets.asr import Dataset
+from neural_sp.datasets.asr import StreamingDataset
 from neural_sp.models.data_parallel import CustomDataParallel
 from neural_sp.models.data_parallel import CPUWrapperASR
 from neural_sp.models.lm.build import build_lm
@@ -62,36 +63,72 @@ def main():
 
     # Load dataset
     batch_size = args.batch_size * args.n_gpus if args.n_gpus >= 1 else args.batch_size
-    train_set = Dataset(corpus=args.corpus,
-                        tsv_path=args.train_set,
-                        tsv_path_sub1=args.train_set_sub1,
-                        tsv_path_sub2=args.train_set_sub2,
-                        dict_path=args.dict,
-                        dict_path_sub1=args.dict_sub1,
-                        dict_path_sub2=args.dict_sub2,
-                        nlsyms=args.nlsyms,
-                        unit=args.unit,
-                        unit_sub1=args.unit_sub1,
-                        unit_sub2=args.unit_sub2,
-                        wp_model=args.wp_model,
-                        wp_model_sub1=args.wp_model_sub1,
-                        wp_model_sub2=args.wp_model_sub2,
-                        batch_size=batch_size,
-                        n_epochs=args.n_epochs,
-                        min_n_frames=args.min_n_frames,
-                        max_n_frames=args.max_n_frames,
-                        shuffle_bucket=args.shuffle_bucket,
-                        sort_by='input',
-                        short2long=args.sort_short2long,
-                        sort_stop_epoch=args.sort_stop_epoch,
-                        dynamic_batching=args.dynamic_batching,
-                        ctc=args.ctc_weight > 0,
-                        ctc_sub1=args.ctc_weight_sub1 > 0,
-                        ctc_sub2=args.ctc_weight_sub2 > 0,
-                        subsample_factor=args.subsample_factor,
-                        subsample_factor_sub1=args.subsample_factor_sub1,
-                        subsample_factor_sub2=args.subsample_factor_sub2,
-                        discourse_aware=args.discourse_aware)
+    if args.streaming:
+        unsupported = [k for k, v in [('train_set_sub1', args.train_set_sub1),
+                                      ('train_set_sub2', args.train_set_sub2),
+                                      ('n_workers', args.n_workers > 0),
+                                      ('max_frames_per_batch', args.max_frames_per_batch > 0),
+                                      ('cache_labels', args.cache_labels),
+                                      ('world_size', args.world_size > 1),
+                                      ('discourse_aware', args.discourse_aware),
+                                      ('shuffle_bucket', args.shuffle_bucket)] if v]
+        if len(unsupported) > 0:
+            raise ValueError('--streaming cannot be combined with: %s'
+                             % ', '.join('--' + k for k in unsupported))
+        train_set = StreamingDataset(corpus=args.corpus,
+                                     tsv_path=args.train_set,
+                                     dict_path=args.dict,
+                                     nlsyms=args.nlsyms,
+                                     unit=args.unit,
+                                     wp_model=args.wp_model,
+                                     batch_size=batch_size,
+                                     n_epochs=args.n_epochs,
+                                     min_n_frames=args.min_n_frames,
+                                     max_n_frames=args.max_n_frames,
+                                     sort_by='input',
+                                     short2long=args.sort_short2long,
+                                     dynamic_batching=args.dynamic_batching,
+                                     ctc=args.ctc_weight > 0,
+                                     subsample_factor=args.subsample_factor,
+                                     n_buffer_batches=args.n_buffer_batches)
+    else:
+        train_set = Dataset(corpus=args.corpus,
+                            tsv_path=args.train_set,
+                            tsv_path_sub1=args.train_set_sub1,
+                            tsv_path_sub2=args.train_set_sub2,
+                            dict_path=args.dict,
+                            dict_path_sub1=args.dict_sub1,
+                            dict_path_sub2=args.dict_sub2,
+                            nlsyms=args.nlsyms,
+                            unit=args.unit,
+                            unit_sub1=args.unit_sub1,
+                            unit_sub2=args.unit_sub2,
+                            wp_model=args.wp_model,
+                            wp_model_sub1=args.wp_model_sub1,
+                            wp_model_sub2=args.wp_model_sub2,
+                            batch_size=batch_size,
+                            n_epochs=args.n_epochs,
+                            min_n_frames=args.min_n_frames,
+                            max_n_frames=args.max_n_frames,
+                            shuffle_bucket=args.shuffle_bucket,
+                            sort_by='input',
+                            short2long=args.sort_short2long,
+                            sort_stop_epoch=args.sort_stop_epoch,
+                            dynamic_batching=args.dynamic_batching,
+                            ctc=args.ctc_weight > 0,
+                            ctc_sub1=args.ctc_weight_sub1 > 0,
+                            ctc_sub2=args.ctc_weight_sub2 > 0,
+                            subsample_factor=args.subsample_factor,
+                            subsample_factor_sub1=args.subsample_factor_sub1,
+                            subsample_factor_sub2=args.subsample_factor_sub2,
+                            discourse_aware=args.discourse_aware,
+                            max_frames_per_batch=args.max_frames_per_batch * max(1, args.n_gpus),
+                            max_tokens_per_batch=args.max_tokens_per_batch * max(1, args.n_gpus),
+                            cache_labels=args.cache_labels,
+                            n_workers=args.n_workers,
+                            n_prefetch=args.n_prefetch,
+                            rank=args.rank,
+                            world_size=args.world_size)
     dev_set = Dataset(corpus=args.corpus,
                       tsv_path=args.dev_set,
                       tsv_path_sub1=args.dev_set_sub1,
@@ -114,7 +151,8 @@ def main():
                       ctc_sub2=args.ctc_weight_sub2 > 0,
                       subsample_factor=args.subsample_factor,
                       subsample_factor_sub1=args.subsample_factor_sub1,
-                      subsample_factor_sub2=args.subsample_factor_sub2)
+                      subsample_factor_sub2=args.subsample_factor_sub2,
+                      feat_cache_bytes=args.feat_cache_size * 1024 ** 2)
     eval_sets = [Dataset(corpus=args.corpus,
                          tsv_path=s,
                          dict_path=args.dict,
@@ -122,7 +160,8 @@ def main():
                          unit=args.unit,
                          wp_model=args.wp_model,
                          batch_size=1,
-                         is_test=True) for s in args.eval_sets]
+                         is_test=True,
+                         feat_cache_bytes=args.feat_cache_size * 1024 ** 2) for s in args.eval_sets]
 
     args.vocab = train_set.vocab
     args.vocab_sub1 = train_set.vocab_sub1
@@ -229,7 +268,7 @@ def main():
 
     if args.resume:
         # Restore the last saved model
-        load_checkpoint(args.resume, model, optimizer)
+        load_checkpoint(args.resume, model, optimizer, dataset=train_set)
 
         # Resume between convert_to_sgd_epoch -1 and convert_to_sgd_epoch
         if resume_epoch == args.convert_to_sgd_epoch:
@@ -378,16 +417,18 @@ def main():
 
             duration_step = time.time() - start_time_step
             if args.input_type == 'speech':
-                xlen = max(len(x) for x in batch_train['xs'])
+                xlens = [len(x) for x in batch_train['xs']]
                 ylen = max(len(y) for y in batch_train['ys'])
             elif args.input_type == 'text':
-                xlen = max(len(x) for x in batch_train['ys'])
+                xlens = [len(x) for x in batch_train['ys']]
                 ylen = max(len(y) for y in batch_train['ys_sub1'])
-            logger.info("step:%d(ep:%.2f) loss:%.3f(%.3f)/lr:%.7f/bs:%d/xlen:%d/ylen:%d (%.2f min)" %
+            xlen = max(xlens)
+            padding_efficiency = sum(xlens) / max(xlen * len(xlens), 1)
+            logger.info("step:%d(ep:%.2f) loss:%.3f(%.3f)/lr:%.7f/bs:%d/xlen:%d/ylen:%d/pad:%.2f%% (%.2f min)" %
                         (n_steps, optimizer.n_epochs + train_set.epoch_detail,
                          loss_train, loss_dev,
                          optimizer.lr, len(batch_train['utt_ids']),
-                         xlen, ylen, duration_step / 60))
+                         xlen, ylen, padding_efficiency * 100, duration_step / 60))
             start_time_step = time.time()
 
         # Save fugures of loss and accuracy
@@ -405,7 +446,7 @@ def main():
                 # Save the model
                 optimizer.save_checkpoint(
                     model, save_path, remove_old=False, amp=amp,
-                    epoch_detail=train_set.epoch_detail)
+                    epoch_detail=train_set.epoch_detail, dataset=train_set)
             epoch_detail_prev = train_set.epoch_detail
 
         # Save checkpoint and evaluate model per epoch
@@ -420,7 +461,8 @@ def main():
 
                 # Save the model
                 optimizer.save_checkpoint(
-                    model, save_path, remove_old=not is_transformer, amp=amp)
+                    model, save_path, remove_old=not is_transformer, amp=amp,
+                    dataset=train_set)
             else:
                 start_time_eval = time.time()
                 # dev
@@ -432,7 +474,8 @@ def main():
                 if optimizer.is_topk or is_transformer:
                     # Save the model
                     optimizer.save_checkpoint(
-                        model, save_path, remove_old=not is_transformer, amp=amp)
+                        model, save_path, remove_old=not is_transformer, amp=amp,
+                        dataset=train_set)
 
                     # test
                     if optimizer.is_topk:
@@ -442,6 +485,11 @@ def main():
 
                 duration_eval = time.time() - start_time_eval
                 logger.info('Evaluation time: %.2f min' % (duration_eval / 60))
+                for dataset in [dev_set] + eval_sets:
+                    if dataset.feat_cache is not None:
+                        logger.info('Feature cache (%s): hit rate %.2f %%, %d utterances, memory %.2f [MB]' %
+                                    (dataset.set, dataset.feat_cache.hit_rate * 100, len(dataset.feat_cache),
+                                     dataset.feat_cache.n_bytes / 1024 ** 2))
 
                 # Early stopping
                 if optimizer.is_early_stop:
@@ -468,6 +516,7 @@ def main():
 
     reporter.tf_writer.close()
     pbar_epoch.close()
+    train_set.close()
 
     return save_path
 
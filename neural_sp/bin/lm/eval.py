@@ -70,7 +70,7 @@ def main():
 
         start_time = time.time()
 
-        ppl, _ = eval_ppl([model], dataset, batch_size=1, bptt=args.bptt,
+        ppl, _ = eval_ppl([model], dataset, batch_size=args.recog_batch_size, bptt=args.bptt,
                           n_caches=args.recog_n_caches, progressbar=True)
         ppl_avg += ppl
         print('PPL (%s): %.2f' % (dataset.set, ppl))
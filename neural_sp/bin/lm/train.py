@@ -66,7 +66,9 @@ def main():
                         bptt=args.bptt,
                         shuffle=args.shuffle,
                         backward=args.backward,
-                        serialize=args.serialize)
+                        serialize=args.serialize,
+                        rank=args.rank,
+                        world_size=args.world_size)
     dev_set = Dataset(corpus=args.corpus,
                       tsv_path=args.dev_set,
                       dict_path=args.dict,
@@ -76,7 +78,8 @@ def main():
                       batch_size=batch_size,
                       bptt=args.bptt,
                       backward=args.backward,
-                      serialize=args.serialize)
+                      serialize=args.serialize,
+                      is_test=True)
     eval_sets = [Dataset(corpus=args.corpus,
                          tsv_path=s,
                          dict_path=args.dict,
@@ -86,7 +89,8 @@ def main():
                          batch_size=1,
                          bptt=args.bptt,
                          backward=args.backward,
-                         serialize=args.serialize) for s in args.eval_sets]
+                         serialize=args.serialize,
+                         is_test=True) for s in args.eval_sets]
 
     args.vocab = train_set.vocab
 
@@ -153,7 +157,7 @@ def main():
 
     if args.resume:
         # Restore the last saved model
-        load_checkpoint(args.resume, model, optimizer)
+        load_checkpoint(args.resume, model, optimizer, dataset=train_set)
 
         # Resume between convert_to_sgd_epoch -1 and convert_to_sgd_epoch
         if resume_epoch == args.convert_to_sgd_epoch:
@@ -264,13 +268,14 @@ def main():
 
                 # Save the model
                 optimizer.save_checkpoint(
-                    model, save_path, remove_old=not is_transformer, amp=amp)
+                    model, save_path, remove_old=not is_transformer, amp=amp,
+                    dataset=train_set)
             else:
                 start_time_eval = time.time()
                 # dev
                 model.module.reset_length(args.bptt)
                 ppl_dev, _ = eval_ppl([model.module], dev_set,
-                                      batch_size=1, bptt=args.bptt)
+                                      batch_size=args.recog_batch_size, bptt=args.bptt)
                 model.module.reset_length(args.bptt)
                 optimizer.epoch(ppl_dev)  # lr decay
                 reporter.epoch(ppl_dev, name='perplexity')  # plot
@@ -280,14 +285,15 @@ def main():
                 if optimizer.is_topk or is_transformer:
                     # Save the model
                     optimizer.save_checkpoint(
-                        model, save_path, remove_old=not is_transformer, amp=amp)
+                        model, save_path, remove_old=not is_transformer, amp=amp,
+                        dataset=train_set)
 
                     # test
                     ppl_test_avg = 0.
                     for eval_set in eval_sets:
                         model.module.reset_length(args.bptt)
                         ppl_test, _ = eval_ppl([model.module], eval_set,
-                                               batch_size=1, bptt=args.bptt)
+                                               batch_size=args.recog_batch_size, bptt=args.bptt)
                         model.module.reset_length(args.bptt)
                         logger.info('PPL (%s, ep:%d): %.2f' %
                                     (eval_set.set, optimizer.n_epochs, ppl_test))
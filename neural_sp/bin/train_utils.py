@@ -126,7 +126,7 @@ def set_save_path(save_path):
     return save_path_new
 
 
-def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None):
+def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None, dataset=None):
     """Load checkpoint.
 
     Args:
@@ -134,6 +134,7 @@ def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None):
         model (torch.nn.Module):
         optimizer (LRScheduler): optimizer wrapped by LRScheduler class
         amp ():
+        dataset (Dataset): training set whose iterator state is restored
     Returns:
         topk_list (list): list of (epoch, metric)
 
@@ -171,6 +172,15 @@ def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None):
     else:
         logger.warning('amp is not loaded.')
 
+    # Restore the iterator of the training set
+    if dataset is not None:
+        if 'dataset_state_dict' in checkpoint.keys():
+            dataset.load_state_dict(checkpoint['dataset_state_dict'])
+            logger.info('=> Resume the training set from epoch %d (%.2f)' % (
+                dataset.epoch, dataset.epoch_detail))
+        else:
+            logger.warning('Iterator state of the training set is not saved.')
+
     if 'optimizer_state_dict' in checkpoint.keys() and 'topk_list' in checkpoint['optimizer_state_dict'].keys():
         topk_list = checkpoint['optimizer_state_dict']['topk_list']
     else:
@@ -10,12 +10,18 @@
 """
 
 import codecs
-import kaldiio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import logging
 import numpy as np
 import os
 import pandas as pd
 import random
 
+from neural_sp.datasets.feature_store import FeatureCache
+from neural_sp.datasets.feature_store import load_feat
+from neural_sp.datasets.label_cache import LabelCache
 from neural_sp.datasets.token_converter.character import Char2idx
 from neural_sp.datasets.token_converter.character import Idx2char
 from neural_sp.datasets.token_converter.phone import Idx2phone
@@ -28,6 +34,8 @@ from neural_sp.datasets.token_converter.wordpiece import Wp2idx
 random.seed(1)
 np.random.seed(1)
 
+logger = logging.getLogger(__name__)
+
 
 def count_vocab_size(dict_path):
     vocab_count = 1  # for <blank>
@@ -38,6 +46,31 @@ def count_vocab_size(dict_path):
     return vocab_count
 
 
+def make_token_converters(unit, dict_path, wp_model=False, nlsyms=False):
+    """Make converters between token indices and strings for the main task.
+
+    Args:
+        unit (str): word/wp/char/phone/word_char
+        dict_path (str): path to the dictionary
+        wp_model (): path to the word-piece model for sentencepiece
+        nlsyms (str): path to the non-linguistic symbols file
+    Returns:
+        idx2token (): converter from index to token
+        token2idx (): converter from token to index
+
+    """
+    if unit in ['word', 'word_char']:
+        return Idx2word(dict_path), Word2idx(dict_path, word_char_mix=(unit == 'word_char'))
+    elif unit == 'wp':
+        return Idx2wp(dict_path, wp_model), Wp2idx(dict_path, wp_model)
+    elif unit in ['char']:
+        return Idx2char(dict_path), Char2idx(dict_path, nlsyms=nlsyms)
+    elif 'phone' in unit:
+        return Idx2phone(dict_path), Phone2idx(dict_path)
+    else:
+        raise ValueError(unit)
+
+
 class Dataset(object):
 
     def __init__(self, tsv_path, dict_path,
@@ -50,7 +83,10 @@ class Dataset(object):
                  wp_model_sub1=False, ctc_sub1=False, subsample_factor_sub1=1,
                  tsv_path_sub2=False, dict_path_sub2=False, unit_sub2=False,
                  wp_model_sub2=False, ctc_sub2=False, subsample_factor_sub2=1,
-                 discourse_aware=False, first_n_utterances=-1):
+                 discourse_aware=False, first_n_utterances=-1,
+                 n_workers=0, n_prefetch=2,
+                 max_frames_per_batch=0, max_tokens_per_batch=0,
+                 cache_labels=False, rank=0, world_size=1, feat_cache_bytes=0):
         """A class for loading dataset.
 
         Args:
@@ -78,6 +114,17 @@ class Dataset(object):
             corpus (str): name of corpus
             discourse_aware (bool):
             first_n_utterances (int): evaluate the first N utterances
+            n_workers (int): number of background threads to load mini-batches
+            n_prefetch (int): maximum number of mini-batches loaded in advance
+            max_frames_per_batch (int): make mini-batches of utterances with similar lengths
+                up to this number of padded input frames (batch_size is ignored)
+            max_tokens_per_batch (int): maximum number of padded output tokens per mini-batch
+                when max_frames_per_batch > 0
+            cache_labels (bool): save token IDs parsed from tsv files to sidecar cache files
+            rank (int): index of this process among world_size processes
+            world_size (int): number of processes sharing mini-batches of each epoch
+            feat_cache_bytes (int): maximum memory size of the in-memory float16
+                feature cache for datasets read repeatedly (0: disabled)
 
         """
         super(Dataset, self).__init__()
@@ -99,11 +146,31 @@ class Dataset(object):
         self.sort_by = sort_by
         assert sort_by in ['input', 'output', 'shuffle', 'utt_id']
         self.dynamic_batching = dynamic_batching
+        self.max_frames_per_batch = max_frames_per_batch
+        self.max_tokens_per_batch = max_tokens_per_batch
+        if max_frames_per_batch > 0:
+            assert not discourse_aware
+        self.rank = rank
+        self.world_size = world_size
+        assert 0 <= rank < world_size
+        if world_size > 1:
+            assert not discourse_aware
+        self.n_utts_rank = None
         self.corpus = corpus
         self.discourse_aware = discourse_aware
         if discourse_aware:
             assert not is_test
 
+        # for prefetching
+        self.n_workers = n_workers
+        self.n_prefetch = max(1, n_prefetch)
+        self.executor = None
+        self.queue = deque()  # (future, is_new_epoch, iterator state)
+        self.state_ahead = None
+        self.state_returned = None
+
+        self.feat_cache = FeatureCache(feat_cache_bytes) if feat_cache_bytes > 0 else None
+
         self.vocab = count_vocab_size(dict_path)
         self.eos = 2
         self.pad = 3
@@ -113,20 +180,9 @@ class Dataset(object):
         self.token2idx = []
 
         # Set index converter
-        if unit in ['word', 'word_char']:
-            self.idx2token += [Idx2word(dict_path)]
-            self.token2idx += [Word2idx(dict_path, word_char_mix=(unit == 'word_char'))]
-        elif unit == 'wp':
-            self.idx2token += [Idx2wp(dict_path, wp_model)]
-            self.token2idx += [Wp2idx(dict_path, wp_model)]
-        elif unit in ['char']:
-            self.idx2token += [Idx2char(dict_path)]
-            self.token2idx += [Char2idx(dict_path, nlsyms=nlsyms)]
-        elif 'phone' in unit:
-            self.idx2token += [Idx2phone(dict_path)]
-            self.token2idx += [Phone2idx(dict_path)]
-        else:
-            raise ValueError(unit)
+        idx2token, token2idx = make_token_converters(unit, dict_path, wp_model, nlsyms)
+        self.idx2token += [idx2token]
+        self.token2idx += [token2idx]
 
         for i in range(1, 3):
             dict_path_sub = locals()['dict_path_sub' + str(i)]
@@ -155,38 +211,42 @@ class Dataset(object):
         df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
         df = df.loc[:, ['utt_id', 'speaker', 'feat_path',
                         'xlen', 'xdim', 'text', 'token_id', 'ylen', 'ydim']]
+        # Parse token IDs once, which are looked up by the row number in the tsv file
+        df['tsv_row'] = np.arange(len(df))
+        self.labels = [None if is_test else LabelCache.from_tsv(tsv_path, df['token_id'], cache_labels)]
         for i in range(1, 3):
             if locals()['tsv_path_sub' + str(i)]:
                 df_sub = pd.read_csv(locals()['tsv_path_sub' + str(i)], encoding='utf-8', delimiter='\t')
                 df_sub = df_sub.loc[:, ['utt_id', 'speaker', 'feat_path',
                                         'xlen', 'xdim', 'text', 'token_id', 'ylen', 'ydim']]
+                df_sub['tsv_row'] = np.arange(len(df_sub))
+                self.labels += [LabelCache.from_tsv(locals()['tsv_path_sub' + str(i)], df_sub['token_id'],
+                                                    cache_labels)]
                 setattr(self, 'df_sub' + str(i), df_sub)
             else:
+                self.labels += [None]
                 setattr(self, 'df_sub' + str(i), None)
-        self.input_dim = kaldiio.load_mat(df['feat_path'][0]).shape[-1]
+        self.input_dim = load_feat(df['feat_path'][0]).shape[-1]
 
         # Remove inappropriate utterances
         if is_test or discourse_aware:
             print('Original utterance num: %d' % len(df))
             n_utts = len(df)
-            df = df[df.apply(lambda x: x['ylen'] > 0, axis=1)]
+            df = df[df['ylen'] > 0]
             print('Removed %d empty utterances' % (n_utts - len(df)))
             if first_n_utterances > 0:
                 n_utts = len(df)
-                df = df[df.apply(lambda x: x['ylen'] > 0, axis=1)]
                 df = df.truncate(before=0, after=first_n_utterances - 1)
                 print('Select first %d utterances' % len(df))
         else:
             print('Original utterance num: %d' % len(df))
             n_utts = len(df)
-            df = df[df.apply(lambda x: min_n_frames <= x[
-                'xlen'] <= max_n_frames, axis=1)]
-            df = df[df.apply(lambda x: x['ylen'] > 0, axis=1)]
+            df = df[(min_n_frames <= df['xlen']) & (df['xlen'] <= max_n_frames) & (df['ylen'] > 0)]
             print('Removed %d utterances (threshold)' % (n_utts - len(df)))
 
             if ctc and subsample_factor > 1:
                 n_utts = len(df)
-                df = df[df.apply(lambda x: x['ylen'] <= (x['xlen'] // subsample_factor), axis=1)]
+                df = df[df['ylen'] <= (df['xlen'] // subsample_factor)]
                 print('Removed %d utterances (for CTC)' % (n_utts - len(df)))
 
             for i in range(1, 3):
@@ -195,8 +255,7 @@ class Dataset(object):
                 subsample_factor_sub = locals()['subsample_factor_sub' + str(i)]
                 if df_sub is not None:
                     if ctc_sub and subsample_factor_sub > 1:
-                        df_sub = df_sub[df_sub.apply(
-                            lambda x: x['ylen'] <= (x['xlen'] // subsample_factor_sub), axis=1)]
+                        df_sub = df_sub[df_sub['ylen'] <= (df_sub['xlen'] // subsample_factor_sub)]
 
                     if len(df) != len(df_sub):
                         n_utts = len(df)
@@ -230,13 +289,13 @@ class Dataset(object):
             df = df.sort_values(by=['session', 'onset'], ascending=True)
 
             # Extract previous utterances
-            groups = df.groupby('session').groups
-            df['prev_utt'] = df.apply(
-                lambda x: [df.loc[i, 'line_no']
-                           for i in groups[x['session']] if df.loc[i, 'onset'] < x['onset']], axis=1)
-            df['n_prev_utt'] = df.apply(lambda x: len(x['prev_utt']), axis=1)
-            df['n_utt_in_session'] = df.apply(
-                lambda x: len([i for i in groups[x['session']]]), axis=1)
+            # NOTE: utterances with smaller onsets are a prefix of each session after sorting
+            session = df.groupby('session', sort=False)
+            df['n_prev_utt'] = (session['onset'].rank(method='min') - 1).astype(np.int64)
+            df['n_utt_in_session'] = session['onset'].transform('size')
+            line_nos = {k: df['line_no'].values[v] for k, v in session.indices.items()}
+            df['prev_utt'] = [line_nos[k][:n].tolist()
+                              for k, n in zip(df['session'].values, df['n_prev_utt'].values)]
             df = df.sort_values(by=['n_utt_in_session'], ascending=short2long)
 
             # NOTE: this is used only when LM is trained with seliarize: true
@@ -251,7 +310,7 @@ class Dataset(object):
             elif sort_by == 'output':
                 df = df.sort_values(by=['ylen'], ascending=short2long)
             elif sort_by == 'shuffle':
-                df = df.reindex(np.random.permutation(self.df.index))
+                df = df.reindex(np.random.permutation(df.index))
 
         # Re-indexing
         if discourse_aware:
@@ -267,12 +326,7 @@ class Dataset(object):
                     setattr(self, 'df_sub' + str(i),
                             getattr(self, 'df_sub' + str(i)).reindex(df.index).reset_index())
 
-        if discourse_aware:
-            self.df_indices_buckets = self.discourse_bucketing(batch_size)
-        elif shuffle_bucket:
-            self.df_indices_buckets = self.shuffle_bucketing(batch_size)
-        else:
-            self.df_indices = list(self.df.index)
+        self.reset_indices(batch_size)
 
     def __len__(self):
         return len(self.df)
@@ -280,6 +334,8 @@ class Dataset(object):
     @property
     def epoch_detail(self):
         """Percentage of the current epoch."""
+        if self.world_size > 1:
+            return self.offset / self.n_utts_rank
         return self.offset / len(self)
 
     @property
@@ -293,15 +349,31 @@ class Dataset(object):
                 batch_size (int): size of mini-batch
 
         """
+        self.reset_indices(batch_size)
+        self.offset = 0
+
+        # Discard mini-batches loaded in advance
+        for future, _, _ in self.queue:
+            future.cancel()
+        self.queue.clear()
+        self.state_ahead = None
+        self.state_returned = None
+
+    def reset_indices(self, batch_size=None):
         if batch_size is None:
             batch_size = self.batch_size
 
-        if self.discourse_aware:
-            self.df_indices_buckets = self.discourse_bucketing(batch_size)
+        # NOTE: mini-batches of the current epoch are sampled again from this state on resumption
+        self.rng_state_epoch = random.getstate()
+        self.df_indices_buckets = None
+        if self.world_size > 1:
+            self.df_indices_buckets = deque(self.rank_bucketing(batch_size))
+        elif self.discourse_aware:
+            self.df_indices_buckets = deque(self.discourse_bucketing(batch_size))
+        elif self.max_frames_per_batch > 0:
+            self.df_indices_buckets = deque(self.frame_budget_bucketing())
         elif self.shuffle_bucket:
-            self.df_indices_buckets = self.shuffle_bucketing(batch_size)
-        else:
-            self.df_indices = list(self.df.index)
+            self.df_indices_buckets = deque(self.shuffle_bucketing(batch_size))
         self.offset = 0
 
     def next(self, batch_size=None):
@@ -317,6 +389,9 @@ class Dataset(object):
         if batch_size is None:
             batch_size = self.batch_size
 
+        if self.n_workers > 0:
+            return self.next_prefetch(batch_size)
+
         if self.epoch >= self.max_epoch:
             raise StopIteration
 
@@ -324,23 +399,145 @@ class Dataset(object):
         mini_batch = self.make_mini_batch(df_indices_mb)
 
         if is_new_epoch:
-            # shuffle the whole data
-            if self.epoch + 1 == self.sort_stop_epoch:
-                self.sort_by = 'shuffle'
-                self.df = self.df.reindex(np.random.permutation(self.df.index))
-                for i in range(1, 3):
-                    if getattr(self, 'df_sub' + str(i)) is not None:
-                        setattr(self, 'df_sub' + str(i),
-                                getattr(self, 'df_sub' + str(i)).reindex(self.df.index).reset_index())
-
-                # Re-indexing
-                self.df = self.df.reset_index()
+            self.new_epoch()
 
-            self.reset()
-            self.epoch += 1
+        return mini_batch, is_new_epoch
+
+    def new_epoch(self):
+        # shuffle the whole data
+        if self.epoch + 1 == self.sort_stop_epoch:
+            self.sort_by = 'shuffle'
+            self.df = self.df.reindex(np.random.permutation(self.df.index))
+            for i in range(1, 3):
+                if getattr(self, 'df_sub' + str(i)) is not None:
+                    setattr(self, 'df_sub' + str(i),
+                            getattr(self, 'df_sub' + str(i)).reindex(self.df.index).reset_index())
+
+            # Re-indexing
+            self.df = self.df.reset_index()
+
+        self.reset_indices()
+        self.epoch += 1
+
+    def next_prefetch(self, batch_size):
+        """Generate each mini-batch loaded by background threads.
+
+        Indices of mini-batches are sampled in the main thread in the same order
+        as next() without prefetching, so that the mini-batch sequence is
+        deterministic. Only loading features and labels runs in the background.
+        epoch and offset are advanced when each mini-batch is returned.
+
+        Args:
+            batch_size (int): size of mini-batch
+        Returns:
+            mini_batch (dict):
+            is_new_epoch (bool): flag for the end of the current epoch
 
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.n_workers)
+
+        self.prefetch(batch_size)
+        if len(self.queue) == 0:
+            self.close()
+            raise StopIteration
+        future, is_new_epoch, state = self.queue.popleft()
+        self.prefetch(batch_size)
+        mini_batch = future.result()
+        self.epoch, self.offset = state['epoch'], state['offset']
+        self.state_returned = state
         return mini_batch, is_new_epoch
 
+    def close(self):
+        """Discard mini-batches loaded in advance and stop background threads."""
+        for future, _, _ in self.queue:
+            future.cancel()
+        self.queue.clear()
+        self.state_ahead = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def prefetch(self, batch_size):
+        """Sample indices of the next mini-batches and submit them to workers."""
+        state = (self.epoch, self.offset)
+        if self.state_ahead is not None:
+            self.epoch, self.offset = self.state_ahead
+        while len(self.queue) < self.n_prefetch and self.epoch < self.max_epoch:
+            df_indices_mb, is_new_epoch = self.sample_index(batch_size)
+            # NOTE: pass the current dataframes because they are replaced in new_epoch()
+            future = self.executor.submit(self.make_mini_batch, df_indices_mb,
+                                          (self.df, self.df_sub1, self.df_sub2))
+            if is_new_epoch:
+                self.new_epoch()
+            self.queue.append((future, is_new_epoch, self.sampler_state()))
+        self.state_ahead = (self.epoch, self.offset)
+        self.epoch, self.offset = state
+
+    def sampler_state(self):
+        return {
+            'epoch': self.epoch,
+            'offset': self.offset,
+            'sort_by': self.sort_by,
+            'order': self.df['tsv_row'].values,
+            'n_buckets': None if self.df_indices_buckets is None else len(self.df_indices_buckets),
+            'rng_state_epoch': self.rng_state_epoch,
+            'rng_state': (random.getstate(), np.random.get_state()),
+        }
+
+    def state_dict(self):
+        """Return the iterator state after the last mini-batch returned by next().
+
+        Mini-batches are not saved. They are sampled again from the random state
+        at the beginning of the current epoch, and the consumed ones are skipped.
+
+        Returns:
+            state (dict):
+                epoch (int): current epoch
+                offset (int): number of utterances consumed in the current epoch
+                sort_by (str): sorting order in the current epoch
+                order (np.ndarray): row numbers in the tsv file in the order of self.df
+                n_buckets (int): number of the remaining mini-batches for bucketing
+                rng_state_epoch (tuple): state of random at the beginning of the current epoch
+                rng_state (tuple): states of random and np.random
+
+        """
+        if self.state_ahead is not None and self.state_returned is not None:
+            # NOTE: mini-batches are sampled in advance for prefetching
+            return self.state_returned
+        return self.sampler_state()
+
+    def load_state_dict(self, state):
+        """Restore the iterator state saved by state_dict().
+
+        Args:
+            state (dict): iterator state of a dataset made from the same tsv files and arguments
+
+        """
+        self.reset()
+        order = np.asarray(state['order'])
+        if not np.array_equal(order, self.df['tsv_row'].values):
+            pos = pd.Index(self.df['tsv_row'].values).get_indexer(order)
+            if len(pos) != len(self) or (pos < 0).any():
+                raise ValueError('The iterator state does not match the dataset %s.' % self.set)
+            self.df = self.df.iloc[pos].reset_index(drop=True)
+            for i in range(1, 3):
+                if getattr(self, 'df_sub' + str(i)) is not None:
+                    setattr(self, 'df_sub' + str(i),
+                            getattr(self, 'df_sub' + str(i)).iloc[pos].reset_index(drop=True))
+        self.sort_by = state['sort_by']
+        self.epoch = state['epoch']
+
+        # Sample mini-batches of the current epoch again and skip the consumed ones
+        random.setstate(state['rng_state_epoch'])
+        self.reset_indices()
+        if state['n_buckets'] is not None:
+            while len(self.df_indices_buckets) > state['n_buckets']:
+                self.df_indices_buckets.popleft()
+        self.offset = state['offset']
+        random.setstate(state['rng_state'][0])
+        np.random.set_state(state['rng_state'][1])
+
     def sample_index(self, batch_size):
         """Sample data indices of mini-batch.
 
@@ -353,54 +550,58 @@ class Dataset(object):
         """
         is_new_epoch = False
 
-        if self.discourse_aware:
-            df_indices_mb = self.df_indices_buckets.pop(0)
+        if self.world_size > 1:
+            # NOTE: utterances in mini-batch have already been shuffled
+            df_indices_mb = self.df_indices_buckets.popleft()
             self.offset += len(df_indices_mb)
             is_new_epoch = (len(self.df_indices_buckets) == 0)
 
+        elif self.discourse_aware:
+            df_indices_mb = self.df_indices_buckets.popleft()
+            self.offset += len(df_indices_mb)
+            is_new_epoch = (len(self.df_indices_buckets) == 0)
+
+        elif self.max_frames_per_batch > 0:
+            df_indices_mb = self.df_indices_buckets.popleft()
+            self.offset += len(df_indices_mb)
+            is_new_epoch = (len(self.df_indices_buckets) == 0)
+
+            # Shuffle uttrances in mini-batch
+            df_indices_mb = random.sample(df_indices_mb, len(df_indices_mb))
+
         elif self.shuffle_bucket:
-            df_indices_mb = self.df_indices_buckets.pop(0)
+            df_indices_mb = self.df_indices_buckets.popleft()
             self.offset += len(df_indices_mb)
             is_new_epoch = (len(self.df_indices_buckets) == 0)
 
             # Shuffle uttrances in mini-batch
             df_indices_mb = random.sample(df_indices_mb, len(df_indices_mb))
         else:
-            if len(self.df_indices) > batch_size:
-                # Change batch size dynamically
-                min_xlen = self.df[self.offset:self.offset + 1]['xlen'].values[0]
-                min_ylen = self.df[self.offset:self.offset + 1]['ylen'].values[0]
-                batch_size = self.set_batch_size(batch_size, min_xlen, min_ylen)
+            # NOTE: utterances are consumed in the order of self.df from self.offset
+            # Change batch size dynamically
+            min_xlen = self.df['xlen'].values[self.offset]
+            min_ylen = self.df['ylen'].values[self.offset]
+            _batch_size = self.set_batch_size(batch_size, min_xlen, min_ylen)
+            df_indices_mb = self.df.index[self.offset:self.offset + _batch_size].tolist()
 
-                df_indices_mb = list(self.df[self.offset:self.offset + batch_size].index)
+            if len(self) - self.offset > batch_size:
                 self.offset += len(df_indices_mb)
             else:
-                # Last mini-batch
-                df_indices_mb = self.df_indices[:]
+                # Last mini-batch (the rest is removed)
                 self.offset = len(self)
                 is_new_epoch = True
 
-                # Change batch size dynamically
-                min_xlen = self.df[df_indices_mb[0]:df_indices_mb[0] + 1]['xlen'].values[0]
-                min_ylen = self.df[df_indices_mb[0]:df_indices_mb[0] + 1]['ylen'].values[0]
-                batch_size = self.set_batch_size(batch_size, min_xlen, min_ylen)
-
-                # Remove the rest
-                df_indices_mb = df_indices_mb[:batch_size]
-
             # Shuffle uttrances in mini-batch
             df_indices_mb = random.sample(df_indices_mb, len(df_indices_mb))
 
-            for i in df_indices_mb:
-                self.df_indices.remove(i)
-
         return df_indices_mb, is_new_epoch
 
-    def make_mini_batch(self, df_indices_mb):
+    def make_mini_batch(self, df_indices_mb, dfs=None):
         """Create mini-batch per step.
 
         Args:
             df_indices_mb (np.ndarray): indices of dataframe in the current mini-batch
+            dfs (tuple): dataframes of the main and auxiliary tasks (default: current ones)
         Returns:
             mini_batch_dict (dict):
                 xs (list): input data of size `[T, input_dim]`
@@ -413,38 +614,43 @@ class Dataset(object):
                 sessions (list): name of each session
 
         """
+        df, df_sub1, df_sub2 = (self.df, self.df_sub1, self.df_sub2) if dfs is None else dfs
+
         # inputs
-        xs = [kaldiio.load_mat(self.df['feat_path'][i]) for i in df_indices_mb]
+        if self.feat_cache is not None:
+            xs = [self.feat_cache.load(df['utt_id'][i], df['feat_path'][i]) for i in df_indices_mb]
+        else:
+            xs = [load_feat(df['feat_path'][i]) for i in df_indices_mb]
 
         # outputs
         if self.is_test:
-            ys = [self.token2idx[0](self.df['text'][i]) for i in df_indices_mb]
+            ys = [self.token2idx[0](df['text'][i]) for i in df_indices_mb]
         else:
-            ys = [list(map(int, str(self.df['token_id'][i]).split())) for i in df_indices_mb]
+            ys = [self.labels[0][df['tsv_row'][i]] for i in df_indices_mb]
 
         ys_sub1 = []
-        if self.df_sub1 is not None:
-            ys_sub1 = [list(map(int, str(self.df_sub1['token_id'][i]).split())) for i in df_indices_mb]
+        if df_sub1 is not None:
+            ys_sub1 = [self.labels[1][df_sub1['tsv_row'][i]] for i in df_indices_mb]
         elif self.vocab_sub1 > 0 and not self.is_test:
-            ys_sub1 = [self.token2idx[1](self.df['text'][i]) for i in df_indices_mb]
+            ys_sub1 = [self.token2idx[1](df['text'][i]) for i in df_indices_mb]
 
         ys_sub2 = []
-        if self.df_sub2 is not None:
-            ys_sub2 = [list(map(int, str(self.df_sub2['token_id'][i]).split())) for i in df_indices_mb]
+        if df_sub2 is not None:
+            ys_sub2 = [self.labels[2][df_sub2['tsv_row'][i]] for i in df_indices_mb]
         elif self.vocab_sub2 > 0 and not self.is_test:
-            ys_sub2 = [self.token2idx[2](self.df['text'][i]) for i in df_indices_mb]
+            ys_sub2 = [self.token2idx[2](df['text'][i]) for i in df_indices_mb]
 
         mini_batch_dict = {
             'xs': xs,
-            'xlens': [self.df['xlen'][i] for i in df_indices_mb],
+            'xlens': [df['xlen'][i] for i in df_indices_mb],
             'ys': ys,
             'ys_sub1': ys_sub1,
             'ys_sub2': ys_sub2,
-            'utt_ids': [self.df['utt_id'][i] for i in df_indices_mb],
-            'speakers': [self.df['speaker'][i] for i in df_indices_mb],
-            'sessions': [self.df['session'][i] for i in df_indices_mb],
-            'text': [self.df['text'][i] for i in df_indices_mb],
-            'feat_path': [self.df['feat_path'][i] for i in df_indices_mb],  # for plot
+            'utt_ids': [df['utt_id'][i] for i in df_indices_mb],
+            'speakers': [df['speaker'][i] for i in df_indices_mb],
+            'sessions': [df['session'][i] for i in df_indices_mb],
+            'text': [df['text'][i] for i in df_indices_mb],
+            'feat_path': [df['feat_path'][i] for i in df_indices_mb],  # for plot
         }
         return mini_batch_dict
 
@@ -463,12 +669,12 @@ class Dataset(object):
 
     def shuffle_bucketing(self, batch_size):
         df_indices_buckets = []  # list of list
+        xlens = self.df['xlen'].values
+        ylens = self.df['ylen'].values
         offset = 0
         while True:
-            min_xlen = self.df[offset:offset + 1]['xlen'].values[0]
-            min_ylen = self.df[offset:offset + 1]['ylen'].values[0]
-            _batch_size = self.set_batch_size(batch_size, min_xlen, min_ylen)
-            df_indices_mb = list(self.df[offset:offset + _batch_size].index)
+            _batch_size = self.set_batch_size(batch_size, xlens[offset], ylens[offset])
+            df_indices_mb = self.df.index[offset:offset + _batch_size].tolist()
             df_indices_buckets.append(df_indices_mb)
             offset += len(df_indices_mb)
             if offset + _batch_size >= len(self):
@@ -478,17 +684,392 @@ class Dataset(object):
         random.shuffle(df_indices_buckets)
         return df_indices_buckets
 
+    def rank_bucketing(self, batch_size):
+        """Split mini-batches of an epoch over ranks.
+
+        All ranks sample the same sequence of mini-batches for the whole epoch,
+        and the i-th mini-batch is assigned to the (i % world_size)-th rank.
+        The last mini-batches less than world_size are dropped so that every rank
+        has the same number of mini-batches.
+
+        Returns:
+            df_indices_buckets (list): list of indices of dataframe in each mini-batch
+
+        """
+        world_size, self.world_size = self.world_size, 1
+        self.reset_indices(batch_size)
+        df_indices_buckets = []  # list of list
+        is_new_epoch = False
+        while not is_new_epoch:
+            df_indices_mb, is_new_epoch = self.sample_index(batch_size)
+            df_indices_buckets.append(df_indices_mb)
+        self.world_size = world_size
+
+        n_batches = len(df_indices_buckets) // world_size
+        if n_batches == 0:
+            raise ValueError('Mini-batches are fewer than world_size (%d < %d).' % (
+                len(df_indices_buckets), world_size))
+        df_indices_buckets = df_indices_buckets[self.rank::world_size][:n_batches]
+        self.n_utts_rank = sum(len(ids) for ids in df_indices_buckets)
+        logger.info('rank %d/%d: %d mini-batches (%d/%d utterances)' % (
+            self.rank, world_size, n_batches, self.n_utts_rank, len(self)))
+        return df_indices_buckets
+
+    def frame_budget_bucketing(self):
+        """Make mini-batches up to the budget of padded frames (and tokens).
+
+        Utterances are sorted by input length and packed into mini-batches
+        greedily, and then the order of mini-batches is shuffled.
+
+        Returns:
+            df_indices_buckets (list): list of indices of dataframe in each mini-batch
+
+        """
+        xlens = self.df['xlen'].values
+        ylens = self.df['ylen'].values
+        order = np.argsort(xlens, kind='stable')
+        df_indices = self.df.index.values[order]
+        max_frames = self.max_frames_per_batch
+        max_tokens = self.max_tokens_per_batch if self.max_tokens_per_batch > 0 else float('inf')
+
+        df_indices_buckets = []  # list of list
+        bounds = []
+        start, max_ylen = 0, 0
+        for i, (xlen, ylen) in enumerate(zip(xlens[order].tolist(), ylens[order].tolist())):
+            # NOTE: xlen is the maximum in the mini-batch because of sorting
+            max_ylen = max(max_ylen, ylen)
+            n_utts = i + 1 - start
+            if n_utts > 1 and (xlen * n_utts > max_frames or max_ylen * n_utts > max_tokens):
+                bounds.append((start, i))
+                start, max_ylen = i, ylen
+        if len(xlens) > 0:
+            bounds.append((start, len(xlens)))
+        for start, end in bounds:
+            df_indices_buckets.append(df_indices[start:end].tolist())
+
+        logger.info('%d mini-batches (%d frames per mini-batch), padding efficiency: %.2f%%' % (
+            len(bounds), max_frames,
+            self.padding_efficiency([xlens[order[start:end]] for start, end in bounds]) * 100))
+
+        # shuffle buckets
+        random.shuffle(df_indices_buckets)
+        return df_indices_buckets
+
+    @staticmethod
+    def padding_efficiency(xlens_list):
+        """Ratio of input frames to padded input frames over mini-batches."""
+        n_frames = sum(xlens.sum() for xlens in xlens_list)
+        n_padded_frames = sum(xlens.max() * len(xlens) for xlens in xlens_list)
+        return n_frames / max(n_padded_frames, 1)
+
     def discourse_bucketing(self, batch_size):
         df_indices_buckets = []  # list of list
         session_groups = [(k, v) for k, v in self.df.groupby('n_utt_in_session').groups.items()]
         if self.shuffle_bucket:
             random.shuffle(session_groups)
         for n_utt, ids in session_groups:
-            first_utt_ids = [i for i in ids if self.df['n_prev_utt'][i] == 0]
+            first_utt_ids = ids[self.df.loc[ids, 'n_prev_utt'].values == 0].values
             for i in range(0, len(first_utt_ids), batch_size):
                 first_utt_ids_mb = first_utt_ids[i:i + batch_size]
                 for j in range(n_utt):
-                    df_indices_mb = [k + j for k in first_utt_ids_mb]
-                    df_indices_buckets.append(df_indices_mb)
+                    df_indices_buckets.append((first_utt_ids_mb + j).tolist())
 
         return df_indices_buckets
+
+
+class StreamingDataset(Dataset):
+
+    def __init__(self, tsv_path, dict_path,
+                 unit, batch_size, nlsyms=False, n_epochs=1e10,
+                 min_n_frames=40, max_n_frames=2000,
+                 sort_by='input', short2long=False, dynamic_batching=False,
+                 ctc=False, subsample_factor=1, wp_model=False, corpus='',
+                 n_buffer_batches=100, shuffle_shards=True):
+        """A class for loading sharded datasets lazily for training.
+
+        Each tsv shard is scanned when it is read for the first time, and only
+        byte offsets of lines and lengths of utterances are kept in memory.
+        Mini-batches are made in each shard and shuffled in a bounded buffer.
+        Each line is read from the tsv file when the mini-batch is generated.
+
+        Args:
+            tsv_path (str or list): glob pattern of (or list of) paths to tsv shards
+            dict_path (str): path to the dictionary
+            unit (str): word/wp/char/phone/word_char
+            batch_size (int): size of mini-batch
+            nlsyms (str): path to the non-linguistic symbols file
+            n_epochs (int): total epochs for training.
+            min_n_frames (int): exclude utterances shorter than this value
+            max_n_frames (int): exclude utterances longer than this value
+            sort_by (str): sort utterances within each shard
+                input: sort by input length
+                output: sort by output length
+                shuffle: shuffle all utterances
+                utt_id: keep the order in the tsv file
+            short2long (bool): sort utterances in the descending order
+            dynamic_batching (bool): change batch size dynamically in training
+            ctc (bool):
+            subsample_factor (int):
+            wp_model (): path to the word-piece model for sentencepiece
+            corpus (str): name of corpus
+            n_buffer_batches (int): number of mini-batches to shuffle (1: no shuffling)
+            shuffle_shards (bool): shuffle the order of shards at every epoch
+
+        """
+        super(Dataset, self).__init__()
+
+        self.epoch = 0
+        self.iteration = 0
+        self.offset = 0
+
+        if isinstance(tsv_path, str):
+            self.tsv_paths = sorted(glob.glob(tsv_path))
+        else:
+            self.tsv_paths = list(tsv_path)
+        assert len(self.tsv_paths) > 0, tsv_path
+        self.set = os.path.basename(self.tsv_paths[0]).split('.')[0]
+        self.is_test = False
+        self.unit = unit
+        self.unit_sub1 = False
+        self.batch_size = batch_size
+        self.max_epoch = n_epochs
+        self.sort_by = sort_by
+        assert sort_by in ['input', 'output', 'shuffle', 'utt_id']
+        self.short2long = short2long
+        self.dynamic_batching = dynamic_batching
+        self.corpus = corpus
+        self.discourse_aware = False
+        self.n_buffer_batches = max(1, n_buffer_batches)
+        self.shuffle_shards = shuffle_shards
+
+        self.min_n_frames = min_n_frames
+        self.max_n_frames = max_n_frames
+        self.subsample_factor = subsample_factor if ctc else 1
+
+        self.vocab = count_vocab_size(dict_path)
+        self.eos = 2
+        self.pad = 3
+        # NOTE: reserved in advance
+
+        idx2token, token2idx = make_token_converters(unit, dict_path, wp_model, nlsyms)
+        self.idx2token = [idx2token]
+        self.token2idx = [token2idx]
+        self.vocab_sub1 = -1
+        self.vocab_sub2 = -1
+
+        self.index = {}  # tsv path -> (column names, byte offsets, xlens, ylens)
+        self.input_dim = load_feat(self.read_rows(self.tsv_paths[0], [0])[0]['feat_path']).shape[-1]
+        self.reset()
+
+    def __len__(self):
+        """Number of utterances (estimated from scanned shards in the first epoch)."""
+        n_utts = sum(len(index[1]) for index in self.index.values())
+        return int(round(n_utts * len(self.tsv_paths) / max(1, len(self.index))))
+
+    @property
+    def epoch_detail(self):
+        """Percentage of the current epoch."""
+        return min(1., self.offset / max(1, len(self)))
+
+    @property
+    def n_frames(self):
+        return sum(index[2].sum() for index in self.index.values())
+
+    def index_shard(self, tsv_path):
+        """Scan a tsv shard and keep utterances to be used."""
+        if tsv_path in self.index:
+            return self.index[tsv_path]
+
+        offsets, xlens, ylens = [], [], []
+        with open(tsv_path, 'rb') as f:
+            header = f.readline()
+            columns = header.decode('utf-8').rstrip('\n').split('\t')
+            i_x, i_y = columns.index('xlen'), columns.index('ylen')
+            pos = len(header)
+            for line in f:
+                fields = line.split(b'\t', max(i_x, i_y) + 1)
+                offsets.append(pos)
+                xlens.append(int(fields[i_x]))
+                ylens.append(int(fields[i_y]))
+                pos += len(line)
+        offsets = np.array(offsets, dtype=np.int64)
+        xlens = np.array(xlens, dtype=np.int32)
+        ylens = np.array(ylens, dtype=np.int32)
+
+        # Remove inappropriate utterances
+        mask = (self.min_n_frames <= xlens) & (xlens <= self.max_n_frames) & (ylens > 0)
+        if self.subsample_factor > 1:
+            mask &= ylens <= (xlens // self.subsample_factor)
+        self.index[tsv_path] = (columns, offsets[mask], xlens[mask], ylens[mask])
+        logger.info('%s: %d/%d utterances' % (tsv_path, mask.sum(), len(mask)))
+        return self.index[tsv_path]
+
+    def read_rows(self, tsv_path, rows):
+        """Read lines of utterances from a tsv shard.
+
+        Args:
+            tsv_path (str): path to the tsv shard
+            rows (list): indices of utterances in the shard
+        Returns:
+            records (list): list of dict (column name -> value)
+
+        """
+        columns, offsets, _, _ = self.index_shard(tsv_path)
+        records = []
+        with open(tsv_path, 'rb') as f:
+            for i in rows:
+                f.seek(offsets[i])
+                fields = f.readline().decode('utf-8').rstrip('\n').split('\t')
+                records.append(dict(zip(columns, fields)))
+        return records
+
+    def shard_batches(self, tsv_path, batch_size):
+        """Make mini-batches in a tsv shard.
+
+        Returns:
+            batches (list): list of (tsv_path, indices of utterances in the shard)
+
+        """
+        _, _, xlens, ylens = self.index_shard(tsv_path)
+        if self.sort_by == 'input':
+            order = np.argsort(xlens if self.short2long else -xlens, kind='stable')
+        elif self.sort_by == 'output':
+            order = np.argsort(ylens if self.short2long else -ylens, kind='stable')
+        elif self.sort_by == 'shuffle':
+            order = np.random.permutation(len(xlens))
+        else:
+            order = np.arange(len(xlens))
+
+        batches = []
+        offset = 0
+        while offset < len(order):
+            i = order[offset]
+            _batch_size = self.set_batch_size(batch_size, xlens[i], ylens[i])
+            batches.append((tsv_path, order[offset:offset + _batch_size].tolist()))
+            offset += _batch_size
+        return batches
+
+    def reset(self, batch_size=None):
+        """Reset data counter and offset.
+
+            Args:
+                batch_size (int): size of mini-batch
+
+        """
+        self.shards = list(self.tsv_paths)
+        if self.shuffle_shards:
+            random.shuffle(self.shards)
+        self.shards = deque(self.shards)
+        self.buffer = []
+        self.offset = 0
+
+    def next(self, batch_size=None):
+        """Generate each mini-batch.
+
+        Args:
+            batch_size (int): size of mini-batch
+        Returns:
+            mini_batch (dict):
+            is_new_epoch (bool): flag for the end of the current epoch
+
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        if self.epoch >= self.max_epoch:
+            raise StopIteration
+
+        batch, is_new_epoch = self.sample_index(batch_size)
+        mini_batch = self.make_mini_batch(batch)
+
+        if is_new_epoch:
+            self.reset()
+            self.epoch += 1
+
+        return mini_batch, is_new_epoch
+
+    def close(self):
+        """Nothing to stop because mini-batches are not loaded in advance."""
+        pass
+
+    def sample_index(self, batch_size):
+        """Sample a mini-batch from the shuffling buffer.
+
+        Args:
+            batch_size (int): size of mini-batch
+        Returns:
+            batch (tuple): tsv_path and indices of utterances in the shard
+            is_new_epoch (bool): flag for the end of the current epoch
+
+        """
+        while len(self.buffer) < self.n_buffer_batches and len(self.shards) > 0:
+            self.buffer += self.shard_batches(self.shards.popleft(), batch_size)
+        if len(self.buffer) == 0:
+            raise ValueError('No utterances in %s' % self.tsv_paths)
+
+        if self.n_buffer_batches > 1:
+            i = random.randrange(len(self.buffer))
+            self.buffer[i], self.buffer[-1] = self.buffer[-1], self.buffer[i]
+            batch = self.buffer.pop()
+        else:
+            batch = self.buffer.pop(0)
+        self.offset += len(batch[1])
+        is_new_epoch = (len(self.buffer) == 0 and len(self.shards) == 0)
+
+        # Shuffle uttrances in mini-batch
+        batch = (batch[0], random.sample(batch[1], len(batch[1])))
+        return batch, is_new_epoch
+
+    def state_dict(self):
+        """Return the iterator state after the last mini-batch returned by next().
+
+        Returns:
+            state (dict):
+                epoch (int): current epoch
+                offset (int): number of utterances consumed in the current epoch
+                shards (list): tsv shards to be read in the current epoch
+                buffer (list): mini-batches in the shuffling buffer
+                rng_state (tuple): states of random and np.random
+
+        """
+        return {
+            'epoch': self.epoch,
+            'offset': self.offset,
+            'shards': list(self.shards),
+            'buffer': list(self.buffer),
+            'rng_state': (random.getstate(), np.random.get_state()),
+        }
+
+    def load_state_dict(self, state):
+        """Restore the iterator state saved by state_dict()."""
+        if any(path not in self.tsv_paths for path in state['shards'] + [b[0] for b in state['buffer']]):
+            raise ValueError('The iterator state does not match the dataset %s.' % self.set)
+        self.epoch = state['epoch']
+        self.offset = state['offset']
+        self.shards = deque(state['shards'])
+        self.buffer = list(state['buffer'])
+        random.setstate(state['rng_state'][0])
+        np.random.set_state(state['rng_state'][1])
+
+    def make_mini_batch(self, batch, dfs=None):
+        """Create mini-batch per step.
+
+        Args:
+            batch (tuple): tsv_path and indices of utterances in the shard
+        Returns:
+            mini_batch_dict (dict): see Dataset.make_mini_batch
+
+        """
+        records = self.read_rows(*batch)
+        return {
+            'xs': [load_feat(r['feat_path']) for r in records],
+            'xlens': [int(r['xlen']) for r in records],
+            'ys': [list(map(int, r['token_id'].split())) for r in records],
+            'ys_sub1': [],
+            'ys_sub2': [],
+            'utt_ids': [r['utt_id'] for r in records],
+            'speakers': [r['speaker'] for r in records],
+            'sessions': [r['speaker'] for r in records],
+            'text': [r['text'] for r in records],
+            'feat_path': [r['feat_path'] for r in records],  # for plot
+        }
@@ -0,0 +1,182 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Memory-mapped sharded feature store.
+   Features of consecutive utterances are packed into large shard files
+   (`<prefix>.<shard>.feats.npy`, `[n_frames, input_dim]`), and each
+   utterance is addressed by `<shard path>:<start frame>:<end frame>`,
+   which is used in place of a Kaldi ark path in feats.scp and tsv files.
+   FeatureCache keeps features of datasets read repeatedly in memory.
+"""
+
+import codecs
+from collections import OrderedDict
+import kaldiio
+import logging
+import numpy as np
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SHARD_SUFFIX = '.feats.npy'
+
+# memory-mapped shards opened in this process
+_shards = {}
+
+
+def is_feature_store_path(feat_path):
+    return isinstance(feat_path, str) and feat_path.split(':')[0].endswith(SHARD_SUFFIX)
+
+
+def load_feat(feat_path):
+    """Load features of an utterance from a feature store or a Kaldi ark file.
+
+    Args:
+        feat_path (str): `<shard path>:<start>:<end>` or Kaldi rxfilename
+    Returns:
+        feat (np.ndarray): `[T, input_dim]`, a view of the shard for feature stores
+
+    """
+    if not is_feature_store_path(feat_path):
+        return kaldiio.load_mat(feat_path)
+    shard_path, start, end = feat_path.rsplit(':', 2)
+    shard = _shards.get(shard_path)
+    if shard is None:
+        # NOTE: copy-on-write mapping is writable without touching the file
+        shard = np.load(shard_path, mmap_mode='c')
+        _shards[shard_path] = shard
+    return shard[int(start):int(end)]
+
+
+class FeatureCache(object):
+    """LRU cache of features in memory for datasets read repeatedly.
+
+    Features are stored as float16 arrays keyed by utterance ID, and the least
+    recently used ones are evicted when the total size exceeds max_bytes.
+    Features are converted to float16 also on cache misses, so that the same
+    values are returned every time. Returned arrays must not be modified.
+    The cache is shared by prefetching worker threads and guarded by a lock,
+    which is not held while reading features from the disk.
+
+    Args:
+        max_bytes (int): maximum memory size of cached features
+        dtype (str): data type of cached features
+
+    """
+
+    def __init__(self, max_bytes, dtype='float16'):
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.cache = OrderedDict()
+        self.n_bytes = 0
+        self.peak_bytes = 0
+        self.n_hits = 0
+        self.n_misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.cache)
+
+    @property
+    def hit_rate(self):
+        n_lookups = self.n_hits + self.n_misses
+        return self.n_hits / n_lookups if n_lookups > 0 else 0.
+
+    def load(self, utt_id, feat_path):
+        """Load features of an utterance from the cache or the disk.
+
+        Args:
+            utt_id (str): utterance ID
+            feat_path (str): path to features (see load_feat)
+        Returns:
+            feat (np.ndarray): `[T, input_dim]`
+
+        """
+        with self.lock:
+            feat = self.cache.get(utt_id)
+            if feat is not None:
+                self.n_hits += 1
+                self.cache.move_to_end(utt_id)
+                return feat
+            self.n_misses += 1
+
+        feat = np.array(load_feat(feat_path), dtype=self.dtype)
+        if feat.nbytes > self.max_bytes:
+            return feat
+        with self.lock:
+            # NOTE: another thread may have cached the same utterance meanwhile
+            if utt_id in self.cache:
+                self.cache.move_to_end(utt_id)
+                return self.cache[utt_id]
+            # Evict the least recently used entries
+            while self.n_bytes + feat.nbytes > self.max_bytes:
+                self.n_bytes -= self.cache.popitem(last=False)[1].nbytes
+            self.cache[utt_id] = feat
+            self.n_bytes += feat.nbytes
+            self.peak_bytes = max(self.peak_bytes, self.n_bytes)
+        return feat
+
+
+def make_feature_store(scp_path, out_prefix, dtype='float16', shard_size=1024 ** 3):
+    """Pack features listed in feats.scp into shards.
+
+    Args:
+        scp_path (str): path to feats.scp (Kaldi ark)
+        out_prefix (str): prefix of output files
+        dtype (str): float16/float32
+        shard_size (int): maximum bytes per shard
+    Returns:
+        out_scp_path (str): path to feats.scp of the feature store `<out_prefix>.scp`
+
+    """
+    out_scp_path = out_prefix + '.scp'
+    dtype = np.dtype(dtype)
+    feats, n_bytes, n_shards = [], 0, 0
+    n_utts, n_frames = 0, 0
+
+    def flush():
+        shard_path = '%s.%d%s' % (out_prefix, n_shards, SHARD_SUFFIX)
+        offsets = np.cumsum([0] + [len(x) for _, x in feats])
+        np.save(shard_path, np.concatenate([x for _, x in feats], axis=0).astype(dtype, copy=False))
+        for (utt_id, _), start, end in zip(feats, offsets[:-1], offsets[1:]):
+            f_scp.write('%s %s:%d:%d\n' % (utt_id, os.path.abspath(shard_path), start, end))
+
+    with codecs.open(out_scp_path, 'w', 'utf-8') as f_scp:
+        for utt_id, feat in kaldiio.load_scp_sequential(scp_path):
+            if len(feats) > 0 and n_bytes + feat.size * dtype.itemsize > shard_size:
+                flush()
+                feats, n_bytes = [], 0
+                n_shards += 1
+            feats.append((utt_id, feat))
+            n_bytes += feat.size * dtype.itemsize
+            n_utts += 1
+            n_frames += len(feat)
+        if len(feats) > 0:
+            flush()
+            n_shards += 1
+
+    logger.info('Packed %d utterances (%d frames) into %d shards' % (n_utts, n_frames, n_shards))
+    return out_scp_path
+
+
+def benchmark_read(feat_paths):
+    """Measure read throughput.
+
+    Args:
+        feat_paths (list): paths to features
+    Returns:
+        n_bytes_per_sec (float): bytes (as float32) per second
+        utts_per_sec (float): utterances per second
+
+    """
+    n_bytes = 0
+    start_time = time.time()
+    for feat_path in feat_paths:
+        n_bytes += np.asarray(load_feat(feat_path), dtype=np.float32).nbytes
+    duration = max(time.time() - start_time, 1e-9)
+    return n_bytes / duration, len(feat_paths) / duration
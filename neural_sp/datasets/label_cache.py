@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Cache of token ID sequences parsed from a dataset tsv file."""
+
+import hashlib
+import logging
+import numpy as np
+import os
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = '.labels.npz'
+
+
+def hash_file(path, chunk_size=1024 ** 2):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class LabelCache(object):
+    """Token ID sequences of all utterances stored in flat arrays.
+
+    Tokens of the r-th row in the tsv file are tokens[offsets[r]:offsets[r + 1]].
+
+    Args:
+        tokens (np.ndarray): `[n_tokens]`
+        offsets (np.ndarray): `[n_rows + 1]`
+
+    """
+
+    def __init__(self, tokens, offsets):
+        self.tokens = tokens
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.tokens[self.offsets[row]:self.offsets[row + 1]].tolist()
+
+    @classmethod
+    def from_token_ids(cls, token_ids):
+        """Parse the token_id column.
+
+        Args:
+            token_ids (pd.Series): space-separated token IDs (NaN for empty ones)
+        Returns:
+            LabelCache
+
+        """
+        token_ids = token_ids.fillna('').astype(str).tolist()
+        lengths = np.fromiter((len(y.split()) for y in token_ids), dtype=np.int64, count=len(token_ids))
+        offsets = np.zeros(len(token_ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tokens = np.array(' '.join(token_ids).split(), dtype=np.int64)
+        return cls(tokens.astype(np.int32), offsets)
+
+    @classmethod
+    def from_tsv(cls, tsv_path, token_ids, persist=False):
+        """Load token ID sequences from the sidecar cache file or parse them.
+
+        Args:
+            tsv_path (str): path to the dataset tsv file
+            token_ids (pd.Series): token_id column of the tsv file
+            persist (bool): save/load the cache file `<tsv_path>.labels.npz`,
+                which is rebuilt when the tsv file is modified
+        Returns:
+            LabelCache
+
+        """
+        if not persist:
+            return cls.from_token_ids(token_ids)
+
+        cache_path = tsv_path + CACHE_SUFFIX
+        tsv_hash = hash_file(tsv_path)
+        if os.path.isfile(cache_path):
+            with np.load(cache_path) as cache:
+                if str(cache['tsv_hash']) == tsv_hash and len(cache['offsets']) == len(token_ids) + 1:
+                    logger.info('Load token IDs from %s' % cache_path)
+                    return cls(cache['tokens'], cache['offsets'])
+
+        labels = cls.from_token_ids(token_ids)
+        try:
+            with open(cache_path, 'wb') as f:
+                np.savez(f, tokens=labels.tokens, offsets=labels.offsets, tsv_hash=tsv_hash)
+            logger.info('Save token IDs to %s' % cache_path)
+        except OSError as e:
+            logger.warning('Failed to save token IDs to %s: %s' % (cache_path, e))
+        return labels
@@ -7,6 +7,8 @@
 """Base class for loading dataset for language model.
    In this class, all data will be loaded at each step.
    You can use the multi-GPU version.
+   A packed token stream made by make_token_stream() can be used instead of
+   a tsv file to avoid parsing text at every startup.
 """
 
 import logging
@@ -30,6 +32,9 @@ np.random.seed(1)
 
 logger = logging.getLogger(__name__)
 
+PACKED_SUFFIX = '.tokens.npy'
+OFFSETS_SUFFIX = '.offsets.npy'
+
 
 class Dataset(object):
 
@@ -37,17 +42,17 @@ class Dataset(object):
                  unit, batch_size, nlsyms=False, n_epochs=1e10,
                  is_test=False, min_n_tokens=1,
                  bptt=2, shuffle=False, backward=False, serialize=False,
-                 wp_model=None, corpus=''):
+                 wp_model=None, corpus='', rank=0, world_size=1):
         """A class for loading dataset.
 
         Args:
-            tsv_path (str): path to the dataset tsv file
+            tsv_path (str): path to the dataset tsv file or the packed token stream (*.tokens.npy)
             dict_path (str): path to the dictionary
             unit (str): word or wp or char or phone or word_char
             batch_size (int): size of mini-batch
             nlsyms (str): path to the non-linguistic symbols file
             n_epochs (int): total epochs for training
-            is_test (bool):
+            is_test (bool): split text into batch_size contiguous streams without dropping tokens
             min_n_tokens (int): exclude utterances shorter than this value
             bptt (int): BPTT length
             shuffle (bool): shuffle utterances per epoch.
@@ -55,6 +60,9 @@ class Dataset(object):
             serialize (bool): serialize text according to contexts in dialogue
             wp_model (): path to the word-piece model for sentencepiece
             corpus (str): name of corpus
+            rank (int): index of this process among world_size processes
+            world_size (int): number of processes sharing the corpus in training,
+                where each process reads batch_size of batch_size * world_size streams
 
         """
         super(Dataset, self).__init__()
@@ -70,11 +78,15 @@ class Dataset(object):
         self.bptt = bptt
         self.sos = 2
         self.eos = 2
+        self.pad = 3
         self.max_epoch = n_epochs
         self.shuffle = shuffle
         self.backward = backward
         self.vocab = count_vocab_size(dict_path)
         assert bptt >= 2
+        self.rank = rank
+        self.world_size = world_size
+        assert 0 <= rank < world_size
 
         self.idx2token = []
         self.token2idx = []
@@ -95,6 +107,17 @@ class Dataset(object):
         else:
             raise ValueError(unit)
 
+        self.tokens = None
+        if tsv_path.endswith(PACKED_SUFFIX):
+            # Memory-map the packed token stream
+            if serialize:
+                raise ValueError('serialize is not supported for the packed token stream.')
+            self.load_token_stream(tsv_path, is_test, min_n_tokens)
+            if shuffle:
+                self.utt_order = np.random.permutation(len(self.utt_offsets))
+            self.concat_ids = self.concat_utterances_packed()
+            return
+
         # Load dataset tsv file
         self.df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
         self.df = self.df.loc[:, ['utt_id', 'speaker', 'feat_path',
@@ -139,29 +162,161 @@ class Dataset(object):
         concat_ids += [self.eos]  # for the last sentence
         # NOTE: <sos> and <eos> have the same index
 
-        # Reshape
+        return self.reshape(np.array(concat_ids))
+
+    def load_token_stream(self, path, is_test, min_n_tokens):
+        """Memory-map the packed token stream and filter utterances.
+
+        Args:
+            path (str): path to the packed token stream (*.tokens.npy)
+            is_test (bool): split text into batch_size contiguous streams without dropping tokens
+            min_n_tokens (int): exclude utterances shorter than this value
+
+        """
+        self.tokens = np.load(path, mmap_mode='r')
+        offsets = np.load(path[:-len(PACKED_SUFFIX)] + OFFSETS_SUFFIX)
+        ylens = np.diff(offsets) - 1  # exclude <eos>
+        keep = ylens > 0 if is_test else ylens >= min_n_tokens
+        self.utt_offsets = offsets[:-1][keep]
+        self.utt_lens = ylens[keep] + 1
+        self.utt_order = None  # utt_id order
+        self.is_contiguous = bool(keep.all())
+        print('Original utterance num: %d' % len(ylens))
+        if is_test:
+            print('Removed %d empty utterances' % (len(ylens) - keep.sum()))
+        else:
+            print('Removed %d utterances (threshold)' % (len(ylens) - keep.sum()))
+
+    def concat_utterances_packed(self):
+        """Concatenate utterances in the packed token stream.
+
+        The memory-mapped stream is used without any copy when all utterances
+        are used in the original order. Otherwise, tokens are gathered at the
+        utterance level according to self.utt_order.
+
+        """
+        if self.utt_order is None and not self.backward and self.is_contiguous:
+            return self.reshape(self.tokens)
+
+        starts, lens = self.utt_offsets, self.utt_lens
+        if self.utt_order is not None:
+            starts, lens = starts[self.utt_order], lens[self.utt_order]
+        if self.backward:
+            starts, lens = starts[::-1], lens[::-1]
+        # index of each token in the stream
+        idx = np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(lens.sum())
+        concat_ids = np.empty(len(idx) + 1, dtype=self.tokens.dtype)
+        concat_ids[:-1] = self.tokens[idx]
+        concat_ids[-1] = self.eos  # for the last sentence
+        return self.reshape(concat_ids)
+
+    def reshape(self, concat_ids):
+        """Reshape concatenated token IDs to `[B, T]`."""
+        self.flat_ids = concat_ids
+        if self.is_test:
+            return self.split_streams(concat_ids, self.batch_size)
+
         n_utts = len(concat_ids)
-        concat_ids = concat_ids[:n_utts // self.batch_size * self.batch_size]
+        n_streams = self.batch_size * self.world_size
+        concat_ids = concat_ids[:n_utts // n_streams * n_streams]
         logger.info('Removed %d tokens / %d tokens' % (n_utts - len(concat_ids), n_utts))
-        concat_ids = np.array(concat_ids).reshape((self.batch_size, -1))
+        concat_ids = concat_ids.reshape((n_streams, -1))
+        # NOTE: every rank has the same number of tokens and mini-batches
+        concat_ids = concat_ids[self.rank * self.batch_size:(self.rank + 1) * self.batch_size]
 
         return concat_ids
 
+    def split_streams(self, concat_ids, n_streams):
+        """Split concatenated token IDs into contiguous streams without dropping any token.
+
+        Each stream starts from <eos> so that hidden states are carried over within a stream,
+        and adjacent streams share the boundary <eos>, i.e., the last target of a stream is
+        the first input of the next one. Every token except for the first <eos> is predicted
+        exactly once. Shorter streams are padded.
+
+        Args:
+            concat_ids (np.ndarray): `[T]`
+            n_streams (int): number of streams
+        Returns:
+            concat_ids (np.ndarray): `[n_streams, T']`
+
+        """
+        if n_streams == 1:
+            return concat_ids.reshape((1, -1))
+
+        eos_pos = np.where(concat_ids == self.eos)[0]
+        targets = np.arange(1, n_streams) * (len(concat_ids) - 1) / n_streams
+        boundaries = eos_pos[np.minimum(np.searchsorted(eos_pos, targets), len(eos_pos) - 1)]
+        boundaries = np.unique(boundaries[(boundaries > 0) & (boundaries < len(concat_ids) - 1)])
+        boundaries = [0] + boundaries.tolist() + [len(concat_ids) - 1]
+
+        streams = [concat_ids[s:e + 1] for s, e in zip(boundaries[:-1], boundaries[1:])]
+        ys = np.full((n_streams, max(len(y) for y in streams)), self.pad, dtype=concat_ids.dtype)
+        for b, y in enumerate(streams):
+            ys[b, :len(y)] = y
+        return ys
+
     def __len__(self):
         return len(self.concat_ids.reshape((-1,)))
 
     @property
     def epoch_detail(self):
         """Percentage of the current epoch."""
-        return float(self.offset * self.batch_size) / len(self)
+        return float(self.offset * self.concat_ids.shape[0]) / len(self)
 
     def reset(self):
         """Reset data counter and offset."""
         if self.shuffle:
-            self.df = self.df.reindex(np.random.permutation(self.df.index))
-            self.concat_ids = self.concat_utterances(self.df)
+            if self.tokens is not None:
+                self.utt_order = np.random.permutation(len(self.utt_offsets))
+                self.concat_ids = self.concat_utterances_packed()
+            else:
+                self.df = self.df.reindex(np.random.permutation(self.df.index))
+                self.concat_ids = self.concat_utterances(self.df)
         self.offset = 0
 
+    def state_dict(self):
+        """Return the iterator state after the last mini-batch returned by next().
+
+        Returns:
+            state (dict):
+                epoch (int): current epoch
+                offset (int): position in each stream
+                order (np.ndarray): order of utterances (dataframe indices or
+                    utterance indices in the packed token stream)
+                rng_state (tuple): states of random and np.random
+
+        """
+        return {
+            'epoch': self.epoch,
+            'offset': self.offset,
+            'order': self.utt_order if self.tokens is not None else self.df.index.values,
+            'rng_state': (random.getstate(), np.random.get_state()),
+        }
+
+    def load_state_dict(self, state):
+        """Restore the iterator state saved by state_dict().
+
+        Args:
+            state (dict): iterator state of a dataset made from the same tsv file and arguments
+
+        """
+        order = state['order']
+        if self.tokens is not None:
+            if order is not None and not np.array_equal(np.sort(order), np.arange(len(self.utt_offsets))):
+                raise ValueError('The iterator state does not match the dataset %s.' % self.set)
+            self.utt_order = order
+            self.concat_ids = self.concat_utterances_packed()
+        elif not np.array_equal(order, self.df.index.values):
+            if not np.array_equal(np.sort(order), np.sort(self.df.index.values)):
+                raise ValueError('The iterator state does not match the dataset %s.' % self.set)
+            self.df = self.df.reindex(order)
+            self.concat_ids = self.concat_utterances(self.df)
+        self.epoch = state['epoch']
+        self.offset = state['offset']
+        random.setstate(state['rng_state'][0])
+        np.random.set_state(state['rng_state'][1])
+
     def next(self, batch_size=None, bptt=None):
         """Generate each mini-batch.
 
@@ -176,7 +331,7 @@ class Dataset(object):
         if batch_size is None:
             batch_size = self.batch_size
         elif self.concat_ids.shape[0] != batch_size:
-            self.concat_ids = self.concat_ids.reshape((batch_size, -1))
+            self.concat_ids = self.split_streams(self.flat_ids, batch_size)
             # NOTE: only for the first iteration during evaluation
 
         if bptt is None:
@@ -186,6 +341,8 @@ class Dataset(object):
             raise StopIteration
 
         ys = self.concat_ids[:, self.offset:self.offset + bptt]
+        if self.tokens is not None:
+            ys = ys.astype(np.int64)  # uint16/uint32 in the packed token stream
         self.offset += bptt - 1
         # ys = self.concat_ids[:, self.offset:self.offset + (bptt + 1)]
         # self.offset += (bptt + 1) - 1
@@ -200,3 +357,49 @@ class Dataset(object):
             self.epoch += 1
 
         return ys, is_new_epoch
+
+
+def make_token_stream(tsv_path, out_prefix, vocab, eos=2, chunksize=100000):
+    """Pack token IDs in a dataset tsv file into a contiguous token stream.
+
+    Utterances are sorted by utt_id and stored as `<eos> y_1 ... y_L` followed by
+    the final <eos>, together with the offset of each utterance.
+
+    Args:
+        tsv_path (str): path to the dataset tsv file
+        out_prefix (str): prefix of output files (*.tokens.npy and *.offsets.npy)
+        vocab (int): vocabulary size
+        eos (int): index of <eos>
+        chunksize (int): number of tsv lines read at once
+    Returns:
+        tokens_path (str): path to the packed token stream
+
+    """
+    df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t', usecols=['utt_id', 'ylen'])
+    order = np.argsort(df['utt_id'].values.astype(str), kind='stable')
+    ylens = df['ylen'].values.astype(np.int64)
+    offsets = np.zeros(len(df) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(ylens[order] + 1)
+    rank = np.empty(len(df), dtype=np.int64)
+    rank[order] = np.arange(len(df))
+
+    dtype = np.uint16 if vocab <= np.iinfo(np.uint16).max + 1 else np.uint32
+    tokens_path = out_prefix + PACKED_SUFFIX
+    tokens = np.lib.format.open_memmap(tokens_path, mode='w+', dtype=dtype,
+                                       shape=(offsets[-1] + 1,))
+    i = 0
+    for chunk in pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t', usecols=['token_id'],
+                             dtype={'token_id': str}, keep_default_na=False, chunksize=chunksize):
+        for token_id in chunk['token_id']:
+            start = offsets[rank[i]]
+            ys = np.array(token_id.split(), dtype=np.int64)
+            assert len(ys) == ylens[i], 'ylen mismatch: %s' % token_id
+            tokens[start] = eos
+            tokens[start + 1:start + 1 + len(ys)] = ys
+            i += 1
+    tokens[-1] = eos  # for the last sentence
+    tokens.flush()
+    np.save(out_prefix + OFFSETS_SUFFIX, offsets)
+    logger.info('Packed %d tokens in %d utterances (%s)' % (offsets[-1] - len(df), len(df),
+                                                            np.dtype(dtype).name))
+    return tokens_path
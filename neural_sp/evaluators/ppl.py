@@ -8,6 +8,7 @@
 
 import logging
 import numpy as np
+import time
 from tqdm import tqdm
 
 from neural_sp.models.lm.gated_convlm import GatedConvLM
@@ -38,7 +39,7 @@ def eval_ppl(models, dataset, batch_size=1, bptt=None,
     Args:
         models (list): models to evaluate
         dataset (Dataset): evaluation dataset
-        batch_size (int): batch size
+        batch_size (int): batch size (number of contiguous streams for LM)
         bptt (int): BPTT length
         n_caches (int):
         progressbar (bool): if True, visualize the progressbar
@@ -51,32 +52,28 @@ def eval_ppl(models, dataset, batch_size=1, bptt=None,
     dataset.reset()
 
     is_lm = check_lm(models[0])
+    if is_lm and n_caches > 0:
+        models[0].reset_cache()
     total_loss = 0
     n_tokens = 0
+    start_time = time.time()
     hidden = None  # for RNNLM
     if progressbar:
         pbar = tqdm(total=len(dataset))
     while True:
         if is_lm:
             ys, is_new_epoch = dataset.next(batch_size, bptt)
-            bs, time = ys.shape[:2]
+            bs, ymax = ys.shape[:2]
             if n_caches > 0:
                 assert isinstance(models[0], RNNLM)
                 # NOTE: cache is not supported for GatedConvLM/TransformerLM now
-                for t in range(time - 1):
-                    loss, hidden = models[0](ys[:, t:t + 2], hidden, is_eval=True, n_caches=n_caches)[:2]
-                    total_loss += loss.item() * bs
-                    n_tokens += bs
-
-                    if progressbar:
-                        pbar.update(bs)
-            else:
-                loss, hidden = models[0](ys, hidden, is_eval=True)[:2]
-                total_loss += loss.item() * bs * (time - 1)
-                n_tokens += bs * (time - 1)
-
-                if progressbar:
-                    pbar.update(bs * (time - 1))
+            loss, hidden = models[0](ys, hidden, is_eval=True, n_caches=n_caches)[:2]
+            n_tokens_b = int((ys[:, 1:] != dataset.pad).sum())  # streams can be padded
+            total_loss += loss.item() * n_tokens_b
+            n_tokens += n_tokens_b
+
+            if progressbar:
+                pbar.update(bs * (ymax - 1))
         else:
             batch, is_new_epoch = dataset.next(batch_size)
             bs = len(batch['ys'])
@@ -97,6 +94,10 @@ def eval_ppl(models, dataset, batch_size=1, bptt=None,
     # Reset data counters
     dataset.reset()
 
+    elapsed_time = time.time() - start_time
+    logger.info('%d tokens in %.2f [sec] (%.1f tokens/sec)' %
+                (n_tokens, elapsed_time, n_tokens / elapsed_time))
+
     avg_loss = total_loss / n_tokens
     ppl = np.exp(avg_loss)
 
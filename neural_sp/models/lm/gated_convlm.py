@@ -40,9 +40,7 @@ class GatedConvLM(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_cache()
 
         self.embed = nn.Embedding(self.vocab, args.emb_dim, padding_idx=self.pad)
         self.dropout_embed = nn.Dropout(p=args.dropout_in)
@@ -188,27 +186,39 @@ class GatedConvLM(LMBase):
             else:
                 raise ValueError(n)
 
-    def decode(self, ys, state=None, mems=None, incremental=False):
+    def decode(self, ys, state=None, mems=None, cache=None, incremental=False):
         """Decode function.
 
         Args:
             ys (LongTensor): `[B, L]`
-            state: dummy interfance for RNNLM
+            state (list): length `n_blocks`, each of which contains a FloatTensor
+                `[B, in_ch, kernel_size - 1, 1]` (inputs of the previous steps in each block).
+                Only used in the incremental mode.
+            mems: dummy interfance for TransformerXL
             cache: dummy interfance for TransformerLM/TransformerXL
-            incremental: dummy interfance for TransformerLM/TransformerXL
+            incremental (bool): ASR decoding mode. If True, only new tokens are fed
+                and the previous context is restored from `state`.
         Returns:
             logits (FloatTensor): `[B, L, vocab]`
             out (FloatTensor): `[B, L, d_model]` (for cache)
-            new_cache: dummy interfance for RNNLM/TransformerLM/TransformerXL
-            new_mems: dummy interfance for TransformerXL
+            new_state (list): length `n_blocks`, each of which contains a FloatTensor
+                `[B, in_ch, kernel_size - 1, 1]` (only in the incremental mode)
 
         """
         out = self.dropout_embed(self.embed(ys.long()))
-        bs, max_ylen = out.size()[:2]
 
         # NOTE: consider embed_dim as in_ch
         out = out.unsqueeze(3)
-        out = self.blocks(out.transpose(2, 1))  # [B, out_ch, T, 1]
+        out = out.transpose(2, 1)  # `[B, in_ch, T, 1]`
+        new_state = None
+        if incremental:
+            if state is None:
+                state = [None] * len(self.blocks)
+            new_state = [None] * len(self.blocks)
+            for lth, block in enumerate(self.blocks):
+                out, new_state[lth] = block.forward_incremental(out, state[lth])
+        else:
+            out = self.blocks(out)  # [B, out_ch, T, 1]
         out = out.transpose(2, 1).contiguous()  # `[B, T, out_ch, 1]`
         out = out.squeeze(3)
         if self.adaptive_softmax is None:
@@ -216,4 +226,4 @@ class GatedConvLM(LMBase):
         else:
             logits = out
 
-        return logits, out, None
+        return logits, out, new_state
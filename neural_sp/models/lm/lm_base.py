@@ -6,6 +6,7 @@
 
 """Base class for language models."""
 
+from collections import OrderedDict
 import logging
 import numpy as np
 import torch
@@ -72,58 +73,91 @@ class LMBase(ModelBase):
             logits = logits[:, -1].unsqueeze(1)
 
         # Compute XE sequence loss
-        if n_caches > 0 and len(self.cache_ids) > 0:
-            assert ys_out.size(1) == 1
-            assert ys_out.size(0) == 1
-            if self.adaptive_softmax is None:
-                probs = torch.softmax(logits, dim=-1)
-            else:
-                probs = self.adaptive_softmax.log_prob(logits).exp()
-            cache_probs = probs.new_zeros(probs.size())
-
-            # Truncate cache
-            self.cache_ids = self.cache_ids[-n_caches:]  # list of `[B, 1]`
-            self.cache_keys = self.cache_keys[-n_caches:]  # list of `[B, 1, n_units]`
-
-            # Compute inner-product over caches
-            cache_attn = torch.softmax(self.cache_theta * torch.matmul(
-                torch.cat(self.cache_keys, dim=1), out.transpose(2, 1)).squeeze(2), dim=1)
-
-            # For visualization
-            if len(self.cache_ids) == n_caches:
-                self.cache_attn += [cache_attn.cpu().numpy()]
-                self.cache_attn = self.cache_attn[-n_caches:]
-
-            # Sum all probabilities
-            for offset, idx in enumerate(self.cache_ids):
-                cache_probs[:, :, idx] += cache_attn[:, offset]
-            probs = (1 - self.cache_lambda) * probs + self.cache_lambda * cache_probs
-            loss = -torch.log(probs[:, :, ys_out[:, -1]])
+        if n_caches > 0:
+            loss = self.forward_cache(logits, out, ys_out, n_caches)
+            ppl = np.exp(loss.item())
         else:
             if self.adaptive_softmax is None:
                 loss, ppl = cross_entropy_lsm(logits, ys_out.contiguous(),
                                               self.lsm_prob, self.pad, self.training,
                                               normalize_length=True)
             else:
-                loss = self.adaptive_softmax(logits.view((-1, logits.size(2))),
-                                             ys_out.contiguous().view(-1)).loss
+                mask = ys_out != self.pad
+                loss = self.adaptive_softmax(logits[mask], ys_out[mask]).loss
                 ppl = np.exp(loss.item())
 
-        if n_caches > 0:
-            # Register to cache
-            self.cache_ids += [ys_out[0, -1].item()]
-            self.cache_keys += [out]
-
         # Compute token-level accuracy in teacher-forcing
         if self.adaptive_softmax is None:
             acc = compute_accuracy(logits, ys_out, pad=self.pad)
         else:
-            acc = compute_accuracy(self.adaptive_softmax.log_prob(
-                logits.view((-1, logits.size(2)))), ys_out, pad=self.pad)
+            acc = compute_accuracy(self.output_log_probs(logits), ys_out, pad=self.pad)
 
         observation = {'loss.lm': loss.item(), 'acc.lm': acc, 'ppl.lm': ppl}
         return loss, new_state, observation
 
+    def forward_cache(self, logits, out, ys_out, n_caches):
+        """Compute loss interpolated with the neural cache over the whole window.
+
+        Each token attends to hidden states of the previous n_caches tokens,
+        which include those in the previous mini-batches kept in self.cache_keys.
+
+        Args:
+            logits (FloatTensor): `[B, L, vocab]`
+            out (FloatTensor): `[B, L, n_units]`
+            ys_out (LongTensor): `[B, L]`
+            n_caches (int): number of cached states
+        Returns:
+            loss (FloatTensor): `[1]`
+
+        """
+        bs, ymax = ys_out.size()
+        keys, ids = out, ys_out
+        n_prev = 0
+        if self.cache_keys is not None:
+            # Truncate cache
+            keys = torch.cat([self.cache_keys[:, -n_caches:], out], dim=1)
+            ids = torch.cat([self.cache_ids[:, -n_caches:], ys_out], dim=1)
+            n_prev = keys.size(1) - ymax
+
+        # key j is visible from query t iff n_prev + t - n_caches <= j < n_prev + t
+        key_pos = torch.arange(keys.size(1), device=out.device).unsqueeze(0)
+        query_pos = torch.arange(ymax, device=out.device).unsqueeze(1) + n_prev
+        visible = (key_pos < query_pos) & (key_pos >= query_pos - n_caches)  # `[L, n_prev + L]`
+        has_cache = visible.any(1)  # `[L]`
+
+        # Compute inner-product over caches
+        cache_attn = torch.softmax((self.cache_theta * torch.matmul(
+            out, keys.transpose(2, 1))).masked_fill(~visible, float('-inf')), dim=-1)
+        cache_attn = cache_attn.masked_fill(~has_cache.view(1, ymax, 1), 0)  # no cache for the first token
+
+        # For visualization
+        is_full = query_pos.squeeze(1) >= n_caches
+        if is_full.any():
+            window = (query_pos - n_caches + torch.arange(n_caches, device=out.device)).clamp(min=0)
+            aws = cache_attn.gather(2, window.unsqueeze(0).expand(bs, -1, -1))
+            self.cache_attn += [aws[:, t].cpu().numpy() for t in is_full.nonzero()[-n_caches:, 0].tolist()]
+            self.cache_attn = self.cache_attn[-n_caches:]
+
+        # Sum all probabilities
+        probs = self.output_log_probs(logits).exp()
+        cache_probs = probs.new_zeros(probs.size()).scatter_add_(
+            2, ids.unsqueeze(1).expand(-1, ymax, -1), cache_attn)
+        cache_lambda = self.cache_lambda * has_cache.to(probs.dtype).view(1, ymax, 1)
+        probs = (1 - cache_lambda) * probs + cache_lambda * cache_probs
+        mask = ys_out != self.pad
+        loss = -torch.log(probs.gather(2, ys_out.unsqueeze(2)).squeeze(2)[mask]).mean()
+
+        # Register to cache
+        self.cache_keys = keys.detach()
+        self.cache_ids = ids
+        return loss
+
+    def reset_cache(self):
+        """Clear the neural cache."""
+        self.cache_ids = None  # `[B, n_caches]`
+        self.cache_keys = None  # `[B, n_caches, n_units]`
+        self.cache_attn = []
+
     def repackage_state(self, state):
         return state
 
@@ -160,9 +194,272 @@ class LMBase(ModelBase):
         """
         logits, lmout, new_state = self.decode(ys, state, mems=mems, cache=cache,
                                                incremental=True)
-        log_probs = torch.log_softmax(logits, dim=-1)
+        log_probs = self.output_log_probs(logits)
         return lmout, new_state, log_probs
 
+    def output_log_probs(self, logits):
+        """Normalize outputs over the whole vocabulary.
+
+        Args:
+            logits (FloatTensor): `[B, L, vocab]` (`[B, L, n_units]` for adaptive softmax)
+        Returns:
+            log_probs (FloatTensor): `[B, L, vocab]`
+
+        """
+        if getattr(self, 'adaptive_softmax', None) is None:
+            return torch.log_softmax(logits, dim=-1)
+        bs, lmax = logits.size()[:2]
+        return self.adaptive_softmax.log_prob(logits.contiguous().view(bs * lmax, -1)).view(bs, lmax, -1)
+
+    def shortlist_log_probs(self, logits, candidate_ids):
+        """Normalized log-probabilities of candidate tokens only.
+
+        The scores are exactly equal to those gathered from output_log_probs().
+        For adaptive softmax, only the tail clusters containing candidates are computed.
+
+        Args:
+            logits (FloatTensor): `[B, vocab]` (`[B, n_units]` for adaptive softmax)
+            candidate_ids (LongTensor): `[B, K]`
+        Returns:
+            log_probs (FloatTensor): `[B, K]`
+
+        """
+        asm = getattr(self, 'adaptive_softmax', None)
+        if asm is None:
+            return logits.gather(1, candidate_ids) - torch.logsumexp(logits, dim=-1, keepdim=True)
+
+        head_log_probs = torch.log_softmax(asm.head(logits), dim=-1)  # `[B, shortlist_size + n_clusters]`
+        log_probs = head_log_probs.gather(1, candidate_ids.clamp(max=asm.shortlist_size - 1))
+        for i in range(len(asm.tail)):
+            start, stop = asm.cutoffs[i], asm.cutoffs[i + 1]
+            in_cluster = (candidate_ids >= start) & (candidate_ids < stop)
+            if not in_cluster.any():
+                continue
+            rows = in_cluster.any(1).nonzero().squeeze(1)
+            cluster_log_probs = torch.log_softmax(asm.tail[i](logits[rows]), dim=-1)
+            tail_log_probs = cluster_log_probs.gather(
+                1, (candidate_ids[rows] - start).clamp(0, stop - start - 1))
+            tail_log_probs += head_log_probs[rows, asm.shortlist_size + i].unsqueeze(1)
+            log_probs[rows] = torch.where(in_cluster[rows], tail_log_probs, log_probs[rows])
+        return log_probs
+
+    def cached_predict(self, ys, state, prefixes, mems=None, cache=None,
+                       candidate_ids=None):
+        """Precict function for ASR with lookups in the LM state cache.
+
+        LM outputs of hypotheses whose prefixes are found in self.state_cache
+        are reused, and only the other hypotheses are fed to the LM.
+        When candidate_ids is given, only the scores of candidate tokens are
+        normalized (see shortlist_log_probs()).
+
+        Args:
+            ys (LongTensor): `[B, L]`
+            state: LM states of all hypotheses (see predict())
+            prefixes (list): length `B`, token sequences of hypotheses including the tokens in ys
+            mems (list):
+            cache (list):
+            candidate_ids (LongTensor): `[B, K]`, tokens to be scored
+        Returns:
+            lmout (FloatTensor): `[B, 1, n_units]`
+            state: LM states of all hypotheses
+            log_probs (FloatTensor): `[B, 1, vocab]` (`[B, 1, K]` if candidate_ids is given)
+
+        """
+        if getattr(self, 'state_cache', None) is None:
+            logits, lmout, new_state = self.decode(ys, state, mems=mems, cache=cache,
+                                                   incremental=True)
+            return lmout[:, -1:], new_state, self._score_last(logits[:, -1:], candidate_ids)
+
+        outputs = [None] * len(prefixes)
+        miss_ids = OrderedDict()  # prefix -> indices of hypotheses
+        for j, prefix in enumerate(prefixes):
+            prefix = tuple(prefix)
+            if prefix in miss_ids:
+                miss_ids[prefix].append(j)  # identical hypotheses in the same batch
+                continue
+            outputs[j] = self.state_cache.lookup(prefix, self.device)
+            if outputs[j] is None:
+                miss_ids[prefix] = [j]
+        if len(miss_ids) > 0:
+            idx = torch.tensor([ids[0] for ids in miss_ids.values()], dtype=torch.int64, device=ys.device)
+            logits, lmout, new_state = self.decode(ys.index_select(0, idx),
+                                                   select_state(state, idx),
+                                                   mems=mems,
+                                                   cache=select_state(cache, idx),
+                                                   incremental=True)
+            for k, (prefix, ids) in enumerate(miss_ids.items()):
+                output = (lmout[k:k + 1, -1:], select_state(new_state, k), logits[k:k + 1, -1:])
+                self.state_cache.store(prefix, output)
+                for j in ids:
+                    outputs[j] = output
+                self.state_cache.n_hits += len(ids) - 1
+
+        lmout = torch.cat([o[0] for o in outputs], dim=0)
+        new_state = concat_state([o[1] for o in outputs])
+        logits = torch.cat([o[2] for o in outputs], dim=0)
+        return lmout, new_state, self._score_last(logits, candidate_ids)
+
+    def _score_last(self, logits, candidate_ids):
+        """Normalize outputs `[B, 1, *]` at the last step."""
+        if candidate_ids is None:
+            return self.output_log_probs(logits)
+        return self.shortlist_log_probs(logits[:, 0], candidate_ids).unsqueeze(1)
+
     def plot_attention(self):
         # raise NotImplementedError
         pass
+
+
+def select_state(state, idx):
+    """Select LM states of hypotheses.
+
+    Args:
+        state: dict (RNNLM, batch in dim 1) or list (TransformerLM/TransformerXL/GatedConvLM, batch in dim 0)
+        idx (LongTensor or int): indices of hypotheses
+    Returns:
+        state: LM states of the selected hypotheses
+
+    """
+    if state is None:
+        return None
+    if isinstance(idx, int):
+        idx = torch.tensor([idx], dtype=torch.int64)
+    if isinstance(state, dict):
+        return {k: v.index_select(1, idx.to(v.device)) if v is not None else None
+                for k, v in state.items()}
+    return [v.index_select(0, idx.to(v.device)) if v is not None else None for v in state]
+
+
+def concat_state(states):
+    """Concatenate LM states of hypotheses.
+
+    Args:
+        states (list): LM states of each hypothesis
+    Returns:
+        state: LM states of all hypotheses
+
+    """
+    if states[0] is None:
+        return None
+    if isinstance(states[0], dict):
+        return {k: torch.cat([s[k] for s in states], dim=1) if states[0][k] is not None else None
+                for k in states[0].keys()}
+    return [torch.cat([s[lth] for s in states], dim=0) if states[0][lth] is not None else None
+            for lth in range(len(states[0]))]
+
+
+class _TrieNode(object):
+    __slots__ = ('parent', 'token', 'children', 'value')
+
+    def __init__(self, parent, token):
+        self.parent = parent
+        self.token = token
+        self.children = {}
+        self.value = None
+
+
+class LMStateCache(object):
+    """Cache of LM outputs and states organized as a token-prefix trie.
+
+    Hypotheses sharing the same token prefix (within a beam, across decoding
+    passes, or across utterances) are scored by the LM only once. Entries are
+    evicted in the least recently used order, and stored on `device`
+    (e.g., CPU to save GPU memory) to be moved back to the LM device on lookup.
+
+    NOTE: LM outputs must be a function of the token prefix only, i.e., this
+    cannot be used with LM state carry over or TransformerXL memory.
+
+    Args:
+        max_entries (int): maximum number of cached prefixes
+        device (str): device to store cached tensors. None means the LM device.
+        flops_per_token (int): FLOPs for the LM to process a single token
+
+    """
+
+    def __init__(self, max_entries, device=None, flops_per_token=0):
+        self.max_entries = max_entries
+        self.device = device
+        self.flops_per_token = flops_per_token
+        self.root = _TrieNode(None, None)
+        self.lru = OrderedDict()  # `id(node)` -> node
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def __len__(self):
+        return len(self.lru)
+
+    @property
+    def hit_rate(self):
+        n_lookups = self.n_hits + self.n_misses
+        return self.n_hits / n_lookups if n_lookups > 0 else 0.
+
+    @property
+    def saved_flops(self):
+        return self.n_hits * self.flops_per_token
+
+    def _find(self, prefix):
+        node = self.root
+        for token in prefix:
+            node = node.children.get(token)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, prefix, device=None):
+        """Look up LM outputs and states for a token prefix.
+
+        Args:
+            prefix (list): token sequence
+            device (torch.device): device to move cached tensors to
+        Returns:
+            value (tuple): cached (lmout, state, log_probs) or None
+
+        """
+        node = self._find(prefix)
+        if node is None or node.value is None:
+            self.n_misses += 1
+            return None
+        self.n_hits += 1
+        self.lru.move_to_end(id(node))
+        return _to_device(node.value, device) if self.device is not None else node.value
+
+    def store(self, prefix, value):
+        """Store LM outputs and states for a token prefix.
+
+        Args:
+            prefix (list): token sequence
+            value (tuple): (lmout, state, log_probs)
+
+        """
+        node = self.root
+        for token in prefix:
+            child = node.children.get(token)
+            if child is None:
+                child = _TrieNode(node, token)
+                node.children[token] = child
+            node = child
+        node.value = _to_device(value, self.device) if self.device is not None else value
+        self.lru[id(node)] = node
+        self.lru.move_to_end(id(node))
+
+        # Evict the least recently used entries
+        while len(self.lru) > self.max_entries:
+            _, evicted = self.lru.popitem(last=False)
+            evicted.value = None
+            self._prune(evicted)
+
+    def _prune(self, node):
+        """Remove empty leaves toward the root."""
+        while node.parent is not None and node.value is None and len(node.children) == 0:
+            del node.parent.children[node.token]
+            node = node.parent
+
+
+def _to_device(value, device):
+    if value is None:
+        return None
+    if isinstance(value, torch.Tensor):
+        return value.to(device)
+    if isinstance(value, dict):
+        return {k: _to_device(v, device) for k, v in value.items()}
+    return type(value)(_to_device(v, device) for v in value)
@@ -0,0 +1,223 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""N-gram language model loaded from an ARPA file."""
+
+import codecs
+import gzip
+import logging
+import math
+import numpy as np
+import torch
+
+from neural_sp.models.lm.lm_base import LMBase
+
+logger = logging.getLogger(__name__)
+
+LOG_10 = math.log(10)
+
+
+def is_arpa(path):
+    return isinstance(path, str) and (path.endswith('.arpa') or path.endswith('.arpa.gz'))
+
+
+class NgramLM(LMBase):
+    """N-gram language model with backoff, stored in a trie of flat arrays.
+
+    The k-gram entries are sorted by (parent (k-1)-gram, token index).
+    Children of the i-th (k-1)-gram are found in
+    words[k][offsets[k - 1][i]:offsets[k - 1][i + 1]] by binary search.
+    Scores are natural-log probabilities. N-grams containing tokens
+    missing in the dictionary are discarded.
+
+    Args:
+        arpa_path (str): path to the ARPA file (*.arpa or *.arpa.gz)
+        dict_path (str): path to the dictionary of the ASR model
+        unk (str): <unk> token
+
+    """
+
+    def __init__(self, arpa_path, dict_path, unk='<unk>'):
+
+        super(LMBase, self).__init__()
+        logger.info(self.__class__.__name__)
+
+        self.eos = 2
+        self.pad = 3
+        # NOTE: reserved in advance
+        self._device = torch.device('cpu')
+        self.adaptive_softmax = None
+
+        token2idx = {}
+        with codecs.open(dict_path, 'r', 'utf-8') as f:
+            for line in f:
+                if line.strip() == '':
+                    continue
+                token, idx = line.strip().split(' ')
+                token2idx[token] = int(idx)
+        self.vocab = max(token2idx.values()) + 1
+        self.unk = token2idx.get(unk, 1)
+        self.bos = self.vocab  # <s> only appears in contexts
+        token2idx['<s>'] = self.bos
+        token2idx['</s>'] = self.eos
+
+        self.words, self.logps, self.bows, self.offsets = [], [], [], []
+        self.load_arpa(arpa_path, token2idx)
+        self.n_order = len(self.words)
+
+        # Unigram distribution over the vocabulary (and <s>)
+        unk_id = np.searchsorted(self.words[0], self.unk)
+        unk_logp = self.logps[0][unk_id] if self.words[0][unk_id] == self.unk else -99 * LOG_10
+        self.unigram = np.full(self.vocab + 1, unk_logp, dtype=np.float32)
+        self.unigram[self.words[0]] = self.logps[0]
+        self.unigram[self.bos] = -99 * LOG_10
+
+        logger.info('%d-gram LM: %s' % (self.n_order, ', '.join(str(len(w)) for w in self.words)))
+        logger.info('Memory: %.2f MB' % (self.nbytes / 1024 ** 2))
+
+        # for cache
+        self.cache_theta = 0.2  # smoothing parameter
+        self.cache_lambda = 0.2  # cache weight
+        self.reset_cache()
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for arrays in [self.words, self.logps, self.bows, self.offsets]
+                   for a in arrays)
+
+    def load_arpa(self, arpa_path, token2idx):
+        """Load an ARPA file into flat arrays."""
+        ngrams = []  # list of (parent index, token index, log-prob, backoff weight)
+        index_prev, index = None, {}
+        f = gzip.open(arpa_path, 'rt', encoding='utf-8') if arpa_path.endswith('.gz') \
+            else codecs.open(arpa_path, 'r', 'utf-8')
+        with f:
+            order = 0
+            n_skipped = 0
+            for line in f:
+                line = line.strip()
+                if line == '' or line.startswith('ngram '):
+                    continue
+                if line == '\\data\\':
+                    continue
+                if line.startswith('\\') and line.endswith('-grams:'):
+                    if order > 0:
+                        self._add_order(ngrams, index_prev, index)
+                    order = int(line[1:].split('-')[0])
+                    ngrams = []
+                    index_prev, index = index, {}
+                    continue
+                if line == '\\end\\':
+                    break
+                fields = line.split()
+                ids = tuple(token2idx.get(w, -1) for w in fields[1:order + 1])
+                parent = index_prev.get(ids[:-1], -1) if order > 1 else 0
+                if -1 in ids or parent < 0:
+                    n_skipped += 1
+                    continue
+                bow = float(fields[order + 1]) if len(fields) > order + 1 else 0.
+                index[ids] = len(ngrams)
+                ngrams.append((parent, ids[-1], float(fields[0]), bow))
+            if order > 0:
+                self._add_order(ngrams, index_prev, index)
+        logger.info('Skipped %d n-grams with OOV tokens' % n_skipped)
+
+    def _add_order(self, ngrams, index_prev, index):
+        parents = np.array([x[0] for x in ngrams], dtype=np.int64)
+        words = np.array([x[1] for x in ngrams], dtype=np.int32)
+        order = np.lexsort((words, parents))
+        # re-index entries of the current order after sorting
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        for k, v in index.items():
+            index[k] = rank[v]
+
+        self.words.append(words[order])
+        self.logps.append(np.array([x[2] for x in ngrams], dtype=np.float32)[order] * LOG_10)
+        self.bows.append(np.array([x[3] for x in ngrams], dtype=np.float32)[order] * LOG_10)
+        if len(self.words) > 1:
+            n_parents = len(self.words[-2])
+            self.offsets.append(np.searchsorted(parents[order], np.arange(n_parents + 1)).astype(np.int64))
+
+    def find(self, context):
+        """Find a node for a token sequence.
+
+        Args:
+            context (list): token indices
+        Returns:
+            node (int): index in the len(context)-th order arrays or -1
+
+        """
+        lo, hi = 0, len(self.words[0])
+        node = -1
+        for k, w in enumerate(context):
+            if k > 0:
+                lo, hi = self.offsets[k - 1][node], self.offsets[k - 1][node + 1]
+            node = lo + np.searchsorted(self.words[k][lo:hi], w)
+            if node >= hi or self.words[k][node] != w:
+                return -1
+        return node
+
+    def score(self, history):
+        """Compute log-probabilities of all tokens following history with backoff.
+
+        Args:
+            history (list): preceding token indices
+        Returns:
+            log_probs (np.ndarray): `[vocab]`
+
+        """
+        history = history[max(0, len(history) - self.n_order + 1):]
+        history = [self.bos if y == self.eos else y for y in history]
+        log_probs = self.unigram.copy()
+        for k in range(1, len(history) + 1):
+            node = self.find(history[-k:])
+            if node < 0:
+                break  # longer contexts do not exist either
+            log_probs += self.bows[k - 1][node]
+            lo, hi = self.offsets[k - 1][node], self.offsets[k - 1][node + 1]
+            log_probs[self.words[k][lo:hi]] = self.logps[k][lo:hi]
+        return log_probs[:self.vocab]
+
+    def decode(self, ys, state=None, mems=None, cache=None, incremental=False):
+        """Compute log-probabilities for each position.
+
+        Args:
+            ys (LongTensor): `[B, L]`
+            state (list): length `1`, which contains preceding tokens `[B, n_order - 1]` (-1 is padding)
+            mems: not used
+            cache: not used
+            incremental (bool): not used
+        Returns:
+            logits (FloatTensor): `[B, L, vocab]` (normalized)
+            lmout (FloatTensor): `[B, L, 0]`
+            new_state (list): length `1`
+
+        """
+        bs, ymax = ys.size()
+        ys_np = ys.cpu().numpy()
+        if state is None:
+            hist = np.full((bs, 0), -1, dtype=np.int64)
+        else:
+            hist = state[0].cpu().numpy()
+        log_probs = np.zeros((bs, ymax, self.vocab), dtype=np.float32)
+        for b in range(bs):
+            history = [y for y in hist[b].tolist() if y >= 0]
+            for t in range(ymax):
+                history.append(ys_np[b, t])
+                log_probs[b, t] = self.score(history)
+
+        context = np.concatenate([hist, ys_np], axis=1)
+        context = context[:, max(0, context.shape[1] - self.n_order + 1):]
+        new_state = [torch.from_numpy(context).to(ys.device)]
+        logits = torch.from_numpy(log_probs).to(ys.device)
+        return logits, logits.new_zeros(bs, ymax, 0), new_state
+
+    def output_log_probs(self, logits):
+        return logits  # already normalized
+
+    def shortlist_log_probs(self, logits, candidate_ids):
+        return logits.gather(1, candidate_ids)
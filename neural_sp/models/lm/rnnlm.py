@@ -47,9 +47,7 @@ class RNNLM(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_cache()
 
         self.embed = nn.Embedding(self.vocab, args.emb_dim, padding_idx=self.pad)
         self.dropout_embed = nn.Dropout(p=args.dropout_in)
@@ -166,6 +164,9 @@ class RNNLM(LMBase):
 
         """
         bs, ymax = ys.size()
+        if incremental and ymax == 1 and not self.training:
+            return self.decode_step(ys, state)
+
         ys_emb = self.dropout_embed(self.embed(ys.long()))
 
         if state is None:
@@ -221,6 +222,80 @@ class RNNLM(LMBase):
 
         return logits, ys_emb, new_state
 
+    def decode_step(self, ys, state):
+        """Decode one token for inference.
+
+        RNN cells are called directly with the weights of each layer
+        (see step_weights()), so flatten_parameters() and dropout are skipped
+        and new states are written to preallocated tensors.
+
+        Args:
+            ys (LongTensor): `[B, 1]`
+            state (dict):
+                hxs (FloatTensor): `[n_layers, B, n_units]`
+                cxs (FloatTensor): `[n_layers, B, n_units]`
+        Returns:
+            logits (FloatTensor): `[B, 1, vocab]`
+            ys_emb (FloatTensor): `[B, 1, n_units]` (for cache)
+            new_state (dict):
+                hxs (FloatTensor): `[n_layers, B, n_units]`
+                cxs (FloatTensor): `[n_layers, B, n_units]`
+
+        """
+        bs = ys.size(0)
+        ys_emb = self.embed(ys[:, 0].long())
+
+        if state is None:
+            state = self.zero_state(bs)
+        new_state = {'hxs': torch.empty_like(state['hxs']), 'cxs': None}
+        if self.rnn_type == 'lstm':
+            new_state['cxs'] = torch.empty_like(state['cxs'])
+
+        # for ASR decoder pre-training
+        if self.n_units_cv > 0:
+            ys_emb = torch.cat([ys_emb, ys_emb.new_zeros(bs, self.n_units_cv)], dim=-1)
+
+        residual = None
+        for lth, (weights, proj) in enumerate(self.step_weights()):
+            if self.rnn_type == 'lstm':
+                h, c = torch.lstm_cell(ys_emb, (state['hxs'][lth], state['cxs'][lth]), *weights)
+                new_state['cxs'][lth] = c
+            else:
+                h = torch.gru_cell(ys_emb, state['hxs'][lth], *weights)
+            new_state['hxs'][lth] = h
+            ys_emb = h if proj is None else torch.tanh(proj(h))
+
+            # Residual connection
+            if self.residual and lth > 0:
+                ys_emb = ys_emb + residual
+            residual = ys_emb
+
+        if self.glu is not None:
+            ys_emb = self.glu(ys_emb) + ys_emb if self.residual else self.glu(ys_emb)
+
+        ys_emb = ys_emb.unsqueeze(1)
+        if self.adaptive_softmax is None:
+            if self.output_proj is not None:
+                ys_emb = self.output_proj(ys_emb)
+            logits = self.output(ys_emb)
+        else:
+            logits = ys_emb
+
+        return logits, ys_emb, new_state
+
+    def step_weights(self):
+        """Collect RNN weights and projection layers of all layers for decode_step().
+
+        The list is rebuilt only when parameters are replaced (e.g., moved to another device).
+
+        """
+        if getattr(self, '_step_weights', None) is None or \
+                self._step_weights[0][0][0] is not self.rnn[0].weight_ih_l0:
+            self._step_weights = [((rnn.weight_ih_l0, rnn.weight_hh_l0, rnn.bias_ih_l0, rnn.bias_hh_l0),
+                                   self.proj[lth] if self.n_projs > 0 else None)
+                                  for lth, rnn in enumerate(self.rnn)]
+        return self._step_weights
+
     def zero_state(self, batch_size):
         """Initialize hidden state.
 
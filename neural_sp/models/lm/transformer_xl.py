@@ -54,6 +54,8 @@ class TransformerXL(LMBase):
         if args.recog_mem_len > 0:
             self.mem_len = args.recog_mem_len
         self.zero_center_offset = args.zero_center_offset
+        # maximum number of cached keys and values per layer during ASR decoding (0: unlimited)
+        self.kv_cache_len = getattr(args, 'recog_kv_cache_len', 0)
 
         self.vocab = args.vocab
         self.eos = 2
@@ -63,9 +65,7 @@ class TransformerXL(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_cache()
 
         # positional embedding
         self.pos_emb = XLPositionalEmbedding(self.d_model, args.dropout_in)
@@ -199,17 +199,19 @@ class TransformerXL(LMBase):
             ys (LongTensor): `[B, L]`
             state (list): dummy interfance for RNNLM
             mems (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen, d_model]`
-            cache (list): length `L`, each of which contains a FloatTensor `[B, L-1, d_model]`
+            cache (list): length `n_layers`, each of which contains a FloatTensor
+                `[B, mlen+L-1, d_model * 2]` (projected keys and values of the memory and `ys[:, :-1]`)
             incremental (bool): ASR decoding mode
         Returns:
-            logits (FloatTensor): `[B, L, vocab]`
-            out (FloatTensor): `[B, L, d_model]`
-            new_cache (list): length `n_layers`, each of which contains a FloatTensor `[B, L, d_model]`
+            logits (FloatTensor): `[B, L, vocab]` (`[B, 1, vocab]` if cache is given)
+            out (FloatTensor): `[B, L, d_model]` (`[B, 1, d_model]` if cache is given)
+            new_mems (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen, d_model]`
+                (new_cache of decode_incremental() if incremental)
 
         """
         # for ASR decoding
-        if cache is None:
-            cache = [None] * self.n_layers  # 1-th to L-th layer
+        if incremental:
+            return self.decode_incremental(ys, mems, cache)
 
         if mems is None:
             mems = self.init_memory()
@@ -218,8 +220,6 @@ class TransformerXL(LMBase):
             mlen = mems[0].size(1)
 
         bs, ylen = ys.size()[:2]
-        if incremental and cache[0] is not None:
-            ylen = cache[0].size(1) + 1
 
         # Create the self-attention mask
         causal_mask = ys.new_ones(ylen, ylen + mlen).byte()
@@ -229,17 +229,11 @@ class TransformerXL(LMBase):
         out = self.dropout_emb(self.embed(ys.long()) * self.scale)
         pos_embs = self.pos_emb(ys, mlen=mlen, zero_center_offset=self.zero_center_offset)
 
-        new_mems = [None] * self.n_layers
-        new_cache = [None] * self.n_layers
         hidden_states = [out]
         for lth, (mem, layer) in enumerate(zip(mems, self.layers)):
-            if incremental and mlen > 0 and mem.size(0) != bs:
-                mem = mem.repeat([bs, 1, 1])
-            out = layer(out, causal_mask, cache=cache[lth],
-                        pos_embs=pos_embs, memory=mem, u_bias=self.u_bias, v_bias=self.v_bias)
-            if incremental:
-                new_cache[lth] = out
-            elif lth < self.n_layers - 1:
+            out = layer(out, causal_mask, pos_embs=pos_embs, memory=mem,
+                        u_bias=self.u_bias, v_bias=self.v_bias)
+            if lth < self.n_layers - 1:
                 hidden_states.append(out)
                 # NOTE: outputs from the last layer is not used for memory
             if not self.training and layer.yy_aws is not None:
@@ -250,13 +244,67 @@ class TransformerXL(LMBase):
         else:
             logits = out
 
-        if incremental:
-            # NOTE: do not update memory here during ASR decoding
-            return logits, out, new_cache
+        # Update memory
+        new_mems = self.update_memory(mems, hidden_states)
+        return logits, out, new_mems
+
+    def decode_incremental(self, ys, mems=None, cache=None):
+        """Incremental decoding with cached keys and values.
+
+        If cache is given, only the last token is fed to the network and
+        keys and values of the memory and the previous tokens are reused.
+
+        Args:
+            ys (LongTensor): `[B, L]`
+            mems (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen, d_model]`
+            cache (list): length `n_layers`, each of which contains a FloatTensor
+                `[B, mlen+L-1, d_model * 2]` (projected keys and values of the memory and `ys[:, :-1]`)
+        Returns:
+            logits (FloatTensor): `[B, qlen, vocab]`
+            out (FloatTensor): `[B, qlen, d_model]`
+            new_cache (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen+L, d_model * 2]`
+
+        """
+        if mems is None:
+            mems = self.init_memory()
+            mlen = 0
         else:
-            # Update memory
-            new_mems = self.update_memory(mems, hidden_states)
-            return logits, out, new_mems
+            mlen = mems[0].size(1)
+
+        bs, ylen = ys.size()[:2]
+        if cache is None:
+            cache = [None] * self.n_layers
+            # Create the self-attention mask
+            causal_mask = ys.new_ones(ylen, ylen + mlen).byte()
+            causal_mask = torch.tril(causal_mask, diagonal=0 + mlen, out=causal_mask).unsqueeze(0)
+            causal_mask = causal_mask.repeat([bs, 1, 1])  # `[B, L, L+mlen]`
+            klen = mlen + ylen
+        else:
+            causal_mask = None  # attend to all cached steps
+            klen = cache[0].size(1) + 1
+
+        # NOTE: relative positions for the last query are not affected by _rel_shift
+        pos_embs = self.pos_emb(ys, mlen=mlen, zero_center_offset=self.zero_center_offset)[-klen:]
+        if cache[0] is not None:
+            ys = ys[:, -1:]
+        out = self.dropout_emb(self.embed(ys.long()) * self.scale)
+
+        new_cache = [None] * self.n_layers
+        for lth, (mem, layer) in enumerate(zip(mems, self.layers)):
+            if mlen > 0 and mem.size(0) != bs:
+                mem = mem.repeat([bs, 1, 1])
+            out, new_cache[lth] = layer.forward_kv(out, causal_mask, cache=cache[lth],
+                                                   pos_embs=pos_embs, memory=mem,
+                                                   u_bias=self.u_bias, v_bias=self.v_bias)
+            if self.kv_cache_len > 0:
+                new_cache[lth] = new_cache[lth][:, -self.kv_cache_len:]
+        out = self.norm_out(out)
+        if self.adaptive_softmax is None:
+            logits = self.output(out)
+        else:
+            logits = out
+
+        return logits, out, new_cache
 
     def plot_attention(self, n_cols=4):
         """Plot attention for each head in all layers."""
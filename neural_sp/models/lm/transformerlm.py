@@ -48,6 +48,8 @@ class TransformerLM(LMBase):
         self.mem_len = args.mem_len
         if args.recog_mem_len > 0:
             self.mem_len = args.recog_mem_len
+        # maximum number of cached keys and values per layer during ASR decoding (0: unlimited)
+        self.kv_cache_len = getattr(args, 'recog_kv_cache_len', 0)
 
         self.vocab = args.vocab
         self.eos = 2
@@ -57,9 +59,7 @@ class TransformerLM(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_cache()
 
         self.embed = nn.Embedding(self.vocab, self.d_model, padding_idx=self.pad)
         self.pos_enc = PositionalEncoding(self.d_model, args.dropout_in, args.transformer_pe_type,
@@ -191,15 +191,19 @@ class TransformerLM(LMBase):
             ys (LongTensor): `[B, L]`
             state (list): dummy interfance for RNNLM
             mems (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen, d_model]`
-            cache (list): length `L`, each of which contains a FloatTensor `[B, L-1, d_model]`
+            cache (list): length `n_layers`, each of which contains a FloatTensor
+                `[B, L-1, d_model * 2]` (projected keys and values of `ys[:, :-1]`)
             incremental (bool): ASR decoding mode
         Returns:
-            logits (FloatTensor): `[B, L, vocab]`
-            out (FloatTensor): `[B, L, d_model]`
-            new_cache (list): length `n_layers`, each of which contains a FloatTensor `[B, L, d_model]`
+            logits (FloatTensor): `[B, L, vocab]` (`[B, 1, vocab]` if cache is given)
+            out (FloatTensor): `[B, L, d_model]` (`[B, 1, d_model]` if cache is given)
+            new_cache (list): length `n_layers`, each of which contains a FloatTensor `[B, L, d_model * 2]`
 
         """
         # for ASR decoding
+        if incremental and '1dconv' not in self.pos_enc.pe_type:
+            return self.decode_incremental(ys, cache)
+
         if cache is None:
             cache = [None] * self.n_layers  # 1-th to L-th layer
 
@@ -244,6 +248,48 @@ class TransformerLM(LMBase):
         else:
             return logits, out, mems
 
+    def decode_incremental(self, ys, cache=None):
+        """Incremental decoding with cached keys and values.
+
+        If cache is given, only the last token is fed to the network and
+        keys and values of the previous tokens are reused.
+
+        Args:
+            ys (LongTensor): `[B, L]`
+            cache (list): length `n_layers`, each of which contains a FloatTensor
+                `[B, L-1, d_model * 2]` (projected keys and values of `ys[:, :-1]`)
+        Returns:
+            logits (FloatTensor): `[B, qlen, vocab]`
+            out (FloatTensor): `[B, qlen, d_model]`
+            new_cache (list): length `n_layers`, each of which contains a FloatTensor `[B, L, d_model * 2]`
+
+        """
+        bs, ylen = ys.size()[:2]
+        if cache is None:
+            cache = [None] * self.n_layers
+            # Create the self-attention mask
+            causal_mask = ys.new_ones(ylen, ylen).byte()
+            causal_mask = torch.tril(causal_mask, diagonal=0, out=causal_mask).unsqueeze(0)
+            causal_mask = causal_mask.repeat([bs, 1, 1])
+        else:
+            ys = ys[:, -1:]
+            causal_mask = None  # attend to all cached steps
+
+        out = self.pos_enc(self.embed(ys.long()), offset=ylen - ys.size(1))
+
+        new_cache = [None] * self.n_layers
+        for lth, layer in enumerate(self.layers):
+            out, new_cache[lth] = layer.forward_kv(out, causal_mask, cache=cache[lth])
+            if self.kv_cache_len > 0:
+                new_cache[lth] = new_cache[lth][:, -self.kv_cache_len:]
+        out = self.norm_out(out)
+        if self.adaptive_softmax is None:
+            logits = self.output(out)
+        else:
+            logits = out
+
+        return logits, out, new_cache
+
     def plot_attention(self, n_cols=4):
         """Plot attention for each head in all layers."""
         from matplotlib import pyplot as plt
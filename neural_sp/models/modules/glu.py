@@ -7,6 +7,7 @@
 """Gated Linear Units (GLU) block."""
 
 from collections import OrderedDict
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -53,6 +54,7 @@ class ConvGLUBlock(nn.Module):
                           kernel_size=(1, 1)), name='weight', dim=0)
             self.dropout_residual = nn.Dropout(p=dropout)
 
+        self.kernel_size = kernel_size
         self.pad_left = nn.ConstantPad2d((0, 0, kernel_size - 1, 0), 0)
 
         layers = OrderedDict()
@@ -63,7 +65,7 @@ class ConvGLUBlock(nn.Module):
                           kernel_size=(kernel_size, 1)), name='weight', dim=0)
             # TODO(hirofumi0810): padding?
             layers['dropout'] = nn.Dropout(p=dropout)
-            layers['glu'] = nn.GLU()
+            layers['glu'] = nn.GLU(dim=1)
 
         elif bottlececk_dim > 0:
             layers['conv_in'] = nn.utils.weight_norm(
@@ -73,15 +75,16 @@ class ConvGLUBlock(nn.Module):
             layers['dropout_in'] = nn.Dropout(p=dropout)
             layers['conv_bottleneck'] = nn.utils.weight_norm(
                 nn.Conv2d(in_channels=bottlececk_dim,
-                          out_channels=bottlececk_dim,
+                          out_channels=bottlececk_dim * 2,
                           kernel_size=(kernel_size, 1)), name='weight', dim=0)
             layers['dropout'] = nn.Dropout(p=dropout)
-            layers['glu'] = nn.GLU()
+            layers['glu'] = nn.GLU(dim=1)
             layers['conv_out'] = nn.utils.weight_norm(
                 nn.Conv2d(in_channels=bottlececk_dim,
                           out_channels=out_ch * 2,
                           kernel_size=(1, 1)), name='weight', dim=0)
             layers['dropout_out'] = nn.Dropout(p=dropout)
+            layers['glu_out'] = nn.GLU(dim=1)
 
         self.layers = nn.Sequential(layers)
 
@@ -101,3 +104,29 @@ class ConvGLUBlock(nn.Module):
         xs = self.layers(xs)  # `[B, out_ch * 2, T ,1]`
         xs = xs + residual
         return xs
+
+    def forward_incremental(self, xs, cache=None):
+        """Forward pass for incremental decoding.
+
+        Inputs of the last (kernel_size - 1) steps are cached so that each call
+        only processes the new steps instead of the whole prefix.
+
+        Args:
+            xs (FloatTensor): `[B, in_ch, T, feat_dim]`
+            cache (FloatTensor): `[B, in_ch, kernel_size - 1, feat_dim]`
+        Returns:
+            out (FloatTensor): `[B, out_ch, T, feat_dim]`
+            new_cache (FloatTensor): `[B, in_ch, kernel_size - 1, feat_dim]`
+
+        """
+        residual = xs
+        if self.conv_residual is not None:
+            residual = self.dropout_residual(self.conv_residual(residual))
+        if cache is None:
+            xs = self.pad_left(xs)  # `[B, in_ch, T+kernel-1, 1]`
+        else:
+            xs = torch.cat([cache, xs], dim=2)  # `[B, in_ch, T+kernel-1, 1]`
+        new_cache = xs[:, :, xs.size(2) - (self.kernel_size - 1):]
+        xs = self.layers(xs)  # `[B, out_ch, T, 1]`
+        xs = xs + residual
+        return xs, new_cache
@@ -153,3 +153,47 @@ class MultiheadAttentionMechanism(nn.Module):
         aw = aw.permute(0, 3, 1, 2)  # `[B, H, qlen, klen]`
 
         return cv, aw, None, None
+
+    def project_kv(self, key):
+        """Project keys and values.
+
+        Args:
+            key (FloatTensor): `[B, klen, kdim]`
+        Returns:
+            kv (FloatTensor): `[B, klen, adim * 2]`
+
+        """
+        return torch.cat([self.w_key(key), self.w_value(key)], dim=-1)
+
+    def forward_kv(self, kv, query, mask):
+        """Forward pass with projected keys and values for incremental decoding.
+
+        Args:
+            kv (FloatTensor): `[B, klen, adim * 2]`, projected keys and values
+            query (FloatTensor): `[B, qlen, qdim]`
+            mask (ByteTensor): `[B, qlen, klen]`
+        Returns:
+            cv (FloatTensor): `[B, qlen, vdim]`
+            aw (FloatTensor): `[B, H, qlen, klen]`
+
+        """
+        assert self.atype == 'scaled_dot'
+        bs = query.size(0)
+        kv = kv.view(bs, -1, 2, self.n_heads, self.d_k)
+        key = kv[:, :, 0]  # `[B, klen, H, d_k]`
+        value = kv[:, :, 1]  # `[B, klen, H, d_k]`
+        query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
+
+        e = torch.einsum("bihd,bjhd->bijh", (query, key)) / self.scale  # `[B, qlen, klen, H]`
+        if mask is not None:
+            NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
+            e = e.masked_fill_(mask.unsqueeze(3) == 0, NEG_INF)  # `[B, qlen, klen, H]`
+        aw = torch.softmax(e, dim=2)
+        aw = self.dropout_attn(aw)
+
+        cv = torch.einsum("bijh,bjhd->bihd", (aw, value))  # `[B, qlen, H, d_k]`
+        cv = cv.contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
+        cv = self.w_out(cv)
+        aw = aw.permute(0, 3, 1, 2)  # `[B, H, qlen, klen]`
+
+        return cv, aw
@@ -69,11 +69,12 @@ class PositionalEncoding(nn.Module):
 
         logger.info('Positional encoding: %s' % pe_type)
 
-    def forward(self, xs, scale=True):
+    def forward(self, xs, scale=True, offset=0):
         """Forward pass.
 
         Args:
             xs (FloatTensor): `[B, T, d_model]`
+            offset (int): position of the first step (for incremental decoding)
         Returns:
             xs (FloatTensor): `[B, T, d_model]`
 
@@ -86,7 +87,7 @@ class PositionalEncoding(nn.Module):
             xs = self.dropout(xs)
             return xs
         elif self.pe_type == 'add':
-            xs = xs + self.pe[:, :xs.size(1)]
+            xs = xs + self.pe[:, offset:offset + xs.size(1)]
             xs = self.dropout(xs)
         elif '1dconv' in self.pe_type:
             xs = self.pe(xs)
@@ -105,6 +105,17 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
                       .view_as(xs))
         return xs_shifted.view(qlen, klen, bs, n_heads).permute(2, 0, 1, 3)
 
+    def project_kv(self, key):
+        """Project keys and values.
+
+        Args:
+            key (FloatTensor): `[B, klen, kdim]`
+        Returns:
+            kv (FloatTensor): `[B, klen, adim * 2]`
+
+        """
+        return torch.cat([self.w_key(key), self.w_value(key)], dim=-1)
+
     def forward(self, key, query, pos_embs, mask, u_bias=None, v_bias=None):
         """Forward pass.
 
@@ -119,18 +130,38 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
             aw (FloatTensor): `[B, H, qlen, mlen+qlen]`
 
         """
-        bs, qlen = query.size()[:2]
-        mlen = key.size(1) - qlen
+        qlen = query.size(1)
         # NOTE: cat already includes memory, i.e., klen=mlen+qlen
+        return self.forward_kv(self.project_kv(key), key[:, -qlen:], pos_embs, mask, u_bias, v_bias)
+
+    def forward_kv(self, kv, query, pos_embs, mask, u_bias=None, v_bias=None):
+        """Forward pass with projected keys and values.
+
+        Args:
+            kv (FloatTensor): `[B, mlen+qlen, adim * 2]`, projected keys and values
+                (including those of the previous steps during incremental decoding)
+            query (FloatTensor): `[B, qlen, qdim]`
+            mask (ByteTensor): `[B, qlen, mlen+qlen]`
+            pos_embs (LongTensor): `[mlen+qlen, 1, d_model]`
+            u_bias (nn.Parameter): `[H, d_k]`
+            v_bias (nn.Parameter): `[H, d_k]`
+        Returns:
+            cv (FloatTensor): `[B, qlen, vdim]`
+            aw (FloatTensor): `[B, H, qlen, mlen+qlen]`
+
+        """
+        bs, qlen = query.size()[:2]
+        mlen = kv.size(1) - qlen
 
         if mask is not None:
             mask = mask.unsqueeze(3).repeat([1, 1, 1, self.n_heads])
             assert mask.size() == (bs, qlen, mlen + qlen, self.n_heads), \
                 (mask.size(), (bs, qlen, mlen + qlen, self.n_heads))
 
-        k = self.w_key(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, mlen+qlen, H, d_k]`
-        v = self.w_value(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, mlen+qlen, H, d_k]`
-        q = self.w_query(key[:, -qlen:]).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
+        kv = kv.view(bs, -1, 2, self.n_heads, self.d_k)
+        k = kv[:, :, 0]  # `[B, mlen+qlen, H, d_k]`
+        v = kv[:, :, 1]  # `[B, mlen+qlen, H, d_k]`
+        q = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
 
         if self.xl_like:
             _pos_embs = self.w_pos(pos_embs)
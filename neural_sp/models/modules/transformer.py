@@ -259,6 +259,51 @@ class TransformerDecoderBlock(nn.Module):
 
         return out
 
+    def forward_kv(self, ys, yy_mask, cache=None, pos_embs=None, memory=None,
+                   u_bias=None, v_bias=None):
+        """Incremental forward pass with cached keys and values of self-attention.
+
+        This is used for language models only (no source-target attention).
+
+        Args:
+            ys (FloatTensor): `[B, qlen, d_model]`, inputs of the new steps
+            yy_mask (ByteTensor): `[B, qlen, klen]`. None means attending to all keys.
+            cache (FloatTensor): `[B, klen-qlen, d_model * 2]`, projected keys and values of the previous steps
+            pos_embs (LongTensor): `[klen, 1, d_model]`
+            memory (FloatTensor): `[B, mlen, d_model]`, used only when cache is None
+            u_bias (FloatTensor): global parameter for TransformerXL
+            v_bias (FloatTensor): global parameter for TransformerXL
+        Returns:
+            out (FloatTensor): `[B, qlen, d_model]`
+            new_cache (FloatTensor): `[B, klen, d_model * 2]`
+
+        """
+        assert not self.src_tgt_attention and not self.lm_fusion
+        self.reset_visualization()
+
+        residual = ys
+        ys = self.norm1(ys)
+        if cache is None and memory is not None and memory.dim() > 1:
+            cache = self.self_attn.project_kv(self.norm1(memory))
+        new_cache = self.self_attn.project_kv(ys)
+        if cache is not None:
+            new_cache = torch.cat([cache, new_cache], dim=1)
+
+        # self-attention
+        if self.memory_transformer:
+            out, self._yy_aws = self.self_attn.forward_kv(new_cache, ys, pos_embs, yy_mask, u_bias, v_bias)
+        else:
+            out, self._yy_aws = self.self_attn.forward_kv(new_cache, ys, yy_mask)
+        out = self.dropout(out) + residual
+
+        # position-wise feed-forward
+        residual = out
+        out = self.norm3(out)
+        out = self.feed_forward(out)
+        out = self.dropout(out) + residual
+
+        return out, new_cache
+
 
 class SyncBidirTransformerDecoderBlock(nn.Module):
     """A single layer of the synchronous bidirectional Transformer decoder.
@@ -15,6 +15,7 @@
 import torch
 # import torch.nn as nn
 
+from neural_sp.models.lm.lm_base import concat_state
 from neural_sp.models.torch_utils import tensor2np
 
 
@@ -67,12 +68,24 @@ class BeamSearch(object):
     def add_lm_score(self, after_topk=True):
         raise NotImplementedError
 
-    def update_rnnlm_state_batch(self, lm, hyps, y):
+    def update_lm_state_batch(self, lm, hyps, y, candidate_ids=None):
+        """Batchfy LM states of all hypotheses and feed the next inputs.
+
+        Args:
+            lm: RNNLM/TransformerLM/TransformerXL/GatedConvLM/NgramLM
+            hyps (list): hypotheses, each of which has the LM state in 'lmstate'
+            y (LongTensor): `[B, 1]` (`[B, L]`, the whole prefixes, for TransformerLM/TransformerXL)
+            candidate_ids (LongTensor): `[B, K]`, tokens to be scored
+        Returns:
+            lmout (FloatTensor): `[B, 1, n_units]`
+            lmstate: LM states of all hypotheses (split by select_state())
+            scores_lm (FloatTensor): `[B, 1, vocab]` (`[B, 1, K]` if candidate_ids is given)
+
+        """
         lmout, lmstate, scores_lm = None, None, None
         if lm is not None:
-            if hyps[0]['lmstate'] is not None:
-                lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
-                lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
-                lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
-            lmout, lmstate, scores_lm = lm.predict(y, lmstate)
+            lmstate = concat_state([beam['lmstate'] for beam in hyps])
+            # NOTE: states of TransformerLM/TransformerXL are passed as cache
+            lmout, lmstate, scores_lm = lm.cached_predict(y, lmstate, [beam['hyp'] for beam in hyps],
+                                                          cache=lmstate, candidate_ids=candidate_ids)
         return lmout, lmstate, scores_lm
@@ -289,14 +289,15 @@ class CTC(DecoderBase):
 
                     # Update LM states for shallow fusion
                     if lm is not None:
-                        _, lmstate, lm_log_probs = lm.predict(
-                            eouts.new_zeros(1, 1).fill_(hyp[-1]), beam[i_beam]['lmstate'])
+                        _, lmstate, lm_log_probs = lm.cached_predict(
+                            eouts.new_zeros(1, 1).fill_(hyp[-1]), beam[i_beam]['lmstate'], [hyp],
+                            candidate_ids=topk_ids)
                     else:
                         lmstate = None
 
                     # case 2. hyp is extended
                     new_p_b = LOG_0
-                    for c in tensor2np(topk_ids)[0]:
+                    for k, c in enumerate(tensor2np(topk_ids)[0]):
                         p_t = log_probs[b, t, c].item()
 
                         if c == self.blank:
@@ -316,7 +317,7 @@ class CTC(DecoderBase):
                         score_ctc = np.logaddexp(new_p_b, new_p_nb)
                         score_lp = (len(hyp[1:]) + 1) * lp_weight
                         if lm_weight > 0 and lm is not None:
-                            local_score_lm = lm_log_probs[0, 0, c].item() * lm_weight
+                            local_score_lm = lm_log_probs[0, 0, k].item() * lm_weight
                             score_lm += local_score_lm
                         new_beam.append({'hyp': hyp + [c],
                                          'score': score_ctc + score_lm + score_lp,
@@ -7,19 +7,47 @@
 """Forward-backward attention decoding."""
 
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
+def _attention_peaks(aws):
+    """Compute the encoder index attended most at each output position.
+
+    Args:
+        aws (list): A list of length `[N]`, which contains arrays whose first
+            dimension is the output position `[L, ..., T, 1]`
+    Returns:
+        peaks (list): A list of length `[N]`, which contains arrays of size `[L]`
+
+    """
+    return [np.asarray(aw).argmax(-2).reshape(len(aw)) for aw in aws]
+
+
+def _pad(arrays, pad_value, dtype):
+    """Pad a list of 1d arrays to `[N, max_len]`."""
+    padded = np.full((len(arrays), max(len(a) for a in arrays)), pad_value, dtype=dtype)
+    for n, a in enumerate(arrays):
+        padded[n, :len(a)] = a
+    return padded
+
+
 def fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
                       nbest_hyps_bwd, aws_bwd, scores_bwd,
                       eos, gnmt_decoding, lp_weight, idx2token, refs_id, flip=False):
     """Decoding with the forward and backward attention-based decoders.
 
+    Forward and backward hypotheses are merged at a position where both
+    decoders emit the same token while attending to the same encoder region.
+    Attention peaks are computed once per hypothesis, and all pairs of
+    (forward position, backward position) for all pairs of hypotheses are
+    compared and scored by broadcasting.
+
     Args:
         nbest_hyps_fwd (list): A list of length `[B]`, which contains list of n hypotheses
-        aws_fwd (list): A list of length `[B]`, which contains arrays of size `[L, T]`
-        scores_fwd (list):
+        aws_fwd (list): A list of length `[B]`, which contains arrays of size `[L, T, 1]`
+        scores_fwd (list): A list of length `[B]`, which contains cumulative log-probabilities `[L]`
         nbest_hyps_bwd (list):
         aws_bwd (list):
         scores_bwd (list):
@@ -30,6 +58,7 @@ def fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
         refs_id ():
         flip (bool): flip the encoder indices
     Returns:
+        best_hyps (list): A list of length `[B]`, which contains the best merged hypothesis
 
     """
     bs = len(nbest_hyps_fwd)
@@ -67,41 +96,71 @@ def fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
                 # <eos> only
                 logger.info(nbest_hyps_bwd[b][n])
 
-        for n_f in range(nbest):
-            for n_b in range(nbest):
-                for i_f in range(len(aws_fwd[b][n_f]) - 1):
-                    for i_b in range(len(aws_bwd[b][n_b]) - 1):
-                        if flip:
-                            # the encoder is not shared between forward and backward decoders
-                            t_prev = max_time - aws_bwd[b][n_b][i_b + 1].argmax(-2)
-                            t_curr = aws_fwd[b][n_f][i_f].argmax(-2)
-                            t_next = max_time - aws_bwd[b][n_b][i_b - 1].argmax(-2)
-                        else:
-                            t_prev = aws_bwd[b][n_b][i_b + 1].argmax(-2)
-                            t_curr = aws_fwd[b][n_f][i_f].argmax(-2)
-                            t_next = aws_bwd[b][n_b][i_b - 1].argmax(-2)
-
-                        # the same token at the same time
-                        if t_curr >= t_prev and t_curr <= t_next and nbest_hyps_fwd[b][n_f][i_f] == nbest_hyps_bwd[b][n_b][i_b]:
-                            new_hyp = nbest_hyps_fwd[b][n_f][:i_f + 1].tolist() + \
-                                nbest_hyps_bwd[b][n_b][i_b + 1:].tolist()
-                            score_curr_fwd = scores_fwd[b][n_f][i_f] - scores_fwd[b][n_f][i_f - 1]
-                            score_curr_bwd = scores_bwd[b][n_b][i_b] - scores_bwd[b][n_b][i_b + 1]
-                            score_curr = max(score_curr_fwd, score_curr_bwd)
-                            new_score = scores_fwd[b][n_f][i_f - 1] + scores_bwd[b][n_b][i_b + 1] + score_curr
-                            merged.append({'hyp': new_hyp, 'score': new_score})
-
-                            logger.info('time matching')
-                            if refs_id is not None:
-                                logger.info('Ref: %s' % idx2token(refs_id[b]))
-                            logger.info('hyp (fwd): %s' % idx2token(nbest_hyps_fwd[b][n_f]))
-                            logger.info('hyp (bwd): %s' % idx2token(nbest_hyps_bwd[b][n_b]))
-                            logger.info('hyp (fwd-bwd): %s' % idx2token(new_hyp))
-                            logger.info('log prob (fwd): %.3f' % scores_fwd[b][n_f][-1])
-                            logger.info('log prob (bwd): %.3f' % scores_bwd[b][n_b][0])
-                            logger.info('log prob (fwd-bwd): %.3f' % new_score)
-
-        merged = sorted(merged, key=lambda x: x['score'], reverse=True)
-        best_hyps.append(merged[0]['hyp'])
+        best = None
+        if len(merged) > 0:
+            # NOTE: the first one wins among ties as in stable sorting
+            best = max(merged, key=lambda x: x['score'])
+
+        # Merge candidates: position i_f < Lf - 1 and i_b < Lb - 1
+        n_valid_f = [max(len(aw) - 1, 0) for aw in aws_fwd[b]]
+        n_valid_b = [max(len(aw) - 1, 0) for aw in aws_bwd[b]]
+        if max(n_valid_f) > 0 and max(n_valid_b) > 0:
+            peaks_f = _attention_peaks(aws_fwd[b])
+            peaks_b = _attention_peaks(aws_bwd[b])
+            sf = [np.asarray(scores_fwd[b][n]) for n in range(nbest)]
+            sb = [np.asarray(scores_bwd[b][n]) for n in range(nbest)]
+            dtype = np.result_type(*(sf + sb))
+            # NOTE: index -1 wraps around to the last element
+            pos_f = [np.arange(n_pos) for n_pos in n_valid_f]
+            pos_b = [np.arange(n_pos) for n_pos in n_valid_b]
+
+            # `[N, Lf]`
+            t_curr = _pad([peaks_f[n][pos_f[n]] for n in range(nbest)], 0, np.int64)
+            y_f = _pad([np.asarray(nbest_hyps_fwd[b][n])[pos_f[n]] for n in range(nbest)], -1, np.int64)
+            s_f = _pad([sf[n][pos_f[n]] for n in range(nbest)], 0, dtype)
+            s_f_prev = _pad([sf[n][(pos_f[n] - 1) % len(sf[n])] for n in range(nbest)], 0, dtype)
+            mask_f = _pad([np.ones(n_pos, dtype=bool) for n_pos in n_valid_f], False, bool)
+            # `[N, Lb]`
+            t_prev = _pad([peaks_b[n][pos_b[n] + 1] for n in range(nbest)], 0, np.int64)
+            t_next = _pad([peaks_b[n][pos_b[n] - 1] for n in range(nbest)], 0, np.int64)
+            y_b = _pad([np.asarray(nbest_hyps_bwd[b][n])[pos_b[n]] for n in range(nbest)], -1, np.int64)
+            s_b = _pad([sb[n][pos_b[n]] for n in range(nbest)], 0, dtype)
+            s_b_next = _pad([sb[n][pos_b[n] + 1] for n in range(nbest)], 0, dtype)
+            mask_b = _pad([np.ones(n_pos, dtype=bool) for n_pos in n_valid_b], False, bool)
+            if flip:
+                # the encoder is not shared between forward and backward decoders
+                t_prev, t_next = max_time - t_prev, max_time - t_next
+
+            # `[N_f, N_b, Lf, Lb]`
+            t_curr = t_curr[:, None, :, None]
+            match = (t_curr >= t_prev[None, :, None, :]) & (t_curr <= t_next[None, :, None, :]) & \
+                (y_f[:, None, :, None] == y_b[None, :, None, :])
+            match &= mask_f[:, None, :, None] & mask_b[None, :, None, :]
+
+            if match.any():
+                score_curr = np.maximum((s_f - s_f_prev)[:, None, :, None],
+                                        (s_b - s_b_next)[None, :, None, :])
+                new_scores = s_f_prev[:, None, :, None] + s_b_next[None, :, None, :] + score_curr
+                new_scores = np.where(match, new_scores, -np.inf)
+                # NOTE: np.argmax returns the first occurrence in the same order as nested loops
+                n_f, n_b, i_f, i_b = np.unravel_index(new_scores.argmax(), new_scores.shape)
+                new_score = new_scores[n_f, n_b, i_f, i_b]
+                logger.info('time matching: %d candidates' % match.sum())
+
+                if best is None or new_score > best['score']:
+                    new_hyp = nbest_hyps_fwd[b][n_f][:i_f + 1].tolist() + \
+                        nbest_hyps_bwd[b][n_b][i_b + 1:].tolist()
+                    best = {'hyp': new_hyp, 'score': new_score}
+
+                    if refs_id is not None:
+                        logger.info('Ref: %s' % idx2token(refs_id[b]))
+                    logger.info('hyp (fwd): %s' % idx2token(nbest_hyps_fwd[b][n_f]))
+                    logger.info('hyp (bwd): %s' % idx2token(nbest_hyps_bwd[b][n_b]))
+                    logger.info('hyp (fwd-bwd): %s' % idx2token(new_hyp))
+                    logger.info('log prob (fwd): %.3f' % scores_fwd[b][n_f][-1])
+                    logger.info('log prob (bwd): %.3f' % scores_bwd[b][n_b][0])
+                    logger.info('log prob (fwd-bwd): %.3f' % new_score)
+
+        best_hyps.append(best['hyp'])
 
     return best_hyps
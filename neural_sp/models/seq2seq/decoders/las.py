@@ -19,6 +19,8 @@ from neural_sp.models.criterion import cross_entropy_lsm
 from neural_sp.models.criterion import distillation
 from neural_sp.models.criterion import MBR
 # from neural_sp.models.criterion import minimum_bayes_risk
+from neural_sp.models.lm.gated_convlm import GatedConvLM
+from neural_sp.models.lm.ngram import NgramLM
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.lm.transformerlm import TransformerLM
 from neural_sp.models.lm.transformer_xl import TransformerXL
@@ -1051,6 +1053,7 @@ class RNNDecoder(DecoderBase):
             assert lm_weight_second_bwd > 0
             lm_second_bwd.eval()
         trfm_lm = isinstance(lm, TransformerLM) or isinstance(lm, TransformerXL)
+        conv_lm = isinstance(lm, GatedConvLM) or isinstance(lm, NgramLM)
 
         if ctc_log_probs is not None:
             assert ctc_weight > 0
@@ -1159,13 +1162,13 @@ class RNNDecoder(DecoderBase):
                             elif i > 0:
                                 lmstate = [torch.cat([beam['lmstate'][lth] for beam in hyps], dim=0)
                                            for lth in range(lm.n_layers)]
+                        elif conv_lm:
+                            # only the last (kernel_size - 1) inputs (or n-gram contexts) are cached
+                            lmstate = [torch.cat([beam['lmstate'][lth] for beam in hyps], dim=0)
+                                       for lth in range(len(hyps[0]['lmstate']))]
 
                     if self.lm is not None:  # cold/deep fusion
                         lmout, lmstate, scores_lm = self.lm.predict(y_lm, lmstate)
-                    elif lm is not None:  # shallow fusion
-                        lmout, lmstate, scores_lm = lm.predict(y_lm, lmstate,
-                                                               mems=self.lmmemory,
-                                                               cache=lmstate if cache_states else None)
 
                 # for the main model
                 dstates, cv, aw, attn_v, _, _ = self.decode_step(
@@ -1197,17 +1200,29 @@ class RNNDecoder(DecoderBase):
                 # Ensemble
                 scores_att = torch.log(probs / n_models)
 
+                # Top-K selection for all hypotheses
+                total_scores_att = scores_att.new_tensor([beam['score_att'] for beam in hyps]).unsqueeze(1) + scores_att
+                total_scores_topk_all, topk_ids_all = torch.topk(
+                    total_scores_att * (1 - ctc_weight), k=beam_width, dim=1, largest=True, sorted=True)
+
+                # Shallow fusion: LM scores are normalized only for the top-K candidates
+                shortlist = lm is not None and self.lm is None
+                if shortlist:
+                    lmout, lmstate, scores_lm = lm.cached_predict(y_lm, lmstate, [beam['hyp'] for beam in hyps],
+                                                                  mems=self.lmmemory,
+                                                                  cache=lmstate if cache_states else None,
+                                                                  candidate_ids=topk_ids_all)
+
                 new_hyps = []
                 for j, beam in enumerate(hyps):
-                    # Attention scores
-                    total_scores_att = beam['score_att'] + scores_att[j:j + 1]
-                    total_scores = total_scores_att * (1 - ctc_weight)
-
                     # Add LM score <after> top-K selection
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=1, largest=True, sorted=True)
+                    total_scores_topk = total_scores_topk_all[j:j + 1].clone()
+                    topk_ids = topk_ids_all[j:j + 1]
                     if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
+                        if shortlist:
+                            total_scores_lm = beam['score_lm'] + scores_lm[j, -1]
+                        else:
+                            total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
                         total_scores_topk += total_scores_lm * lm_weight
                     else:
                         total_scores_lm = eouts.new_zeros(beam_width)
@@ -1265,7 +1280,7 @@ class RNNDecoder(DecoderBase):
                             if isinstance(lm, RNNLM) or isinstance(self.lm, RNNLM):
                                 new_lmstate = {'hxs': lmstate['hxs'][:, j:j + 1],
                                                'cxs': lmstate['cxs'][:, j:j + 1]}
-                            elif trfm_lm:
+                            elif trfm_lm or conv_lm:
                                 new_lmstate = [lmstate_l[j:j + 1] for lmstate_l in lmstate]
                             else:
                                 raise ValueError
@@ -1276,7 +1291,7 @@ class RNNDecoder(DecoderBase):
                             {'hyp': beam['hyp'] + [idx],
                              'ys': ys,
                              'score': total_score,
-                             'score_att': total_scores_att[0, idx].item(),
+                             'score_att': total_scores_att[j, idx].item(),
                              'score_cp': cp,
                              'score_ctc': total_scores_ctc[k].item(),
                              'score_lm': total_scores_lm[k].item(),
@@ -1375,7 +1390,11 @@ class RNNDecoder(DecoderBase):
             self.lmstate_final = end_hyps[0]['lmstate']
         elif trfm_lm:
             if isinstance(lm, TransformerXL):
-                self.lmmemory = lm.update_memory(self.lmmemory, end_hyps[0]['lmstate'])
+                # NOTE: lmstate contains keys and values, so re-encode the best hypothesis to update memory
+                ys = end_hyps[0]['ys']
+                if ys[0, -1].item() == self.eos:
+                    ys = ys[:, :-1]
+                _, _, self.lmmemory = lm.decode(ys, mems=self.lmmemory)
                 logging.info('Memory: %d' % self.lmmemory[0].size(1))
             else:
                 ys = end_hyps[0]['ys']
@@ -1485,7 +1504,7 @@ class RNNDecoder(DecoderBase):
             dstates = {'dstate': (hxs, cxs)}
 
             # Update LM states for LM fusion
-            lmout, lmstate, scores_lm = helper.update_rnnlm_state_batch(
+            lmout, lmstate, scores_lm = helper.update_lm_state_batch(
                 self.lm if self.lm is not None else lm, hyps, y)
 
             dstates, cv, aw, attn_v, _, _ = self.decode_step(
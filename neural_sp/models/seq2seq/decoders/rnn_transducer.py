@@ -499,7 +499,17 @@ class RNNTransducer(DecoderBase):
                         lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
                         lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
                         lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
-                    lmout, lmstate, scores_lm = lm.predict(y, lmstate)
+
+                # Top-K selection for all hypotheses
+                total_scores_rnnt = scores_rnnt.new_tensor(
+                    [beam['score_rnnt'] for beam in hyps]).unsqueeze(1) + scores_rnnt
+                total_scores_topk_all, topk_ids_all = torch.topk(
+                    total_scores_rnnt * (1 - ctc_weight), k=beam_width, dim=-1, largest=True, sorted=True)
+
+                if lm is not None:
+                    # LM scores are normalized only for the top-K candidates
+                    lmout, lmstate, scores_lm = lm.cached_predict(y, lmstate, [beam['hyp'] for beam in hyps],
+                                                                  candidate_ids=topk_ids_all)
 
                 new_hyps = []
                 for j, beam in enumerate(hyps):
@@ -507,15 +517,11 @@ class RNNTransducer(DecoderBase):
                     dstate = beam['dstate']
                     lmstate = beam['lmstate']
 
-                    # Attention scores
-                    total_scores_rnnt = beam['score_rnnt'] + scores_rnnt[j:j + 1]
-                    total_scores = total_scores_rnnt * (1 - ctc_weight)
-
                     # Add LM score <after> top-K selection
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=-1, largest=True, sorted=True)
+                    total_scores_topk = total_scores_topk_all[j:j + 1].clone()
+                    topk_ids = topk_ids_all[j:j + 1]
                     if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
+                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1]
                         total_scores_topk += total_scores_lm * lm_weight
                     else:
                         total_scores_lm = eouts.new_zeros(beam_width)
@@ -561,7 +567,7 @@ class RNNTransducer(DecoderBase):
 
                         new_hyps.append({'hyp': hyp_id,
                                          'score': total_scores_topk[0, k].item(),
-                                         'score_rnnt': total_scores_rnnt[0, idx].item(),
+                                         'score_rnnt': total_scores_rnnt[j, idx].item(),
                                          'score_ctc': total_scores_ctc[k].item(),
                                          'score_lm': total_scores_lm[k].item(),
                                          'dout': dout,
@@ -16,7 +16,10 @@ import torch
 import torch.nn as nn
 
 from neural_sp.models.criterion import cross_entropy_lsm
+from neural_sp.models.lm.lm_base import select_state
 from neural_sp.models.lm.rnnlm import RNNLM
+from neural_sp.models.lm.transformerlm import TransformerLM
+from neural_sp.models.lm.transformer_xl import TransformerXL
 from neural_sp.models.modules.initialization import init_like_transformer_xl
 from neural_sp.models.modules.positional_embedding import PositionalEncoding
 from neural_sp.models.modules.positional_embedding import XLPositionalEmbedding
@@ -692,6 +695,7 @@ class TransformerDecoder(DecoderBase):
         if lm_second_bwd is not None:
             assert lm_weight_second_bwd > 0
             lm_second_bwd.eval()
+        trfm_lm = isinstance(lm, TransformerLM) or isinstance(lm, TransformerXL)
 
         if ctc_log_probs is not None:
             assert ctc_weight > 0
@@ -750,10 +754,6 @@ class TransformerDecoder(DecoderBase):
                 else:
                     xy_aws_prev = None
 
-                # Update LM states for shallow fusion
-                y_lm = ys[:, -1:].clone()  # NOTE: this is important
-                _, lmstate, scores_lm = helper.update_rnnlm_state_batch(lm, hyps, y_lm)
-
                 # for the main model
                 causal_mask = eouts.new_ones(i + 1, i + 1).byte()
                 causal_mask = torch.tril(causal_mask, out=causal_mask).unsqueeze(0).repeat([ys.size(0), 1, 1])
@@ -815,21 +815,27 @@ class TransformerDecoder(DecoderBase):
                 # Ensemble
                 scores_att = torch.log(probs / n_models)
 
+                # Top-K selection for all hypotheses
+                total_scores_att = scores_att.new_tensor([beam['score_att'] for beam in hyps]).unsqueeze(1) + scores_att
+                total_scores_topk_all, topk_ids_all = torch.topk(
+                    total_scores_att * (1 - ctc_weight), k=beam_width, dim=1, largest=True, sorted=True)
+
+                # Update LM states for shallow fusion
+                # LM scores are normalized only for the top-K candidates
+                # NOTE: TransformerLM/TransformerXL take the whole prefixes to compute positions
+                y_lm = ys if trfm_lm else ys[:, -1:].clone()  # NOTE: this is important
+                _, lmstate, scores_lm = helper.update_lm_state_batch(lm, hyps, y_lm, candidate_ids=topk_ids_all)
+
                 new_hyps = []
                 for j, beam in enumerate(hyps):
-                    # Attention scores
-                    total_scores_att = beam['score_att'] + scores_att[j:j + 1]
-                    total_scores = total_scores_att * (1 - ctc_weight)
-
-                    # Add LM score <before> top-K selection
+                    # Add LM score <after> top-K selection
+                    total_scores_topk = total_scores_topk_all[j:j + 1].clone()
+                    topk_ids = topk_ids_all[j:j + 1]
                     if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j:j + 1, -1]
-                        total_scores += total_scores_lm * lm_weight
+                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1]
+                        total_scores_topk += total_scores_lm * lm_weight
                     else:
-                        total_scores_lm = eouts.new_zeros(1, self.vocab)
-
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=1, largest=True, sorted=True)
+                        total_scores_lm = eouts.new_zeros(beam_width)
 
                     # Add length penalty
                     if lp_weight > 0:
@@ -885,12 +891,11 @@ class TransformerDecoder(DecoderBase):
                              'ys': torch.cat([beam['ys'], eouts.new_zeros((1, 1), dtype=torch.int64).fill_(idx)], dim=-1),
                              'cache': [new_cache_l[j:j + 1] for new_cache_l in new_cache] if cache_states else cache,
                              'score': total_score,
-                             'score_att': total_scores_att[0, idx].item(),
+                             'score_att': total_scores_att[j, idx].item(),
                              'score_ctc': total_scores_ctc[k].item(),
-                             'score_lm': total_scores_lm[0, idx].item(),
+                             'score_lm': total_scores_lm[k].item(),
                              'aws': new_aws,
-                             'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                         'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                             'lmstate': select_state(lmstate, j),
                              'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
                              'ensmbl_cache': [[new_cache_e_l[j:j + 1] for new_cache_e_l in new_cache_e] for new_cache_e in ensmbl_new_cache] if cache_states else None,
                              'streamable': streamable_global,
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Encoder output cache shared across decoding passes."""
+
+from collections import OrderedDict
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class EncoderOutputCache(object):
+    """Cache of encoder outputs for the current mini-batch.
+
+    The same utterances are often encoded several times during evaluation
+    (ensemble members, forward/backward decoding, OOV resolution with the
+    character-level sub task). Encoder outputs are kept for the current
+    mini-batch and reused by every decoding pass after the first one.
+    Entries are keyed by (model, task), and the whole cache is flushed
+    when a different mini-batch (utterance IDs and lengths) comes in.
+
+    Args:
+        max_bytes (int): maximum memory size of cached encoder outputs
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_hits = 0
+        self.n_misses = 0
+        self.peak_bytes = 0
+        self.reset()
+
+    def reset(self):
+        self.batch_key = None
+        self.cache = OrderedDict()
+        self.n_bytes = 0
+
+    @property
+    def hit_rate(self):
+        n_lookups = self.n_hits + self.n_misses
+        return self.n_hits / n_lookups if n_lookups > 0 else 0.
+
+    @staticmethod
+    def make_batch_key(xs, utt_ids):
+        """Return a key for a mini-batch, or None if it cannot be identified."""
+        if utt_ids is None or len(utt_ids) != len(xs):
+            return None
+        return (tuple(utt_ids), tuple(len(x) for x in xs))
+
+    def lookup(self, xs, utt_ids, model, task):
+        """Look up encoder outputs.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            utt_ids (list): A list of length `[B]`
+            model (nn.Module): model which encoded xs
+            task (str): all/ys*/ys_sub1*/ys_sub2*
+        Returns:
+            eout_dict (dict): cached encoder outputs or None
+
+        """
+        batch_key = self.make_batch_key(xs, utt_ids)
+        if batch_key is None:
+            return None
+        if batch_key != self.batch_key:
+            self.reset()
+            self.batch_key = batch_key
+
+        for key in [(id(model), task.split('.')[0]), (id(model), 'all')]:
+            if key in self.cache:
+                self.n_hits += 1
+                self.cache.move_to_end(key)
+                return self.cache[key][0]
+        self.n_misses += 1
+        return None
+
+    def store(self, xs, utt_ids, model, task, eout_dict):
+        """Store encoder outputs.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            utt_ids (list): A list of length `[B]`
+            model (nn.Module): model which encoded xs
+            task (str): all/ys*/ys_sub1*/ys_sub2*
+            eout_dict (dict): encoder outputs
+
+        """
+        batch_key = self.make_batch_key(xs, utt_ids)
+        if batch_key is None or batch_key != self.batch_key:
+            return
+
+        n_bytes = sum(v.numel() * v.element_size() for eouts in eout_dict.values()
+                      for v in eouts.values() if isinstance(v, torch.Tensor))
+        if n_bytes > self.max_bytes:
+            logger.debug('Skip caching encoder outputs of %d bytes.' % n_bytes)
+            return
+
+        key = (id(model), task.split('.')[0])
+        if key in self.cache:
+            self.n_bytes -= self.cache.pop(key)[1]
+        # Evict the least recently used entries
+        while self.n_bytes + n_bytes > self.max_bytes:
+            _, (_, n_bytes_evicted) = self.cache.popitem(last=False)
+            self.n_bytes -= n_bytes_evicted
+        self.cache[key] = (eout_dict, n_bytes)
+        self.n_bytes += n_bytes
+        self.peak_bytes = max(self.peak_bytes, self.n_bytes)
@@ -140,6 +140,12 @@ class ConformerEncoder(EncoderBase):
         self.aws_dict = {}
         self.data_dict = {}
 
+        # for inference-time layer skipping and early exit
+        self.skip_layer_ids = []
+        self.ctc_probe = None
+        self.early_exit_threshold = 0.
+        self.exit_layer_counts = {}
+
         # Setting for CNNs
         if 'conv' in enc_type:
             assert conv_channels
@@ -380,6 +386,7 @@ class ConformerEncoder(EncoderBase):
             emax = xlens.max().item()
             xs = xs.contiguous().view(bs, -1, xs.size(2))[:, :emax]  # `[B, emax, d_model]`
 
+        eouts_exit, remain_ids = None, None  # for early exit
         if self.latency_controlled:
             # streaming Conformer encoder
             emax = xlens.max().item()
@@ -438,10 +445,11 @@ class ConformerEncoder(EncoderBase):
             xx_mask = make_pad_mask(xlens.to(self.device)).unsqueeze(1).repeat([1, xs.size(1), 1])
 
             for lth, layer in enumerate(self.layers):
-                xs = layer(xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
-                if not self.training:
-                    self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
-                    self.data_dict['elens%d' % lth] = tensor2np(xlens)
+                if not self.skip_layer(lth):
+                    xs = layer(xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
+                    if not self.training:
+                        self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
+                        self.data_dict['elens%d' % lth] = tensor2np(xlens)
 
                 # Pick up outputs in the sub task before the projection layer
                 if lth == self.n_layers_sub1 - 1:
@@ -455,7 +463,8 @@ class ConformerEncoder(EncoderBase):
                         eouts[task]['xs'], eouts[task]['xlens'] = xs_sub2, xlens
                         return eouts
 
-                if self.subsample is not None:
+                # NOTE: no subsampling remains after some utterances exit early
+                if self.subsample is not None and remain_ids is None:
                     xs, xlens = self.subsample[lth](xs, xlens)
                     # Create the self-attention mask
                     xx_mask = make_pad_mask(xlens.to(self.device)).unsqueeze(1).repeat([1, xs.size(1), 1])
@@ -463,11 +472,29 @@ class ConformerEncoder(EncoderBase):
                     clamp_len = clamp_len // self.subsample[lth].subsampling_factor
                     pos_embs = self.pos_emb(xs, clamp_len=clamp_len, zero_center_offset=True)
 
-        xs = self.norm_out(xs)
+                # Early exit based on CTC confidence of the intermediate outputs
+                if self.can_exit_early(lth):
+                    xs_exit = self.norm_out(xs)
+                    if self.bridge is not None:
+                        xs_exit = self.bridge(xs_exit)
+                    eouts_exit, remain_ids, keep = self.exit_confident(
+                        xs_exit, xlens, lth, eouts_exit, remain_ids)
+                    xs, xx_mask = xs[keep], xx_mask[keep]
+                    if len(remain_ids) == 0:
+                        break
+
+        if eouts_exit is None or len(remain_ids) > 0:
+            xs = self.norm_out(xs)
+
+            # Bridge layer
+            if self.bridge is not None:
+                xs = self.bridge(xs)
 
-        # Bridge layer
-        if self.bridge is not None:
-            xs = self.bridge(xs)
+        # Merge outputs of utterances which exited early
+        if eouts_exit is not None:
+            if len(remain_ids) > 0:
+                eouts_exit[remain_ids] = xs
+            xs = eouts_exit
 
         if task in ['all', 'ys']:
             eouts['ys']['xs'], eouts['ys']['xlens'] = xs, xlens
@@ -15,6 +15,7 @@ import torch.nn as nn
 
 from neural_sp.models.modules.initialization import init_with_lecun_normal
 from neural_sp.models.seq2seq.encoders.encoder_base import EncoderBase
+from neural_sp.models.seq2seq.encoders.encoder_base import Identity
 
 logger = logging.getLogger(__name__)
 
@@ -329,6 +330,17 @@ class Conv2dBlock(EncoderBase):
             # calculate subsampling factor
             self._factor *= pooling[0]
 
+    def fold_batch_norm(self):
+        """Fold batch normalization into the preceding convolution for inference."""
+        if not self.batch_norm:
+            return
+        assert not self.training
+        fold_batch_norm(self.conv1, self.batch_norm1)
+        fold_batch_norm(self.conv2, self.batch_norm2)
+        self.batch_norm1 = Identity()
+        self.batch_norm2 = Identity()
+        self.batch_norm = False
+
     def forward(self, xs, xlens, lookback=False, lookahead=False):
         """Forward pass.
 
@@ -407,6 +419,29 @@ class LayerNorm2D(nn.Module):
         return xs
 
 
+def fold_batch_norm(conv, batch_norm):
+    """Fold batch normalization into the preceding convolution in place.
+
+    Args:
+        conv (nn.Conv1d or nn.Conv2d):
+        batch_norm (nn.BatchNorm1d or nn.BatchNorm2d):
+
+    """
+    with torch.no_grad():
+        scale = torch.rsqrt(batch_norm.running_var + batch_norm.eps)
+        if batch_norm.affine:
+            scale = scale * batch_norm.weight
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(batch_norm.running_mean)
+        bias = (bias - batch_norm.running_mean) * scale
+        if batch_norm.affine:
+            bias = bias + batch_norm.bias
+        conv.weight.mul_(scale.view(-1, *([1] * (conv.weight.dim() - 1))))
+        if conv.bias is None:
+            conv.bias = nn.Parameter(bias)
+        else:
+            conv.bias.copy_(bias)
+
+
 def update_lens_1d(seq_lens, layer):
     """Update lenghts (frequency or time).
 
@@ -429,8 +464,12 @@ def update_lens_1d(seq_lens, layer):
 
 def _update_1d(seq_len, layer):
     if type(layer) == nn.MaxPool1d and layer.ceil_mode:
-        return math.ceil(
-            (seq_len + 1 + 2 * layer.padding - (layer.kernel_size - 1) - 1) / layer.stride + 1)
+        padding, kernel_size, stride = layer.padding, layer.kernel_size, layer.stride
+        seq_len_out = math.ceil((seq_len + 2 * padding - (kernel_size - 1) - 1) / stride) + 1
+        # NOTE: the last pooling window must start inside the input or the left padding
+        if (seq_len_out - 1) * stride >= seq_len + padding:
+            seq_len_out -= 1
+        return seq_len_out
     else:
         return math.floor(
             (seq_len + 2 * layer.padding[0] - (layer.kernel_size[0] - 1) - 1) / layer.stride[0] + 1)
@@ -459,8 +498,12 @@ def update_lens_2d(seq_lens, layer, dim=0):
 
 def _update_2d(seq_len, layer, dim):
     if type(layer) == nn.MaxPool2d and layer.ceil_mode:
-        return math.ceil(
-            (seq_len + 1 + 2 * layer.padding[dim] - (layer.kernel_size[dim] - 1) - 1) / layer.stride[dim] + 1)
+        padding, kernel_size, stride = layer.padding[dim], layer.kernel_size[dim], layer.stride[dim]
+        seq_len_out = math.ceil((seq_len + 2 * padding - (kernel_size - 1) - 1) / stride) + 1
+        # NOTE: the last pooling window must start inside the input or the left padding
+        if (seq_len_out - 1) * stride >= seq_len + padding:
+            seq_len_out -= 1
+        return seq_len_out
     else:
         return math.floor(
             (seq_len + 2 * layer.padding[dim] - (layer.kernel_size[dim] - 1) - 1) / layer.stride[dim] + 1)
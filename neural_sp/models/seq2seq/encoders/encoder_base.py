@@ -6,12 +6,16 @@
 
 """Base class for encoders."""
 
+import copy
 import logging
 import os
 import shutil
 import torch
+import torch.nn as nn
+from torch.nn.utils.weight_norm import WeightNorm
 
 from neural_sp.models.base import ModelBase
+from neural_sp.models.torch_utils import make_pad_mask
 
 import matplotlib
 matplotlib.use('Agg')
@@ -41,6 +45,126 @@ class EncoderBase(ModelBase):
     def reset_cache(self):
         raise NotImplementedError
 
+    def freeze_for_inference(self):
+        """Make a frozen copy of the encoder for inference.
+
+        Batch normalization is folded into the preceding convolution,
+        weight normalization is merged into the weights, and dropout is
+        replaced with the identity mapping.
+
+        Returns:
+            encoder (EncoderBase): frozen encoder in the evaluation mode
+
+        """
+        # NOTE: weights computed from weight normalization in the training graph
+        # cannot be deep-copied, so recompute them without gradients
+        with torch.no_grad():
+            for module in self.modules():
+                for hook in module._forward_pre_hooks.values():
+                    if isinstance(hook, WeightNorm):
+                        hook(module, None)
+        encoder = copy.deepcopy(self)
+        encoder.eval()
+        for module in list(encoder.modules()):
+            if hasattr(module, 'fold_batch_norm'):
+                module.fold_batch_norm()
+            if hasattr(module, 'weight_g'):
+                nn.utils.remove_weight_norm(module)
+            for name, child in module.named_children():
+                if isinstance(child, nn.Dropout):
+                    setattr(module, name, Identity())
+        for p in encoder.parameters():
+            p.requires_grad = False
+        logger.info('Freeze %s for inference.' % self.__class__.__name__)
+        return encoder
+
+    def set_layer_skipping(self, skip_layer_ids=None, ctc_probe=None, early_exit_threshold=0.):
+        """Configure inference-time layer skipping and early exit.
+
+        Args:
+            skip_layer_ids (list): indices of layers to be skipped at inference
+            ctc_probe (callable): mapping from encoder outputs `[B, T, enc_units]`
+                to CTC posteriors `[B, T, vocab]`
+            early_exit_threshold (float): each utterance exits after the current layer
+                if the average maximum CTC posterior of its intermediate outputs
+                exceeds this value. Disabled if 0.
+
+        """
+        self.skip_layer_ids = list(skip_layer_ids) if skip_layer_ids is not None else []
+        self.ctc_probe = ctc_probe if early_exit_threshold > 0 else None
+        self.early_exit_threshold = early_exit_threshold
+        self.exit_layer_counts = {}
+        if len(self.skip_layer_ids) > 0:
+            logger.info('Skip layers %s in %s.' % (self.skip_layer_ids, self.__class__.__name__))
+        if self.ctc_probe is not None:
+            logger.info('Early exit in %s (threshold: %.3f).' % (self.__class__.__name__, early_exit_threshold))
+
+    def skip_layer(self, lth):
+        """Return True if the lth layer is skipped at inference."""
+        return not self.training and lth in getattr(self, 'skip_layer_ids', [])
+
+    def can_exit_early(self, lth):
+        """Return True if the layers after the lth layer can be skipped.
+
+        Early exit is allowed only after the outputs for the sub tasks have
+        been computed and when no subsampling remains in the upper layers,
+        so that the output length does not depend on the exit point.
+
+        """
+        if self.training or getattr(self, 'ctc_probe', None) is None:
+            return False
+        if lth >= self.n_layers - 1 or lth < max(self.n_layers_sub1, self.n_layers_sub2) - 1:
+            return False
+        if self.subsample is not None:
+            if any(s.subsampling_factor > 1 for s in self.subsample[lth + 1:]):
+                return False
+        return True
+
+    def is_confident(self, eouts, elens, lth):
+        """Check CTC confidence of intermediate encoder outputs per utterance.
+
+        Args:
+            eouts (FloatTensor): `[B, T, enc_units]`
+            elens (IntTensor): `[B]`
+            lth (int): index of the current layer
+        Returns:
+            confident (BoolTensor): `[B]`, True for utterances confident enough
+
+        """
+        mask = make_pad_mask(elens.to(eouts.device)).float()  # `[B, T]`
+        probs = self.ctc_probe(eouts)[:, :mask.size(1)]  # `[B, T, vocab]`
+        confidence = (probs.max(-1)[0] * mask).sum(1) / mask.sum(1).clamp(min=1)  # `[B]`
+        confident = confidence >= self.early_exit_threshold
+        n_exits = confident.sum().item()
+        if n_exits > 0:
+            self.exit_layer_counts[lth] = self.exit_layer_counts.get(lth, 0) + n_exits
+        return confident
+
+    def exit_confident(self, xs_exit, elens, lth, eouts_exit=None, remain_ids=None):
+        """Let confident utterances exit after the lth layer.
+
+        Outputs of the exited utterances are kept in eouts_exit, and only the
+        remaining utterances are encoded by the upper layers.
+
+        Args:
+            xs_exit (FloatTensor): `[B', T, enc_units]`, outputs of the remaining utterances
+            elens (IntTensor): `[B]`, lengths of all utterances in the mini-batch
+            lth (int): index of the current layer
+            eouts_exit (FloatTensor): `[B, T, enc_units]`, outputs of the exited utterances
+            remain_ids (LongTensor): `[B']`, indices of the remaining utterances in the mini-batch
+        Returns:
+            eouts_exit (FloatTensor): `[B, T, enc_units]`
+            remain_ids (LongTensor): `[B'']`
+            keep (BoolTensor): `[B']`, True for utterances encoded by the upper layers
+
+        """
+        if remain_ids is None:
+            remain_ids = torch.arange(xs_exit.size(0), device=xs_exit.device)
+            eouts_exit = xs_exit.new_zeros(xs_exit.size())
+        confident = self.is_confident(xs_exit, elens[remain_ids.cpu()], lth)
+        eouts_exit[remain_ids[confident]] = xs_exit[confident]
+        return eouts_exit, remain_ids[~confident], ~confident
+
     def turn_on_ceil_mode(self, encoder):
         if isinstance(encoder, torch.nn.Module):
             for name, module in encoder.named_children():
@@ -94,3 +218,10 @@ class EncoderBase(ModelBase):
             if save_path is not None:
                 fig.savefig(os.path.join(save_path, '%s.png' % k), dvi=500)
             plt.close()
+
+
+class Identity(nn.Module):
+    """Identity mapping."""
+
+    def forward(self, xs):
+        return xs
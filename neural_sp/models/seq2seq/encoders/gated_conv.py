@@ -51,7 +51,6 @@ class GatedConvEncoder(EncoderBase):
         layers = OrderedDict()
         for lth in range(len(channels)):
             layers['conv%d' % lth] = ConvGLUBlock(kernel_sizes[lth][0], input_dim, channels[lth],
-                                                  weight_norm=True,
                                                   dropout=0.2)
             input_dim = channels[lth]
 
@@ -61,6 +61,8 @@ class RNNEncoder(EncoderBase):
         param_init (float): model initialization parameter
         chunk_size_left (int): left chunk size for latency-controlled bidirectional encoder
         chunk_size_right (int): right chunk size for latency-controlled bidirectional encoder
+        lc_pack_padded (bool): pack padded sequences in the full-context latency-controlled
+            bidirectional encoder so that the backward RNN does not run over padding
 
     """
 
@@ -71,7 +73,7 @@ class RNNEncoder(EncoderBase):
                  conv_in_channel, conv_channels, conv_kernel_sizes, conv_strides, conv_poolings,
                  conv_batch_norm, conv_layer_norm, conv_bottleneck_dim,
                  bidir_sum_fwd_bwd, task_specific_layer, param_init,
-                 chunk_size_left, chunk_size_right):
+                 chunk_size_left, chunk_size_right, lc_pack_padded=False):
 
         super(RNNEncoder, self).__init__()
 
@@ -104,6 +106,10 @@ class RNNEncoder(EncoderBase):
         if self.lc_bidir:
             assert enc_type not in ['lstm', 'gru', 'conv_lstm', 'conv_gru']
             assert n_layers_sub2 == 0
+        # NOTE: packing is applied only for the full-context (PT) mode
+        self.lc_pack_padded = lc_pack_padded and self.lc_bidir and self.chunk_size_left <= 0
+        # encode all chunks in parallel during offline inference
+        self.lc_parallel_chunks = False
 
         # for hierarchical encoder
         self.n_layers_sub1 = n_layers_sub1
@@ -232,6 +238,8 @@ class RNNEncoder(EncoderBase):
                            help='left chunk size for latency-controlled RNN encoder')
         group.add_argument('--lc_chunk_size_right', type=int, default=0,
                            help='right chunk size for latency-controlled RNN encoder')
+        group.add_argument('--lc_pack_padded', type=strtobool, default=False,
+                           help='pack padded sequences in the full-context latency-controlled RNN encoder')
         return parser
 
     @staticmethod
@@ -286,7 +294,9 @@ class RNNEncoder(EncoderBase):
                  'ys_sub2': {'xs': None, 'xlens': None}}
 
         # Sort by lenghts in the descending order for pack_padded_sequence
-        if not self.lc_bidir:
+        # NOTE: the sorted order is reused across all layers and subsampling stages
+        sort = not self.lc_bidir or self.lc_pack_padded
+        if sort:
             xlens, perm_ids = torch.IntTensor(xlens).sort(0, descending=True)
             xs = xs[perm_ids]
             _, perm_ids_unsort = perm_ids.sort()
@@ -312,6 +322,10 @@ class RNNEncoder(EncoderBase):
             # Flip the layer and time loop
             xs, xlens, xs_sub1 = self._forward_streaming(xs, xlens, streaming)
             xlens_sub1 = xlens.clone()
+            if self.lc_pack_padded:
+                if xs_sub1 is not None:
+                    xs_sub1 = xs_sub1[perm_ids_unsort]
+                xlens_sub1 = xlens_sub1[perm_ids_unsort]
             if task == 'ys_sub1':
                 eouts[task]['xs'], eouts[task]['xlens'] = xs_sub1, xlens_sub1
                 return eouts
@@ -348,7 +362,7 @@ class RNNEncoder(EncoderBase):
             xs = self.bridge(xs)
 
         # Unsort
-        if not self.lc_bidir:
+        if sort:
             xs = xs[perm_ids_unsort]
             xlens = xlens[perm_ids_unsort]
 
@@ -376,12 +390,20 @@ class RNNEncoder(EncoderBase):
             for lth in range(self.n_layers):
                 self.rnn[lth].flatten_parameters()  # for multi-GPUs
                 self.rnn_bwd[lth].flatten_parameters()  # for multi-GPUs
-                # bwd
-                xs_bwd = torch.flip(xs, dims=[1])
-                xs_bwd, _ = self.rnn_bwd[lth](xs_bwd, hx=None)
-                xs_bwd = torch.flip(xs_bwd, dims=[1])
-                # fwd
-                xs_fwd, _ = self.rnn[lth](xs, hx=None)
+                if self.lc_pack_padded:
+                    # bwd
+                    xs_bwd = flip_padded(xs, xlens)
+                    xs_bwd = packed_rnn(xs_bwd, xlens, self.rnn_bwd[lth])
+                    xs_bwd = flip_padded(xs_bwd, xlens)
+                    # fwd
+                    xs_fwd = packed_rnn(xs, xlens, self.rnn[lth])
+                else:
+                    # bwd
+                    xs_bwd = torch.flip(xs, dims=[1])
+                    xs_bwd, _ = self.rnn_bwd[lth](xs_bwd, hx=None)
+                    xs_bwd = torch.flip(xs_bwd, dims=[1])
+                    # fwd
+                    xs_fwd, _ = self.rnn[lth](xs, hx=None)
                 if self.bidir_sum:
                     xs = xs_fwd + xs_bwd
                 else:
@@ -412,6 +434,9 @@ class RNNEncoder(EncoderBase):
             N_l = N_l // self.conv.subsampling_factor
             N_r = N_r // self.conv.subsampling_factor
 
+        if self.lc_parallel_chunks and not streaming and not self.training:
+            return self._forward_chunks_parallel(xs, xlens, N_l, N_r)
+
         bs, xmax, _ = xs.size()
         n_chunks = math.ceil(xmax / N_l)
         if streaming:
@@ -478,6 +503,97 @@ class RNNEncoder(EncoderBase):
 
         return xs, xlens, xs_sub1
 
+    def _forward_chunks_parallel(self, xs, xlens, N_l, N_r):
+        """Offline chunkwise encoding for the latency-controlled bidirectional encoder.
+
+        When the whole utterance is available, the backward RNN (and the forward RNN
+        over the right contexts) of all chunks are independent, so they are encoded
+        at once by stacking chunks along the batch dimension. Only the forward RNN
+        over the current chunks runs sequentially to carry over hidden states.
+        This gives the same outputs as the sequential chunkwise encoding.
+
+        Args:
+            xs (FloatTensor): `[B, T, n_units]`
+            xlens (IntTensor): `[B]`
+            N_l (int): current chunk size
+            N_r (int): right chunk size
+        Returns:
+            xs (FloatTensor): `[B, T, n_units]`
+            xlens (IntTensor): `[B]`
+            xs_sub1 (FloatTensor): `[B, T, n_units]`
+
+        """
+        bs, xmax, _ = xs.size()
+        n_chunks = math.ceil(xmax / N_l)
+        xs_chunks = [xs[:, t:t + (N_l + N_r)] for t in range(0, N_l * n_chunks, N_l)]
+        xs_chunks_sub1 = [None] * n_chunks
+
+        # Group chunks by length (only the last few chunks can be shorter)
+        groups = {}
+        for chunk_idx, xs_chunk in enumerate(xs_chunks):
+            groups.setdefault(xs_chunk.size(1), []).append(chunk_idx)
+
+        _N_l = N_l
+        for lth in range(self.n_layers):
+            self.rnn[lth].flatten_parameters()  # for multi-GPUs
+            self.rnn_bwd[lth].flatten_parameters()  # for multi-GPUs
+
+            # fwd for the current chunks (sequential)
+            xs_chunks_fwd, states = [], []
+            for xs_chunk in xs_chunks:
+                xs_chunk_fwd, self.hx_fwd[lth] = self.rnn[lth](xs_chunk[:, :_N_l],
+                                                               hx=self.hx_fwd[lth])
+                xs_chunks_fwd.append(xs_chunk_fwd)
+                states.append(self.hx_fwd[lth])
+
+            xlens_tmp = xlens
+            for chunk_ids in groups.values():
+                xs_group = torch.cat([xs_chunks[i] for i in chunk_ids], dim=0)  # `[n_chunks*B, L, n_units]`
+                # bwd
+                xs_group_bwd = torch.flip(xs_group, dims=[1])
+                xs_group_bwd, _ = self.rnn_bwd[lth](xs_group_bwd, hx=None)
+                xs_group_bwd = torch.flip(xs_group_bwd, dims=[1])
+                # fwd for the right contexts
+                xs_group_fwd = torch.cat([xs_chunks_fwd[i] for i in chunk_ids], dim=0)
+                if xs_group.size(1) > _N_l:
+                    hx = concat_states([states[i] for i in chunk_ids])
+                    xs_group_fwd2, _ = self.rnn[lth](xs_group[:, _N_l:], hx=hx)
+                    xs_group_fwd = torch.cat([xs_group_fwd, xs_group_fwd2], dim=1)
+                if self.bidir_sum:
+                    xs_group = xs_group_fwd + xs_group_bwd
+                else:
+                    xs_group = torch.cat([xs_group_fwd, xs_group_bwd], dim=-1)
+                xs_group = self.dropout(xs_group)
+
+                # Pick up outputs in the sub task before the projection layer
+                if lth == self.n_layers_sub1 - 1:
+                    xs_group_sub1 = xs_group.clone()
+                    if self.bridge_sub1 is not None:
+                        xs_group_sub1 = self.bridge_sub1(xs_group_sub1)
+                    for i, xs_chunk_sub1 in zip(chunk_ids, xs_group_sub1.split(bs, dim=0)):
+                        xs_chunks_sub1[i] = xs_chunk_sub1
+
+                # Projection layer
+                if self.proj is not None and lth != self.n_layers - 1:
+                    xs_group = torch.tanh(self.proj[lth](xs_group))
+                # Subsampling layer
+                if self.subsample is not None:
+                    xs_group, xlens_tmp = self.subsample[lth](xs_group, xlens)
+
+                for i, xs_chunk in zip(chunk_ids, xs_group.split(bs, dim=0)):
+                    xs_chunks[i] = xs_chunk
+
+            xlens = xlens_tmp
+            if self.subsample is not None:
+                _N_l = _N_l // self.subsample[lth].subsampling_factor
+
+        xs = torch.cat([xs_chunk[:, :_N_l] for xs_chunk in xs_chunks], dim=1)
+        xs_sub1 = None
+        if self.n_layers_sub1 > 0:
+            xs_sub1 = torch.cat([xs_chunk_sub1[:, :_N_l] for xs_chunk_sub1 in xs_chunks_sub1], dim=1)
+
+        return xs, xlens, xs_sub1
+
     def sub_module(self, xs, xlens, perm_ids_unsort, module='sub1'):
         if self.task_specific_layer:
             getattr(self, 'rnn_' + module).flatten_parameters()  # for multi-GPUs
@@ -491,6 +607,56 @@ class RNNEncoder(EncoderBase):
         return xs_sub, xlens_sub
 
 
+def flip_padded(xs, xlens):
+    """Reverse each sequence within its own length while keeping padding at the end.
+
+    Args:
+        xs (FloatTensor): `[B, T, F]`
+        xlens (IntTensor): `[B]` (on CPU)
+    Returns:
+        xs (FloatTensor): `[B, T, F]`
+
+    """
+    bs, xmax, idim = xs.size()
+    xlens = xlens.to(xs.device).long().unsqueeze(1)
+    pos = torch.arange(xmax, device=xs.device).unsqueeze(0).expand(bs, xmax)
+    idx = torch.where(pos < xlens, xlens - 1 - pos, pos)
+    return xs.gather(1, idx.unsqueeze(2).expand(bs, xmax, idim))
+
+
+def packed_rnn(xs, xlens, rnn):
+    """Run a unidirectional RNN over packed sequences sorted in the descending order.
+
+    Args:
+        xs (FloatTensor): `[B, T, F]`
+        xlens (IntTensor): `[B]` (on CPU)
+        rnn (nn.Module): RNN module
+    Returns:
+        xs (FloatTensor): `[B, T, n_units]`
+
+    """
+    xmax = xs.size(1)
+    xs = pack_padded_sequence(xs, xlens.tolist(), batch_first=True)
+    xs, _ = rnn(xs, hx=None)
+    xs = pad_packed_sequence(xs, batch_first=True, total_length=xmax)[0]
+    return xs
+
+
+def concat_states(states):
+    """Concatenate RNN states along the batch dimension.
+
+    Args:
+        states (list): A list of `[n_layers, B, n_units]` for GRU
+            or tuples of them (hidden and cell states) for LSTM
+    Returns:
+        state (FloatTensor or tuple): `[n_layers, B * len(states), n_units]`
+
+    """
+    if isinstance(states[0], tuple):
+        return tuple(torch.cat([s[i] for s in states], dim=1) for i in range(len(states[0])))
+    return torch.cat(states, dim=1)
+
+
 class Padding(nn.Module):
     """Padding variable length of sequences."""
 
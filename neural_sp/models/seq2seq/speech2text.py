@@ -91,6 +91,9 @@ class Speech2Text(ModelBase):
         # for discourse-aware model
         self.utt_id_prev = None
 
+        # encoder output cache shared across decoding passes (set in evaluation)
+        self.eout_cache = None
+
         # Feature extraction
         self.input_noise_std = args.input_noise_std
         self.n_stacks = args.n_stacks
@@ -405,6 +408,27 @@ class Speech2Text(ModelBase):
 
         return eout_dict
 
+    def encode_cached(self, xs, task='all', utt_ids=None):
+        """Encode acoustic features reusing cached encoder outputs of the same mini-batch.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains Tensor of size `[T, input_dim]`
+            task (str): all/ys*/ys_sub1*/ys_sub2*
+            utt_ids (list): A list of length `[B]`
+        Returns:
+            eout_dict (dict):
+
+        """
+        if self.eout_cache is None or self.input_type != 'speech':
+            return self.encode(xs, task)
+
+        eout_dict = self.eout_cache.lookup(xs, utt_ids, self, task)
+        if eout_dict is None:
+            # NOTE: encode all tasks at once so that sub-task decoding can also reuse them
+            eout_dict = self.encode(xs, 'all')
+            self.eout_cache.store(xs, utt_ids, self, 'all', eout_dict)
+        return eout_dict
+
     def get_ctc_probs(self, xs, task='ys', temperature=1, topk=None):
         self.eval()
         with torch.no_grad():
@@ -639,10 +663,7 @@ class Speech2Text(ModelBase):
         self.eval()
         with torch.no_grad():
             # Encode input features
-            if self.input_type == 'speech' and self.mtl_per_batch and 'bwd' in dir:
-                eout_dict = self.encode(xs, task)
-            else:
-                eout_dict = self.encode(xs, task)
+            eout_dict = self.encode_cached(xs, task, utt_ids)
 
             # CTC
             if (self.fwd_weight == 0 and self.bwd_weight == 0) or (self.ctc_weight > 0 and params['recog_ctc_weight'] == 1):
@@ -698,9 +719,9 @@ class Speech2Text(ModelBase):
                     if len(ensemble_models) > 0:
                         for i_e, model in enumerate(ensemble_models):
                             if model.input_type == 'speech' and model.mtl_per_batch and 'bwd' in dir:
-                                enc_outs_e = model.encode(xs, task)
+                                enc_outs_e = model.encode_cached(xs, task, utt_ids)
                             else:
-                                enc_outs_e = model.encode(xs, task)
+                                enc_outs_e = model.encode_cached(xs, task, utt_ids)
                             ensmbl_eouts += [enc_outs_e[task]['xs']]
                             ensmbl_elens += [enc_outs_e[task]['xlens']]
                             ensmbl_decs += [getattr(model, 'dec_' + dir)]
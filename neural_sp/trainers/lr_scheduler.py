@@ -179,7 +179,7 @@ class LRScheduler(object):
                 param_group['lr'] = self.lr
 
     def save_checkpoint(self, model, save_path, remove_old=True, amp=None,
-                        epoch_detail=None):
+                        epoch_detail=None, dataset=None):
         """Save checkpoint.
 
         Args:
@@ -190,6 +190,7 @@ class LRScheduler(object):
                 worse than the top-k ones are deleted
             amp ():
             epoch_detail (float): fine-grained epoch (used for MBR training)
+            dataset (Dataset): training set whose iterator state is saved for resumption
 
         """
         if epoch_detail is None:
@@ -212,6 +213,8 @@ class LRScheduler(object):
         }
         if amp is not None:
             checkpoint['amp_state_dict'] = amp.state_dict()
+        if dataset is not None:
+            checkpoint['dataset_state_dict'] = dataset.state_dict()
         torch.save(checkpoint, model_path)
 
         logger.info("=> Saved checkpoint (epoch:%s): %s" % (str(epoch_detail), model_path))
@@ -0,0 +1,422 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for ASR dataset."""
+
+import importlib
+import kaldiio
+import numpy as np
+import os
+import pickle
+import pytest
+import random
+
+
+VOCAB = 20
+INPUT_DIM = 4
+
+
+def make_corpus(tmp_path, n_utts=60, name='train'):
+    dict_path = str(tmp_path / 'dict.txt')
+    with open(dict_path, 'w') as f:
+        for i in range(1, VOCAB):
+            f.write('w%d %d\n' % (i, i))
+
+    rng = np.random.RandomState(0)
+    feats = {}
+    for i in range(n_utts):
+        feats['spk%d_%06d-%06d' % (i % 3, i * 100, i * 100 + 50)] = rng.randn(
+            rng.randint(40, 300), INPUT_DIM).astype(np.float32)
+    ark_path = str(tmp_path / (name + '.ark'))
+    scp_path = str(tmp_path / (name + '.scp'))
+    kaldiio.save_ark(ark_path, feats, scp=scp_path)
+    with open(scp_path) as f:
+        feat_paths = dict(line.strip().split(None, 1) for line in f)
+
+    tsv_path = str(tmp_path / (name + '.tsv'))
+    with open(tsv_path, 'w') as f:
+        f.write('utt_id\tspeaker\tfeat_path\txlen\txdim\ttext\ttoken_id\tylen\tydim\n')
+        for utt_id in sorted(feats.keys()):
+            ylen = rng.randint(1, 10)
+            ys = rng.randint(4, VOCAB, ylen)
+            f.write('%s\t%s\t%s\t%d\t%d\t%s\t%s\t%d\t%d\n' % (
+                utt_id, utt_id.split('_')[0], feat_paths[utt_id], len(feats[utt_id]), INPUT_DIM,
+                ' '.join('w%d' % y for y in ys), ' '.join(map(str, ys)), ylen, VOCAB))
+    return tsv_path, dict_path
+
+
+def make_dataset(tsv_path, dict_path, **kwargs):
+    module = importlib.import_module('neural_sp.datasets.asr')
+    args = dict(tsv_path=tsv_path, dict_path=dict_path, unit='word',
+                batch_size=8, n_epochs=3, sort_by='input', min_n_frames=40)
+    args.update(kwargs)
+    return module.Dataset(**args)
+
+
+def iterate(dataset, n_epochs=1, batch_size=None):
+    """Return mini-batches and the bookkeeping after each step."""
+    random.seed(1)
+    np.random.seed(1)
+    steps = []
+    for _ in range(n_epochs):
+        while True:
+            batch, is_new_epoch = dataset.next(batch_size)
+            steps.append((batch, is_new_epoch, dataset.epoch, dataset.epoch_detail))
+            if is_new_epoch:
+                break
+    return steps
+
+
+def assert_same_steps(steps, steps_ref):
+    assert len(steps) == len(steps_ref)
+    for (batch, is_new_epoch, epoch, epoch_detail), (batch_ref, is_new_epoch_ref, epoch_ref, epoch_detail_ref) \
+            in zip(steps, steps_ref):
+        assert batch['utt_ids'] == batch_ref['utt_ids']
+        assert batch['ys'] == batch_ref['ys']
+        for x, x_ref in zip(batch['xs'], batch_ref['xs']):
+            assert np.array_equal(x, x_ref)
+        assert is_new_epoch == is_new_epoch_ref
+        assert epoch == epoch_ref
+        assert epoch_detail == epoch_detail_ref
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'shuffle_bucket': True}),
+        ({'dynamic_batching': True}),
+        ({'sort_stop_epoch': 2}),
+        ({'is_test': True, 'batch_size': 5}),
+    ]
+)
+def test_prefetch(tmp_path, args):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    n_epochs = 1 if args.get('is_test', False) else 3
+
+    steps_ref = iterate(make_dataset(tsv_path, dict_path, **args), n_epochs)
+    for n_workers, n_prefetch in [(1, 1), (2, 4)]:
+        dataset = make_dataset(tsv_path, dict_path, n_workers=n_workers, n_prefetch=n_prefetch, **args)
+        steps = iterate(dataset, n_epochs)
+        assert_same_steps(steps, steps_ref)
+        if not args.get('is_test', False):
+            with pytest.raises(StopIteration):
+                dataset.next()
+            assert dataset.executor is None
+
+
+def test_prefetch_reset(tmp_path):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    dataset = make_dataset(tsv_path, dict_path, n_workers=2, is_test=True)
+    steps_ref = iterate(dataset)
+    dataset.next()
+    dataset.reset(batch_size=3)
+    steps = iterate(dataset, batch_size=3)
+    assert sorted(u for s in steps for u in s[0]['utt_ids']) == sorted(u for s in steps_ref for u in s[0]['utt_ids'])
+    assert all(len(s[0]['utt_ids']) <= 3 for s in steps)
+    assert steps[-1][3] == 0
+
+    # Stop background threads in the middle of an epoch
+    dataset.next()
+    dataset.close()
+    assert dataset.executor is None and len(dataset.queue) == 0
+    dataset.reset()
+    assert sorted(u for s in iterate(dataset) for u in s[0]['utt_ids']) == \
+        sorted(u for s in steps_ref for u in s[0]['utt_ids'])
+
+
+@pytest.mark.parametrize("dtype", ['float16', 'float32'])
+def test_feature_store(tmp_path, dtype):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    module = importlib.import_module('neural_sp.datasets.feature_store')
+
+    # Replace Kaldi ark paths with feature store paths
+    scp_path = str(tmp_path / 'train.scp')
+    out_scp_path = module.make_feature_store(scp_path, str(tmp_path / 'store'), dtype,
+                                             shard_size=20000)
+    with open(out_scp_path) as f:
+        utt2featpath = dict(line.strip().split(' ', 1) for line in f)
+    assert len(set(p.split(':')[0] for p in utt2featpath.values())) > 1
+    lines = open(tsv_path).readlines()
+    tsv_path_store = str(tmp_path / 'store.tsv')
+    with open(tsv_path_store, 'w') as f:
+        f.write(lines[0])
+        for line in lines[1:]:
+            fields = line.split('\t')
+            fields[2] = utt2featpath[fields[0]]
+            f.write('\t'.join(fields))
+
+    steps_ref = iterate(make_dataset(tsv_path, dict_path))
+    steps = iterate(make_dataset(tsv_path_store, dict_path))
+    assert len(steps) == len(steps_ref)
+    for (batch, _, _, _), (batch_ref, _, _, _) in zip(steps, steps_ref):
+        assert batch['utt_ids'] == batch_ref['utt_ids']
+        for x, x_ref in zip(batch['xs'], batch_ref['xs']):
+            assert x.dtype == np.dtype(dtype)
+            assert np.array_equal(x, x_ref.astype(dtype))
+
+
+@pytest.mark.parametrize("feat_cache_mb", [1, 0.01])
+@pytest.mark.parametrize("n_workers", [0, 2])
+def test_feature_cache(tmp_path, feat_cache_mb, n_workers):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    max_bytes = int(feat_cache_mb * 1024 ** 2)
+
+    steps_ref = iterate(make_dataset(tsv_path, dict_path, is_test=True), n_epochs=2)
+    dataset = make_dataset(tsv_path, dict_path, is_test=True, feat_cache_bytes=max_bytes,
+                           n_workers=n_workers)
+    steps = iterate(dataset, n_epochs=2)
+    assert len(steps) == len(steps_ref)
+    for (batch, _, _, _), (batch_ref, _, _, _) in zip(steps, steps_ref):
+        assert batch['utt_ids'] == batch_ref['utt_ids']
+        for x, x_ref in zip(batch['xs'], batch_ref['xs']):
+            assert x.dtype == np.float16
+            assert np.array_equal(x, x_ref.astype(np.float16))
+
+    cache = dataset.feat_cache
+    if n_workers == 0:
+        assert cache.n_hits + cache.n_misses == 2 * len(dataset)
+    else:
+        # mini-batches are prefetched ahead
+        assert cache.n_hits + cache.n_misses >= 2 * len(dataset)
+    assert cache.n_bytes == sum(x.nbytes for x in cache.cache.values())
+    assert cache.peak_bytes <= max_bytes
+    if max_bytes >= dataset.n_frames * INPUT_DIM * 2:
+        assert len(cache) == len(dataset)
+        if n_workers == 0:
+            assert cache.hit_rate == 0.5
+    else:
+        # the least recently used utterances are evicted
+        assert len(cache) < len(dataset)
+        if n_workers == 0:
+            assert list(cache.cache.keys()) == [u for s in steps for u in s[0]['utt_ids']][-len(cache):]
+
+
+@pytest.mark.parametrize(
+    "max_frames_per_batch, max_tokens_per_batch",
+    [
+        (1000, 0),
+        (1000, 30),
+        (100, 0),
+    ]
+)
+def test_frame_budget_batching(tmp_path, max_frames_per_batch, max_tokens_per_batch):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    dataset = make_dataset(tsv_path, dict_path,
+                           max_frames_per_batch=max_frames_per_batch,
+                           max_tokens_per_batch=max_tokens_per_batch)
+    for epoch in range(2):
+        steps = iterate(dataset)
+        utt_ids = [u for s in steps for u in s[0]['utt_ids']]
+        assert sorted(utt_ids) == sorted(dataset.df['utt_id'])
+        assert steps[-1][2] == epoch + 1
+        for batch, _, _, _ in steps:
+            n_utts = len(batch['utt_ids'])
+            if n_utts > 1:
+                assert max(batch['xlens']) * n_utts <= max_frames_per_batch
+                if max_tokens_per_batch > 0:
+                    assert max(len(y) for y in batch['ys']) * n_utts <= max_tokens_per_batch
+
+
+def test_label_cache(tmp_path):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    module = importlib.import_module('neural_sp.datasets.label_cache')
+    cache_path = tsv_path + module.CACHE_SUFFIX
+
+    steps_ref = iterate(make_dataset(tsv_path, dict_path))
+    for _ in range(2):
+        # the 2nd dataset loads token IDs from the cache file
+        steps = iterate(make_dataset(tsv_path, dict_path, cache_labels=True))
+        assert os.path.isfile(cache_path)
+        assert_same_steps(steps, steps_ref)
+
+    # the cache file is rebuilt when the tsv file is modified
+    lines = open(tsv_path).readlines()
+    with open(tsv_path, 'w') as f:
+        f.writelines(lines[:1] + [line.replace('\t5 ', '\t6 ') for line in lines[1:]])
+    steps_ref = iterate(make_dataset(tsv_path, dict_path))
+    steps = iterate(make_dataset(tsv_path, dict_path, cache_labels=True))
+    assert_same_steps(steps, steps_ref)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'n_buffer_batches': 1, 'shuffle_shards': False}),
+        ({'sort_by': 'shuffle'}),
+        ({'dynamic_batching': True, 'short2long': True}),
+    ]
+)
+def test_streaming(tmp_path, args):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    module = importlib.import_module('neural_sp.datasets.asr')
+
+    # Split into shards
+    lines = open(tsv_path).readlines()
+    n_shards = 3
+    for i in range(n_shards):
+        with open(str(tmp_path / ('train.%d.tsv' % i)), 'w') as f:
+            f.writelines(lines[:1] + lines[1 + i::n_shards])
+
+    dataset_ref = make_dataset(tsv_path, dict_path)
+    dataset = module.StreamingDataset(tsv_path=str(tmp_path / 'train.*.tsv'), dict_path=dict_path,
+                                      unit='word', batch_size=8, n_epochs=2, min_n_frames=40, **args)
+    assert dataset.input_dim == INPUT_DIM
+    assert dataset.vocab == dataset_ref.vocab
+    assert len(dataset) == len(dataset_ref)
+
+    utt_ids_ref = sorted(dataset_ref.df['utt_id'])
+    ys_ref = dict(zip(dataset_ref.df['utt_id'], dataset_ref.df['token_id']))
+    for epoch in range(2):
+        steps = iterate(dataset)
+        utt_ids = [u for s in steps for u in s[0]['utt_ids']]
+        assert sorted(utt_ids) == utt_ids_ref
+        assert steps[-1][2] == epoch + 1
+        assert all(0 < s[3] <= 1 for s in steps[:-1])
+        for batch, _, _, _ in steps:
+            assert len(batch['utt_ids']) <= 8
+            for utt_id, x, xlen, ys in zip(batch['utt_ids'], batch['xs'], batch['xlens'], batch['ys']):
+                assert len(x) == xlen
+                assert ' '.join(map(str, ys)) == ys_ref[utt_id]
+    with pytest.raises(StopIteration):
+        dataset.next()
+
+
+def test_discourse_bucketing(tmp_path):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    dataset = make_dataset(tsv_path, dict_path, discourse_aware=True, corpus='swbd', batch_size=2)
+    df = dataset.df
+
+    for _, x in df.iterrows():
+        session = df[df['session'] == x['session']].sort_values(by='onset')
+        assert x['prev_utt'] == session[session['onset'] < x['onset']]['line_no'].tolist()
+        assert x['n_prev_utt'] == len(x['prev_utt'])
+        assert x['n_utt_in_session'] == len(session)
+
+    # utterances in each session are fed in order of onset
+    steps = iterate(dataset)
+    utt_ids = [u for s in steps for u in s[0]['utt_ids']]
+    assert sorted(utt_ids) == sorted(df['utt_id'])
+    onsets = {}
+    for batch, _, _, _ in steps:
+        for session, utt_id in zip(batch['sessions'], batch['utt_ids']):
+            onset = df.set_index('utt_id').loc[utt_id, 'onset']
+            assert onset > onsets.get(session, -1)
+            onsets[session] = onset
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'shuffle_bucket': True}),
+        ({'max_frames_per_batch': 1000}),
+        ({'sort_stop_epoch': 1}),
+    ]
+)
+@pytest.mark.parametrize("world_size", [2, 3])
+def test_rank_sharding(tmp_path, args, world_size):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    n_epochs = 2
+
+    steps_ref = iterate(make_dataset(tsv_path, dict_path, **args), n_epochs)
+    steps_ranks = []
+    for rank in range(world_size):
+        # NOTE: every process starts from the same random state
+        random.seed(1)
+        np.random.seed(1)
+        dataset = make_dataset(tsv_path, dict_path, rank=rank, world_size=world_size, **args)
+        steps_ranks.append(iterate(dataset, n_epochs))
+
+    # the same number of mini-batches and epoch boundaries in all ranks
+    n_batches = len(steps_ranks[0])
+    for steps in steps_ranks:
+        assert len(steps) == n_batches
+        assert [s[1] for s in steps] == [s[1] for s in steps_ranks[0]]
+        assert [s[2] for s in steps] == [s[2] for s in steps_ranks[0]]
+        assert all(0 < s[3] <= 1 for s in steps if not s[1])
+    assert n_batches >= len(steps_ref) // world_size - n_epochs
+
+    # mini-batches of each epoch are disjoint over ranks
+    for epoch in range(n_epochs):
+        utt_ids = [u for steps in steps_ranks for s in steps if s[2] - s[1] == epoch
+                   for u in s[0]['utt_ids']]
+        assert len(utt_ids) == len(set(utt_ids))
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'shuffle_bucket': True}),
+        ({'dynamic_batching': True}),
+        ({'sort_stop_epoch': 2}),
+        ({'max_frames_per_batch': 1000}),
+        ({'discourse_aware': True, 'corpus': 'swbd', 'batch_size': 2}),
+        ({'rank': 1, 'world_size': 2}),
+        ({'n_workers': 2, 'n_prefetch': 3, 'sort_stop_epoch': 2}),
+    ]
+)
+def test_resume(tmp_path, args):
+    tsv_path, dict_path = make_corpus(tmp_path)
+
+    def run(dataset, n_steps):
+        steps = []
+        for _ in range(n_steps):
+            batch, is_new_epoch = dataset.next()
+            steps.append((batch, is_new_epoch, dataset.epoch, dataset.epoch_detail))
+        return steps
+
+    random.seed(1)
+    np.random.seed(1)
+    steps_ref = iterate(make_dataset(tsv_path, dict_path, **args), n_epochs=3)
+    for n_steps in range(1, len(steps_ref), 4):
+        random.seed(1)
+        np.random.seed(1)
+        dataset = make_dataset(tsv_path, dict_path, **args)
+        random.seed(1)
+        np.random.seed(1)
+        assert_same_steps(run(dataset, n_steps), steps_ref[:n_steps])
+        state = pickle.loads(pickle.dumps(dataset.state_dict()))
+
+        # resume from a different random state
+        random.seed(n_steps)
+        np.random.seed(n_steps)
+        dataset = make_dataset(tsv_path, dict_path, **args)
+        dataset.load_state_dict(state)
+        assert dataset.epoch == steps_ref[n_steps - 1][2]
+        assert dataset.epoch_detail == steps_ref[n_steps - 1][3]
+        assert_same_steps(run(dataset, len(steps_ref) - n_steps), steps_ref[n_steps:])
+        with pytest.raises(StopIteration):
+            dataset.next()
+
+
+def test_resume_streaming(tmp_path):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    module = importlib.import_module('neural_sp.datasets.asr')
+    lines = open(tsv_path).readlines()
+    for i in range(3):
+        with open(str(tmp_path / ('train.%d.tsv' % i)), 'w') as f:
+            f.writelines(lines[:1] + lines[1 + i::3])
+
+    def make():
+        return module.StreamingDataset(tsv_path=str(tmp_path / 'train.*.tsv'), dict_path=dict_path,
+                                       unit='word', batch_size=8, n_epochs=2, min_n_frames=40,
+                                       n_buffer_batches=4)
+
+    random.seed(1)
+    dataset = make()
+    random.seed(1)
+    steps_ref = [dataset.next()[0]['utt_ids'] for _ in range(12)]
+
+    random.seed(1)
+    dataset = make()
+    random.seed(1)
+    for _ in range(5):
+        dataset.next()
+    state = pickle.loads(pickle.dumps(dataset.state_dict()))
+    random.seed(5)
+    dataset = make()
+    dataset.load_state_dict(state)
+    assert [dataset.next()[0]['utt_ids'] for _ in range(7)] == steps_ref[5:]
@@ -0,0 +1,160 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for LM dataset."""
+
+import importlib
+import numpy as np
+import pickle
+import pytest
+
+
+VOCAB = 20
+
+
+def make_corpus(tmp_path, n_utts=50):
+    dict_path = str(tmp_path / 'dict.txt')
+    with open(dict_path, 'w') as f:
+        for i in range(1, VOCAB):
+            f.write('w%d %d\n' % (i, i))
+
+    tsv_path = str(tmp_path / 'train.tsv')
+    rng = np.random.RandomState(0)
+    with open(tsv_path, 'w') as f:
+        f.write('utt_id\tspeaker\tfeat_path\txlen\txdim\ttext\ttoken_id\tylen\tydim\n')
+        for i in rng.permutation(n_utts):
+            ylen = rng.randint(0, 8)
+            ys = rng.randint(4, VOCAB, ylen)
+            f.write('utt%03d\tspk\t\t0\t0\t%s\t%s\t%d\t%d\n' % (
+                i, ' '.join('w%d' % y for y in ys), ' '.join(map(str, ys)), ylen, VOCAB))
+    return tsv_path, dict_path
+
+
+def make_dataset(tsv_path, dict_path, **kwargs):
+    module = importlib.import_module('neural_sp.datasets.lm')
+    args = dict(tsv_path=tsv_path, dict_path=dict_path, unit='word',
+                batch_size=4, bptt=5, n_epochs=2)
+    args.update(kwargs)
+    return module.Dataset(**args)
+
+
+def iterate(dataset, batch_size=None, bptt=None):
+    batches = []
+    while True:
+        ys, is_new_epoch = dataset.next(batch_size, bptt)
+        batches.append(ys)
+        if is_new_epoch:
+            return batches
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'min_n_tokens': 3}),
+        ({'is_test': True}),
+        ({'backward': True}),
+        ({'batch_size': 1, 'bptt': 7}),
+    ]
+)
+def test_token_stream(tmp_path, args):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    module = importlib.import_module('neural_sp.datasets.lm')
+    tokens_path = module.make_token_stream(tsv_path, str(tmp_path / 'train'), VOCAB)
+    assert np.load(tokens_path, mmap_mode='r').dtype == np.uint16
+
+    dataset = make_dataset(tsv_path, dict_path, **args)
+    dataset_packed = make_dataset(tokens_path, dict_path, **args)
+    assert len(dataset) == len(dataset_packed)
+    batches = iterate(dataset)
+    batches_packed = iterate(dataset_packed)
+    assert len(batches) == len(batches_packed)
+    for ys, ys_packed in zip(batches, batches_packed):
+        assert ys_packed.dtype == np.int64
+        assert np.array_equal(ys, ys_packed)
+
+
+def test_token_stream_shuffle(tmp_path):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    module = importlib.import_module('neural_sp.datasets.lm')
+    tokens_path = module.make_token_stream(tsv_path, str(tmp_path / 'train'), VOCAB)
+
+    dataset = make_dataset(tokens_path, dict_path, shuffle=True, batch_size=1)
+    concat_ids = [dataset.concat_ids.copy()]
+    dataset.reset()
+    concat_ids.append(dataset.concat_ids.copy())
+    assert not np.array_equal(concat_ids[0], concat_ids[1])
+
+    # the same utterances in a different order
+    def split(ids):
+        eos_ids = np.where(ids[0] == 2)[0]
+        return sorted(tuple(ids[0, s + 1:e]) for s, e in zip(eos_ids[:-1], eos_ids[1:]))
+    assert split(concat_ids[0]) == split(concat_ids[1])
+
+
+@pytest.mark.parametrize(
+    "n_streams, bptt",
+    [
+        (1, 5),
+        (4, 5),
+        (7, 3),
+        (100, 5),  # more streams than utterances
+    ]
+)
+def test_split_streams(tmp_path, n_streams, bptt):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    dataset = make_dataset(tsv_path, dict_path, batch_size=8, is_test=True)
+    flat_ids = dataset.flat_ids
+
+    # every token except for the first <eos> is predicted exactly once
+    targets = [[] for _ in range(n_streams)]
+    for ys in iterate(dataset, n_streams, bptt):
+        assert ys.shape[0] == n_streams
+        for b in range(n_streams):
+            targets[b] += ys[b, 1:].tolist()
+    targets = [y for ys in targets for y in ys if y != dataset.pad]
+    assert targets == flat_ids[1:].tolist()
+
+
+@pytest.mark.parametrize("world_size", [2, 3])
+def test_rank_sharding(tmp_path, world_size):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    batch_size = 2
+
+    dataset_ref = make_dataset(tsv_path, dict_path, batch_size=batch_size * world_size)
+    batches_ref = iterate(dataset_ref)
+    batches_ranks = [iterate(make_dataset(tsv_path, dict_path, batch_size=batch_size,
+                                          rank=rank, world_size=world_size))
+                     for rank in range(world_size)]
+    for rank, batches in enumerate(batches_ranks):
+        assert len(batches) == len(batches_ref)
+        for ys, ys_ref in zip(batches, batches_ref):
+            assert np.array_equal(ys, ys_ref[rank * batch_size:(rank + 1) * batch_size])
+
+
+@pytest.mark.parametrize("packed", [False, True])
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_resume(tmp_path, packed, shuffle):
+    tsv_path, dict_path = make_corpus(tmp_path)
+    module = importlib.import_module('neural_sp.datasets.lm')
+    if packed:
+        tsv_path = module.make_token_stream(tsv_path, str(tmp_path / 'train'), VOCAB)
+
+    np.random.seed(1)
+    dataset = make_dataset(tsv_path, dict_path, shuffle=shuffle)
+    batches_ref = iterate(dataset) + iterate(dataset)
+    for n_steps in range(1, len(batches_ref), 3):
+        np.random.seed(1)
+        dataset = make_dataset(tsv_path, dict_path, shuffle=shuffle)
+        for _ in range(n_steps):
+            dataset.next()
+        state = pickle.loads(pickle.dumps(dataset.state_dict()))
+
+        # resume from a different random state
+        np.random.seed(n_steps)
+        dataset = make_dataset(tsv_path, dict_path, shuffle=shuffle)
+        dataset.load_state_dict(state)
+        for ys_ref in batches_ref[n_steps:]:
+            assert np.array_equal(dataset.next()[0], ys_ref)
+        with pytest.raises(StopIteration):
+            dataset.next()
@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for forward-backward attention decoding."""
+
+import importlib
+import numpy as np
+import pytest
+
+
+EOS = 2
+VOCAB = 6
+MAX_TIME = 8
+
+
+def fwd_bwd_attention_loop(nbest_hyps_fwd, aws_fwd, scores_fwd,
+                           nbest_hyps_bwd, aws_bwd, scores_bwd, eos, flip=False):
+    """Reference implementation with nested loops."""
+    best_hyps = []
+    for b in range(len(nbest_hyps_fwd)):
+        max_time = len(aws_fwd[b][0])
+        nbest = len(nbest_hyps_fwd[b])
+        merged = []
+        for n in range(nbest):
+            if len(nbest_hyps_fwd[b][n]) > 1:
+                if nbest_hyps_fwd[b][n][-1] == eos:
+                    merged.append({'hyp': nbest_hyps_fwd[b][n][:-1], 'score': scores_fwd[b][n][-2]})
+                else:
+                    merged.append({'hyp': nbest_hyps_fwd[b][n], 'score': scores_fwd[b][n][-1]})
+            if len(nbest_hyps_bwd[b][n]) > 1:
+                if nbest_hyps_bwd[b][n][0] == eos:
+                    merged.append({'hyp': nbest_hyps_bwd[b][n][1:], 'score': scores_bwd[b][n][1]})
+                else:
+                    merged.append({'hyp': nbest_hyps_bwd[b][n], 'score': scores_bwd[b][n][0]})
+
+        for n_f in range(nbest):
+            for n_b in range(nbest):
+                for i_f in range(len(aws_fwd[b][n_f]) - 1):
+                    for i_b in range(len(aws_bwd[b][n_b]) - 1):
+                        t_prev = aws_bwd[b][n_b][i_b + 1].argmax(-2)
+                        t_curr = aws_fwd[b][n_f][i_f].argmax(-2)
+                        t_next = aws_bwd[b][n_b][i_b - 1].argmax(-2)
+                        if flip:
+                            t_prev, t_next = max_time - t_prev, max_time - t_next
+                        if t_curr >= t_prev and t_curr <= t_next and \
+                                nbest_hyps_fwd[b][n_f][i_f] == nbest_hyps_bwd[b][n_b][i_b]:
+                            new_hyp = nbest_hyps_fwd[b][n_f][:i_f + 1].tolist() + \
+                                nbest_hyps_bwd[b][n_b][i_b + 1:].tolist()
+                            score_curr = max(scores_fwd[b][n_f][i_f] - scores_fwd[b][n_f][i_f - 1],
+                                             scores_bwd[b][n_b][i_b] - scores_bwd[b][n_b][i_b + 1])
+                            new_score = scores_fwd[b][n_f][i_f - 1] + scores_bwd[b][n_b][i_b + 1] + score_curr
+                            merged.append({'hyp': new_hyp, 'score': new_score})
+
+        merged = sorted(merged, key=lambda x: x['score'], reverse=True)
+        best_hyps.append(merged[0]['hyp'])
+    return best_hyps
+
+
+def make_nbest(rng, nbest, bwd):
+    hyps, aws, scores = [], [], []
+    for n in range(nbest):
+        ylen = int(rng.randint(2, 7))
+        hyp = rng.randint(4, VOCAB, size=ylen)
+        if rng.rand() < 0.7:
+            hyp = np.insert(hyp, 0, EOS) if bwd else np.append(hyp, EOS)
+        aw = rng.rand(len(hyp), MAX_TIME, 1)
+        # integer-valued scores to produce ties
+        score = -np.cumsum(rng.randint(0, 3, size=len(hyp))).astype(np.float64)
+        if bwd:
+            score = score[::-1].copy()
+        hyps.append(hyp)
+        aws.append(aw)
+        scores.append(score)
+    return hyps, aws, scores
+
+
+@pytest.mark.parametrize(
+    "nbest, flip",
+    [
+        (1, False),
+        (4, False),
+        (4, True),
+        (10, False),
+    ]
+)
+def test_fwd_bwd_attention(nbest, flip):
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.fwd_bwd_attention')
+
+    rng = np.random.RandomState(nbest)
+    for _ in range(50):
+        bs = 2
+        hyps_fwd, aws_fwd, scores_fwd = zip(*[make_nbest(rng, nbest, False) for _ in range(bs)])
+        hyps_bwd, aws_bwd, scores_bwd = zip(*[make_nbest(rng, nbest, True) for _ in range(bs)])
+        best_hyps_ref = fwd_bwd_attention_loop(hyps_fwd, aws_fwd, scores_fwd,
+                                               hyps_bwd, aws_bwd, scores_bwd, EOS, flip)
+        best_hyps = module.fwd_bwd_attention(hyps_fwd, aws_fwd, scores_fwd,
+                                             hyps_bwd, aws_bwd, scores_bwd,
+                                             EOS, 0., 0., str, None, flip=flip)
+        for hyp, hyp_ref in zip(best_hyps, best_hyps_ref):
+            assert list(hyp) == list(hyp_ref)
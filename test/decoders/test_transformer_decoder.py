@@ -331,3 +331,137 @@ def test_decoding(backward, params):
             assert isinstance(scores, list)
             assert len(scores) == batch_size
             assert len(scores[0]) == params['nbest']
+
+
+def make_args_lm(lm_type):
+    if lm_type == 'lstm':
+        return make_args_rnnlm()
+    if lm_type == 'gated_conv_custom':
+        args = dict(
+            lm_type=lm_type,
+            n_units=32,
+            n_projs=0,
+            n_layers=3,
+            kernel_size=4,
+            emb_dim=32,
+            vocab=VOCAB,
+            dropout_in=0.1,
+            dropout_hidden=0.1,
+            lsm_prob=0.0,
+            param_init=0.1,
+            adaptive_softmax=False,
+            tie_embedding=False,
+        )
+        return argparse.Namespace(**args)
+    args = dict(
+        lm_type=lm_type,
+        transformer_attn_type='scaled_dot',
+        transformer_n_heads=4,
+        n_layers=2,
+        transformer_d_model=16,
+        transformer_d_ff=64,
+        transformer_layer_norm_eps=1e-12,
+        transformer_ffn_activation='relu',
+        transformer_pe_type='add',
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        dropout_att=0.1,
+        dropout_layer=0.0,
+        lsm_prob=0.0,
+        transformer_param_init='xavier_uniform',
+        bptt=200,
+        mem_len=0,
+        recog_kv_cache_len=0,
+        recog_mem_len=0,
+        zero_center_offset=False,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    return argparse.Namespace(**args)
+
+
+ARPA = """
+\\data\\
+ngram 1=5
+ngram 2=3
+
+\\1-grams:
+-1.0\t<unk>\t-0.2
+-99\t<s>\t-0.5
+-0.7\t</s>
+-0.6\ta\t-0.3
+-0.8\tb\t-0.25
+
+\\2-grams:
+-0.2\t<s> a
+-0.4\ta b
+-0.3\tb </s>
+
+\\end\\
+"""
+
+
+def make_ngram(tmp_path):
+    dict_path = str(tmp_path / 'dict.txt')
+    with open(dict_path, 'w') as f:
+        for i, token in enumerate(['<unk>', '<eos>', '<pad>', 'a', 'b', 'c', 'd', 'e', 'f']):
+            f.write('%s %d\n' % (token, i + 1))
+    arpa_path = str(tmp_path / 'lm.arpa')
+    with open(arpa_path, 'w') as f:
+        f.write(ARPA)
+    module = importlib.import_module('neural_sp.models.lm.ngram')
+    return module.NgramLM(arpa_path, dict_path)
+
+
+class FullPrefixLM(torch.nn.Module):
+    """Reference LM recomputing scores from the whole prefixes without LM states."""
+
+    def __init__(self, lm):
+        super(FullPrefixLM, self).__init__()
+        self.lm = lm
+
+    def cached_predict(self, ys, state, prefixes, mems=None, cache=None, candidate_ids=None):
+        logits, _, _ = self.lm.decode(torch.tensor(prefixes, dtype=torch.int64), None)
+        log_probs = self.lm.output_log_probs(logits[:, -1:])
+        # NOTE: only the top-K candidates are scored
+        return None, None, log_probs.gather(2, candidate_ids.unsqueeze(1))
+
+
+@pytest.mark.parametrize("lm_type", ['lstm', 'transformer', 'transformer_xl', 'gated_conv_custom', 'ngram'])
+def test_shallow_fusion(tmp_path, lm_type):
+    args = make_args()
+    params = make_decode_params(recog_beam_width=4, recog_lm_weight=0.5, nbest=4)
+
+    batch_size = params['recog_batch_size']
+    emax = 40
+    device = "cpu"
+
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([len(x) for x in eouts])
+    eouts = pad_list([np2tensor(x, device).float() for x in eouts], 0.)
+
+    if lm_type == 'ngram':
+        lm = make_ngram(tmp_path)
+    else:
+        module = importlib.import_module('neural_sp.models.lm.build')
+        lm = module.build_lm(make_args_lm(lm_type)).to(device)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.transformer')
+    dec = module.TransformerDecoder(**args)
+    dec = dec.to(device)
+
+    dec.eval()
+    with torch.no_grad():
+        # LM states are batchfied and split for each hypothesis
+        nbest_hyps, _, scores = dec.beam_search(eouts, elens, params, idx2token=None,
+                                                lm=lm, nbest=params['nbest'],
+                                                exclude_eos=params['exclude_eos'],
+                                                refs_id=None, utt_ids=None, speakers=None)
+        nbest_hyps_ref, _, scores_ref = dec.beam_search(eouts, elens, params, idx2token=None,
+                                                        lm=FullPrefixLM(lm), nbest=params['nbest'],
+                                                        exclude_eos=params['exclude_eos'],
+                                                        refs_id=None, utt_ids=None, speakers=None)
+    for hyps, hyps_ref in zip(nbest_hyps[0], nbest_hyps_ref[0]):
+        assert list(hyps) == list(hyps_ref)
+    assert np.allclose(scores[0], scores_ref[0], atol=1e-4)
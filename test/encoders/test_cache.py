@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for encoder output cache."""
+
+import importlib
+import numpy as np
+import torch
+
+
+def make_eout_dict(bs, xmax, dim):
+    return {'ys': {'xs': torch.zeros(bs, xmax, dim), 'xlens': torch.IntTensor([xmax] * bs)},
+            'ys_sub1': {'xs': None, 'xlens': None},
+            'ys_sub2': {'xs': None, 'xlens': None}}
+
+
+def test_cache():
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.cache')
+    cache = module.EncoderOutputCache(max_bytes=2 * 4 * (4 * 100 * 16 + 4))
+
+    model1, model2, model3 = object(), object(), object()
+    xs = [np.zeros((100, 80), dtype=np.float32) for _ in range(4)]
+    utt_ids = ['utt%d' % i for i in range(4)]
+
+    # miss
+    assert cache.lookup(xs, utt_ids, model1, 'ys') is None
+    eout_dict = make_eout_dict(4, 100, 16)
+    cache.store(xs, utt_ids, model1, 'all', eout_dict)
+    # hit (sub tasks also reuse outputs encoded with task=all)
+    assert cache.lookup(xs, utt_ids, model1, 'ys') is eout_dict
+    assert cache.lookup(xs, utt_ids, model1, 'ys_sub1') is eout_dict
+    assert cache.lookup(xs, utt_ids, model2, 'ys') is None
+    assert cache.n_hits == 2 and cache.n_misses == 2
+
+    # eviction of the least recently used entry
+    cache.store(xs, utt_ids, model2, 'all', make_eout_dict(4, 100, 16))
+    cache.store(xs, utt_ids, model3, 'all', make_eout_dict(4, 100, 16))
+    assert cache.n_bytes <= cache.max_bytes
+    assert cache.lookup(xs, utt_ids, model1, 'ys') is None
+    assert cache.lookup(xs, utt_ids, model3, 'ys') is not None
+
+    # a new mini-batch flushes the cache
+    assert cache.lookup(xs, ['utt%d' % i for i in range(4, 8)], model3, 'ys') is None
+    assert cache.n_bytes == 0
+
+    # mini-batches that cannot be identified are not cached
+    assert cache.lookup(xs[:1], utt_ids, model1, 'ys') is None
+    cache.store(xs[:1], utt_ids, model1, 'all', make_eout_dict(1, 100, 16))
+    assert len(cache.cache) == 0
@@ -142,3 +142,43 @@ def test_forward(args):
             if args['n_layers_sub2'] > 0:
                 assert enc_out_dict['ys_sub2']['xs'].size(0) == batch_size
                 assert enc_out_dict['ys_sub2']['xs'].size(1) == enc_out_dict['ys_sub2']['xlens'][0]
+
+
+@pytest.mark.parametrize(
+    "skip_layer_ids, threshold",
+    [
+        ([], 0.),
+        ([1], 0.),
+        ([], 0.5),
+    ]
+)
+def test_layer_skipping(skip_layer_ids, threshold):
+    args = make_args(enc_type='conformer')
+
+    batch_size = 4
+    xmax = 40
+    vocab = 10
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+    enc = module.ConformerEncoder(**args)
+    enc = enc.to(device)
+    enc.eval()
+
+    xs = np.random.randn(batch_size, xmax, args['input_dim']).astype(np.float32)
+    xlens = torch.IntTensor([len(x) - i * enc.subsampling_factor for i, x in enumerate(xs)])
+    xs = pad_list([np2tensor(x, device).float() for x in xs], 0.)
+
+    def confident_probe(eouts):
+        return torch.ones(eouts.size(0), eouts.size(1), vocab)
+
+    with torch.no_grad():
+        eouts_ref = enc(xs, xlens, task='all')['ys']
+
+        enc.set_layer_skipping(skip_layer_ids, confident_probe, threshold)
+        eouts = enc(xs, xlens, task='all')['ys']
+        assert eouts['xs'].size() == eouts_ref['xs'].size()
+        if len(skip_layer_ids) == 0 and threshold == 0:
+            assert torch.equal(eouts['xs'], eouts_ref['xs'])
+        if threshold > 0:
+            assert list(enc.exit_layer_counts.values()) == [batch_size]
@@ -161,3 +161,42 @@ def test_forward_1d(args):
         xs, xlens = enc(xs, xlens)
         assert xs.size(0) == batch_size
         assert xs.size(1) == xlens.max(), (xs.size(), xlens)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        (make_args_2d(batch_norm=True)),
+        (make_args_2d(batch_norm=True, layer_norm=True, residual=True)),
+        (make_args_2d(batch_norm=True, bottleneck_dim=8)),
+        (make_args_1d()),
+    ]
+)
+def test_freeze_for_inference(args):
+    batch_size = 4
+    xmax = 40
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conv')
+    enc = module.ConvEncoder(**args)
+    enc = enc.to(device)
+
+    xs = np.random.randn(batch_size, xmax, args['input_dim']).astype(np.float32)
+    xlens = torch.IntTensor([len(x) - i * enc.subsampling_factor for i, x in enumerate(xs)])
+    xs = pad_list([np2tensor(x, device).float() for x in xs], 0.)
+
+    # update running statistics in batch normalization
+    with torch.no_grad():
+        enc(xs * 2 + 1, xlens)
+
+    enc.eval()
+    enc_frozen = enc.freeze_for_inference()
+    assert not any(p.requires_grad for p in enc_frozen.parameters())
+    assert not any(isinstance(m, (torch.nn.BatchNorm2d, torch.nn.Dropout))
+                   for m in enc_frozen.modules())
+
+    with torch.no_grad():
+        xs_ref, xlens_ref = enc(xs, xlens)
+        xs_frozen, xlens_frozen = enc_frozen(xs, xlens)
+    assert torch.allclose(xs_ref, xs_frozen, atol=1e-5)
+    assert torch.equal(xlens_ref, xlens_frozen)
@@ -0,0 +1,64 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for gated convolutional encoder."""
+
+import importlib
+import numpy as np
+import pytest
+import torch
+
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import pad_list
+
+
+def make_args(**kwargs):
+    args = dict(
+        input_dim=16,
+        in_channel=1,
+        channels="32_32",
+        kernel_sizes="(3,1)_(3,1)",
+        dropout=0.1,
+        last_proj_dim=0,
+        param_init=0.1,
+    )
+    args.update(kwargs)
+    return args
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'channels': "32_32"}),
+        ({'channels': "16_32"}),
+        ({'last_proj_dim': 8}),
+    ]
+)
+def test_freeze_for_inference(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    xmax = 40
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.gated_conv')
+    enc = module.GatedConvEncoder(**args)
+    enc = enc.to(device)
+    enc.eval()
+
+    xs = np.random.randn(batch_size, xmax, args['input_dim']).astype(np.float32)
+    xlens = torch.IntTensor([len(x) - i for i, x in enumerate(xs)])
+    xs = pad_list([np2tensor(x, device).float() for x in xs], 0.)
+
+    enc_frozen = enc.freeze_for_inference()
+    assert not any(p.requires_grad for p in enc_frozen.parameters())
+    assert not any(isinstance(m, torch.nn.Dropout) for m in enc_frozen.modules())
+    # weight normalization is merged into the weights
+    assert not any(hasattr(m, 'weight_g') for m in enc_frozen.modules())
+    assert any(hasattr(m, 'weight_g') for m in enc.modules())
+
+    with torch.no_grad():
+        eouts_ref = enc(xs, xlens, task='all')['ys']
+        eouts_frozen = enc_frozen(xs, xlens, task='all')['ys']
+    assert eouts_ref['xs'].size() == (batch_size, xmax, enc.output_dim)
+    assert torch.allclose(eouts_ref['xs'], eouts_frozen['xs'], atol=1e-5)
@@ -42,6 +42,7 @@ def make_args(**kwargs):
         param_init=0.1,
         chunk_size_left=0,
         chunk_size_right=0,
+        lc_pack_padded=False,
     )
     args.update(kwargs)
     return args
@@ -117,6 +118,10 @@ def make_args(**kwargs):
         ({'enc_type': 'blstm', 'bidir_sum_fwd_bwd': True,
           'chunk_size_left': 40, 'chunk_size_right': 40}),
         ({'enc_type': 'conv_blstm', 'bidir_sum_fwd_bwd': True, 'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'chunk_size_right': 40, 'lc_pack_padded': True}),  # for PT
+        ({'enc_type': 'blstm', 'bidir_sum_fwd_bwd': True,
+          'chunk_size_right': 40, 'lc_pack_padded': True}),  # for PT
+        ({'enc_type': 'conv_blstm', 'chunk_size_right': 40, 'lc_pack_padded': True}),  # for PT
         # LC-BLSTM + subsampling
         ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'chunk_size_right': 40}),  # for PT
         ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'chunk_size_left': 40, 'chunk_size_right': 40}),
@@ -124,6 +129,10 @@ def make_args(**kwargs):
           'chunk_size_right': 40}),  # for PT
         ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'bidir_sum_fwd_bwd': True,
           'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'chunk_size_right': 40,
+          'lc_pack_padded': True}),  # for PT
+        ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'chunk_size_right': 40,
+          'n_layers_sub1': 3, 'lc_pack_padded': True}),  # for PT
         # Multi-task
         ({'enc_type': 'blstm', 'n_layers_sub1': 3}),
         ({'enc_type': 'blstm', 'n_layers_sub1': 3, 'n_layers_sub2': 2}),
@@ -184,3 +193,84 @@ def test_forward(args):
             enc_out_dict_sub12 = enc(xs, xlens, task='ys_sub2')
             assert enc_out_dict_sub12['ys_sub2']['xs'].size(0) == batch_size
             assert enc_out_dict_sub12['ys_sub2']['xs'].size(1) == enc_out_dict_sub12['ys_sub2']['xlens'].max()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'blstm', 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'bidir_sum_fwd_bwd': True, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'chunk_size_right': 40}),
+    ]
+)
+def test_lc_pack_padded(args):
+    args = make_args(**args)
+    args['dropout_in'] = 0.
+    args['dropout'] = 0.
+
+    batch_size = 4
+    xmax = 400
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.rnn')
+    enc = module.RNNEncoder(**args)
+    enc.lc_pack_padded = True
+    enc = enc.to(device)
+    enc.eval()
+
+    xs = np.random.randn(batch_size, xmax, args['input_dim']).astype(np.float32)
+    xlens = torch.IntTensor([xmax - i * 20 for i in range(batch_size)][::-1])
+    xs = [np2tensor(x[:xlens[b]], device).float() for b, x in enumerate(xs)]
+
+    with torch.no_grad():
+        eouts = enc(pad_list(xs, 0.), xlens, task='all')['ys']
+        for b in range(batch_size):
+            # packed batch encoding must match unbatched encoding
+            eouts_b = enc(xs[b].unsqueeze(0), xlens[b:b + 1], task='all')['ys']
+            elen = eouts['xlens'][b].item()
+            assert elen == eouts_b['xlens'][0].item()
+            assert torch.allclose(eouts['xs'][b, :elen], eouts_b['xs'][0, :elen], atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'blstm', 'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'bgru', 'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'chunk_size_left': 40, 'chunk_size_right': 0}),
+        ({'enc_type': 'blstm', 'bidir_sum_fwd_bwd': True, 'n_projs': 8,
+          'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'subsample_type': 'concat',
+          'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'n_layers_sub1': 3,
+          'chunk_size_left': 40, 'chunk_size_right': 40}),
+    ]
+)
+def test_lc_parallel_chunks(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.rnn')
+    enc = module.RNNEncoder(**args)
+    enc = enc.to(device)
+    enc.eval()
+
+    for xmax in [400, 455]:
+        xs = np.random.randn(batch_size, xmax, args['input_dim']).astype(np.float32)
+        xlens = torch.IntTensor([len(x) - i * enc.subsampling_factor for i, x in enumerate(xs)])
+        xs = pad_list([np2tensor(x, device).float() for x in xs], 0.)
+
+        with torch.no_grad():
+            enc.lc_parallel_chunks = False
+            eouts_seq = enc(xs, xlens, task='all')
+            enc.lc_parallel_chunks = True
+            eouts_par = enc(xs, xlens, task='all')
+
+        for task in ['ys', 'ys_sub1']:
+            if eouts_seq[task]['xs'] is None:
+                continue
+            assert eouts_seq[task]['xs'].size() == eouts_par[task]['xs'].size()
+            assert torch.allclose(eouts_seq[task]['xs'], eouts_par[task]['xs'], atol=1e-6)
+            assert torch.equal(eouts_seq[task]['xlens'], eouts_par[task]['xlens'])
@@ -58,3 +58,37 @@ def test_forward(args):
 
         assert enc_out_dict['ys']['xs'].size(0) == batch_size
         assert enc_out_dict['ys']['xs'].size(1) == enc_out_dict['ys']['xlens'].max()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'channels': "10_10_14_14", 'kernel_sizes': "(21,1)_(21,1)_(21,1)_(21,1)"}),
+        ({'channels': "10_10_14_14", 'kernel_sizes': "(21,1)_(21,1)_(21,1)_(21,1)", 'last_proj_dim': 64}),
+    ]
+)
+def test_freeze_for_inference(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    xmax = 40
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.tds')
+    enc = module.TDSEncoder(**args)
+    enc = enc.to(device)
+    enc.eval()
+
+    xs = np.random.randn(batch_size, xmax, args['input_dim'] * args['in_channel']).astype(np.float32)
+    xlens = torch.IntTensor([len(x) - i * enc.subsampling_factor for i, x in enumerate(xs)])
+    xs = pad_list([np2tensor(x, device).float() for x in xs], 0.)
+
+    enc_frozen = enc.freeze_for_inference()
+    assert not any(p.requires_grad for p in enc_frozen.parameters())
+    assert not any(isinstance(m, torch.nn.Dropout) for m in enc_frozen.modules())
+
+    with torch.no_grad():
+        eouts_ref = enc(xs, xlens, task='all')['ys']
+        eouts_frozen = enc_frozen(xs, xlens, task='all')['ys']
+    assert torch.allclose(eouts_ref['xs'], eouts_frozen['xs'], atol=1e-5)
+    assert torch.equal(eouts_ref['xlens'], eouts_frozen['xlens'])
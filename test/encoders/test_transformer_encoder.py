@@ -156,3 +156,72 @@ def test_forward(args):
             if args['n_layers_sub2'] > 0:
                 assert enc_out_dict['ys_sub2']['xs'].size(0) == batch_size, xs.size()
                 assert enc_out_dict['ys_sub2']['xs'].size(1) == enc_out_dict['ys_sub2']['xlens'][0], xs.size()
+
+
+@pytest.mark.parametrize(
+    "args, skip_layer_ids, threshold",
+    [
+        ({'enc_type': 'transformer'}, [], 0.),
+        ({'enc_type': 'transformer'}, [1], 0.),
+        ({'enc_type': 'transformer'}, [], 0.5),
+        ({'enc_type': 'transformer', 'subsample': "1_2_1", 'subsample_type': 'drop'}, [1], 0.5),
+        ({'enc_type': 'transformer', 'n_layers_sub1': 2, 'task_specific_layer': True}, [0], 0.5),
+        ({'enc_type': 'transformer', 'pe_type': 'relative', 'last_proj_dim': 10}, [0, 2], 0.5),
+    ]
+)
+def test_layer_skipping(args, skip_layer_ids, threshold):
+    args = make_args(**args)
+
+    batch_size = 4
+    xmax = 40
+    vocab = 10
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    enc = module.TransformerEncoder(**args)
+    enc = enc.to(device)
+    enc.eval()
+
+    xs = np.random.randn(batch_size, xmax, args['input_dim']).astype(np.float32)
+    xlens = torch.IntTensor([len(x) - i * enc.subsampling_factor for i, x in enumerate(xs)])
+    xs = pad_list([np2tensor(x, device).float() for x in xs], 0.)
+
+    def confident_probe(eouts):
+        return torch.ones(eouts.size(0), eouts.size(1), vocab)
+
+    def unconfident_probe(eouts):
+        return torch.ones(eouts.size(0), eouts.size(1), vocab) / vocab
+
+    def first_utt_confident_probe(eouts):
+        probs = unconfident_probe(eouts)
+        if eouts.size(0) == batch_size:
+            probs[0] = 1
+        return probs
+
+    with torch.no_grad():
+        eouts_ref = enc(xs, xlens, task='all')['ys']
+
+        # confident CTC posteriors lead to exit after the first possible layer
+        enc.set_layer_skipping(skip_layer_ids, confident_probe, threshold)
+        eouts = enc(xs, xlens, task='all')['ys']
+        assert eouts['xs'].size() == eouts_ref['xs'].size()
+        assert torch.equal(eouts['xlens'], eouts_ref['xlens'])
+        if len(skip_layer_ids) == 0 and threshold == 0:
+            assert torch.equal(eouts['xs'], eouts_ref['xs'])
+        if threshold > 0:
+            assert list(enc.exit_layer_counts.values()) == [batch_size]
+
+        # unconfident CTC posteriors never lead to exit
+        enc.set_layer_skipping(skip_layer_ids, unconfident_probe, threshold)
+        eouts_skip = enc(xs, xlens, task='all')['ys']
+        if len(skip_layer_ids) == 0:
+            assert torch.equal(eouts_skip['xs'], eouts_ref['xs'])
+        assert len(enc.exit_layer_counts) == 0
+
+        # exit is decided per utterance
+        enc.set_layer_skipping(skip_layer_ids, first_utt_confident_probe, threshold)
+        eouts = enc(xs, xlens, task='all')['ys']
+        assert eouts['xs'].size() == eouts_ref['xs'].size()
+        assert torch.allclose(eouts['xs'][1:], eouts_skip['xs'][1:], atol=1e-6)
+        if threshold > 0:
+            assert list(enc.exit_layer_counts.values()) == [1]
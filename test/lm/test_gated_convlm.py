@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for GatedConvLM."""
+
+import argparse
+import importlib
+import numpy as np
+import pytest
+import torch
+
+
+VOCAB = 100
+
+
+def make_args(**kwargs):
+    args = dict(
+        lm_type='gated_conv_custom',
+        n_units=32,
+        n_projs=0,
+        n_layers=3,
+        kernel_size=4,
+        emb_dim=32,
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'n_layers': 1}),
+        ({'n_layers': 3}),
+        ({'kernel_size': 1}),
+        ({'n_projs': 16}),
+        ({'emb_dim': 16}),
+        ({'lsm_prob': 0.1}),
+        ({'adaptive_softmax': True}),
+        ({'tie_embedding': True}),
+    ]
+)
+def test_forward(args):
+    args = make_args(**args)
+
+    ylens = [4, 5, 3, 7] * 20
+    ys = [np.random.randint(0, VOCAB, ylen).astype(np.int64) for ylen in ylens]
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.lm.gated_convlm')
+    lm = module.GatedConvLM(args)
+    lm = lm.to(device)
+    loss, state, observation = lm(ys, state=None, n_caches=0)
+    assert loss.item() >= 0
+    assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'n_layers': 3}),
+        ({'kernel_size': 1}),
+        ({'n_projs': 16}),
+        ({'emb_dim': 16}),
+    ]
+)
+def test_decode_incremental(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    ymax = 10
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.lm.gated_convlm')
+    lm = module.GatedConvLM(args)
+    lm = lm.to(device)
+    lm.eval()
+
+    ys = torch.randint(0, VOCAB, (batch_size, ymax), dtype=torch.int64)
+    with torch.no_grad():
+        logits_ref, _, _ = lm.decode(ys)
+
+        # one token per step
+        state = None
+        for t in range(ymax):
+            lmout, state, log_probs = lm.predict(ys[:, t:t + 1], state)
+            assert lmout.size() == (batch_size, 1, lm.output.in_features)
+            assert torch.allclose(log_probs[:, 0], torch.log_softmax(logits_ref[:, t], dim=-1), atol=1e-5)
+
+        # reorder states across hypotheses
+        perm = torch.LongTensor([2, 0, 3, 1])
+        state = None
+        for t in range(ymax // 2):
+            _, state, _ = lm.predict(ys[:, t:t + 1], state)
+        state = [state_l.index_select(0, perm) for state_l in state]
+        for t in range(ymax // 2, ymax):
+            _, state, log_probs = lm.predict(ys[perm, t:t + 1], state)
+        logits_ref_perm, _, _ = lm.decode(ys[perm])
+        assert torch.allclose(log_probs[:, 0], torch.log_softmax(logits_ref_perm[:, -1], dim=-1), atol=1e-5)
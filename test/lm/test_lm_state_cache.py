@@ -0,0 +1,124 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for LM state cache."""
+
+import argparse
+import importlib
+import pytest
+import torch
+
+
+VOCAB = 100
+
+
+def make_args(**kwargs):
+    args = dict(
+        lm_type='lstm',
+        n_units=32,
+        n_projs=0,
+        n_layers=2,
+        residual=False,
+        use_glu=False,
+        n_units_null_context=0,
+        bottleneck_dim=16,
+        emb_dim=16,
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_trie():
+    module = importlib.import_module('neural_sp.models.lm.lm_base')
+    cache = module.LMStateCache(max_entries=3)
+
+    for prefix in [[2], [2, 5], [2, 5, 7], [2, 6]]:
+        cache.store(prefix, (torch.zeros(1), None, torch.zeros(1)))
+    assert len(cache) == 3
+    assert cache.lookup([2]) is None  # evicted
+    assert cache.lookup([2, 5]) is not None
+    assert cache.lookup([2, 5, 7]) is not None
+    assert cache.lookup([2, 5, 8]) is None
+    assert cache.n_hits == 2
+    assert cache.n_misses == 2
+
+    # [2, 6] is the least recently used entry
+    cache.store([3], (torch.zeros(1), None, torch.zeros(1)))
+    assert cache.lookup([2, 6]) is None
+    assert 6 not in cache.root.children[2].children  # pruned
+
+
+@pytest.mark.parametrize(
+    "device", [None, 'cpu']
+)
+def test_cached_predict(device):
+    args = make_args()
+    batch_size = 4
+    ymax = 6
+
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module.RNNLM(args)
+    lm.eval()
+    module = importlib.import_module('neural_sp.models.lm.lm_base')
+    lm.state_cache = module.LMStateCache(max_entries=100, device=device)
+
+    # hypotheses 0 and 1 share the same prefix
+    ys = torch.randint(0, VOCAB, (batch_size, ymax), dtype=torch.int64)
+    ys[:, 0] = torch.arange(batch_size)
+    ys[1] = ys[0]
+    with torch.no_grad():
+        for _ in range(2):
+            state, state_cached = None, None
+            for t in range(ymax):
+                prefixes = [ys[j, :t + 1].tolist() for j in range(batch_size)]
+                lmout, state, log_probs = lm.predict(ys[:, t:t + 1], state)
+                lmout_cached, state_cached, log_probs_cached = lm.cached_predict(
+                    ys[:, t:t + 1], state_cached, prefixes)
+                assert torch.allclose(lmout, lmout_cached, atol=1e-6)
+                assert torch.allclose(log_probs, log_probs_cached, atol=1e-6)
+                assert torch.allclose(state['hxs'], state_cached['hxs'], atol=1e-6)
+                assert torch.allclose(state['cxs'], state_cached['cxs'], atol=1e-6)
+    # duplicated hypothesis in the 1st pass and all hypotheses in the 2nd pass
+    assert lm.state_cache.n_hits == ymax + batch_size * ymax
+
+
+@pytest.mark.parametrize(
+    "args, use_cache",
+    [
+        ({}, False),
+        ({}, True),
+        ({'adaptive_softmax': True}, False),
+        ({'adaptive_softmax': True}, True),
+    ]
+)
+def test_shortlist_log_probs(args, use_cache):
+    args = make_args(**args)
+    batch_size = 4
+    n_candidates = 5
+
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module.RNNLM(args)
+    lm.eval()
+    if use_cache:
+        module = importlib.import_module('neural_sp.models.lm.lm_base')
+        lm.state_cache = module.LMStateCache(max_entries=100)
+
+    ys = torch.randint(0, VOCAB, (batch_size, 1), dtype=torch.int64)
+    ys[:, 0] = torch.arange(batch_size)
+    candidate_ids = torch.randint(0, VOCAB, (batch_size, n_candidates), dtype=torch.int64)
+    candidate_ids[0, 0] = VOCAB - 1  # the last tail cluster
+    prefixes = [ys[j].tolist() for j in range(batch_size)]
+    with torch.no_grad():
+        _, _, log_probs = lm.predict(ys, None)
+        assert log_probs.size() == (batch_size, 1, VOCAB)
+        assert torch.allclose(log_probs.exp().sum(-1), torch.ones(batch_size, 1), atol=1e-5)
+        _, _, log_probs_sl = lm.cached_predict(ys, None, prefixes, candidate_ids=candidate_ids)
+    assert log_probs_sl.size() == (batch_size, 1, n_candidates)
+    assert torch.allclose(log_probs_sl[:, 0], log_probs[:, 0].gather(1, candidate_ids), atol=1e-5)
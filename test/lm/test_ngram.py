@@ -0,0 +1,116 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for ARPA n-gram LM."""
+
+import gzip
+import importlib
+import math
+import pytest
+import torch
+
+
+ARPA = """
+\\data\\
+ngram 1=7
+ngram 2=6
+ngram 3=3
+
+\\1-grams:
+-1.0\t<unk>\t-0.2
+-99\t<s>\t-0.5
+-0.7\t</s>
+-0.6\ta\t-0.3
+-0.8\tb\t-0.25
+-0.9\tc\t-0.1
+-1.2\tz
+
+\\2-grams:
+-0.2\t<s> a\t-0.15
+-0.4\ta b\t-0.1
+-0.5\ta c
+-0.3\tb </s>
+-0.35\tb a\t-0.05
+-0.45\tc a
+
+\\3-grams:
+-0.1\t<s> a b
+-0.05\ta b </s>
+-0.2\tb a c
+
+\\end\\
+"""
+TOKENS = ['<unk>', '<eos>', '<pad>', 'a', 'b', 'c', 'd']  # 'z' is not in the dictionary
+
+
+def reference(history, w):
+    """Backoff computation with dictionaries (log10)."""
+    probs, bows = {}, {}
+    section = 0
+    for line in ARPA.strip().split('\n'):
+        if line.startswith('\\') and line.endswith('-grams:'):
+            section = int(line[1])
+            continue
+        fields = line.split('\t')
+        if section == 0 or len(fields) < 2:
+            continue
+        probs[tuple(fields[1].split())] = float(fields[0])
+        if len(fields) == 3:
+            bows[tuple(fields[1].split())] = float(fields[2])
+
+    def prob(ctx, w):
+        if (ctx + (w,)) in probs:
+            return probs[ctx + (w,)]
+        if len(ctx) == 0:
+            return probs[('<unk>',)]
+        return bows.get(ctx, 0.) + prob(ctx[1:], w)
+    return prob(tuple(history[-2:]), w)
+
+
+@pytest.fixture
+def lm(tmp_path):
+    dict_path = str(tmp_path / 'dict.txt')
+    with open(dict_path, 'w') as f:
+        for i, token in enumerate(TOKENS):
+            f.write('%s %d\n' % (token, i + 1))
+    arpa_path = str(tmp_path / 'lm.arpa.gz')
+    with gzip.open(arpa_path, 'wt') as f:
+        f.write(ARPA)
+    module = importlib.import_module('neural_sp.models.lm.ngram')
+    return module.NgramLM(arpa_path, dict_path)
+
+
+def test_score(lm):
+    assert lm.n_order == 3
+    assert [len(w) for w in lm.words] == [6, 6, 3]  # 'z' is discarded
+
+    idx2token = {i + 1: token for i, token in enumerate(TOKENS)}
+    idx2token[2] = '</s>'
+    for history in [['<s>'], ['<s>', 'a'], ['a', 'b'], ['b', 'a'], ['c', 'b'], ['d'], ['a', 'd', 'b']]:
+        ids = [2 if token == '<s>' else TOKENS.index(token) + 1 for token in history]
+        log_probs = lm.score(ids)
+        for i in [2, 4, 5, 6, 7]:
+            token = idx2token[i]
+            if token == 'd':
+                token = '<unk>'  # missing in the LM
+            ref = reference([t for t in history], token) * math.log(10)
+            assert abs(log_probs[i] - ref) < 1e-5, (history, token)
+
+
+def test_predict(lm):
+    # <s> a b </s> in one call and token by token
+    ys = torch.LongTensor([[2, 4, 5, 2]])
+    _, state, log_probs = lm.predict(ys[:, :3], None)
+    assert log_probs.size() == (1, 3, lm.vocab)
+    states = [None]
+    for t in range(3):
+        _, state_step, log_probs_step = lm.predict(ys[:, t:t + 1], states[-1])
+        assert torch.allclose(log_probs_step[:, 0], log_probs[:, t])
+        states.append(state_step)
+    assert torch.equal(state[0], state_step[0])
+    assert abs(log_probs[0, 2, 2].item() - (-0.05 * math.log(10))) < 1e-5
+
+    # shortlist scoring for shallow fusion
+    candidate_ids = torch.LongTensor([[2, 6, 4]])
+    _, _, log_probs_sl = lm.cached_predict(ys[:, 2:3], states[2], [[2, 4, 5]], candidate_ids=candidate_ids)
+    assert torch.allclose(log_probs_sl[:, 0], log_probs_step[:, 0].gather(1, candidate_ids))
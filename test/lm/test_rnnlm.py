@@ -7,6 +7,7 @@ import argparse
 import importlib
 import numpy as np
 import pytest
+import torch
 
 
 VOCAB = 100  # large for adaptive softmax
@@ -72,3 +73,87 @@ def test_forward(args):
     # assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "n_caches, bptt",
+    [
+        (3, 5),
+        (8, 5),
+        (8, 20),
+    ]
+)
+def test_neural_cache(n_caches, bptt):
+    args = make_args(n_units=16, emb_dim=16)
+    stream = np.random.randint(4, VOCAB, 41).astype(np.int64)
+
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module.RNNLM(args)
+    lm.eval()
+
+    # sequential implementation
+    losses = []
+    cache_ids, cache_keys = [], []
+    state = None
+    with torch.no_grad():
+        for t in range(len(stream) - 1):
+            logits, out, state = lm.decode(torch.from_numpy(stream[t:t + 1]).view(1, 1), state=state)
+            probs = torch.softmax(logits, dim=-1)
+            if len(cache_ids) > 0:
+                cache_ids, cache_keys = cache_ids[-n_caches:], cache_keys[-n_caches:]
+                cache_attn = torch.softmax(lm.cache_theta * torch.matmul(
+                    torch.cat(cache_keys, dim=1), out.transpose(2, 1)).squeeze(2), dim=1)
+                cache_probs = probs.new_zeros(probs.size())
+                for offset, idx in enumerate(cache_ids):
+                    cache_probs[:, :, idx] += cache_attn[:, offset]
+                probs = (1 - lm.cache_lambda) * probs + lm.cache_lambda * cache_probs
+            losses.append(-torch.log(probs[0, 0, stream[t + 1]]).item())
+            cache_ids += [stream[t + 1]]
+            cache_keys += [out]
+
+    # batched implementation over BPTT windows, with two identical streams
+    total_loss = 0
+    state = None
+    for offset in range(0, len(stream) - 1, bptt - 1):
+        ys = np.stack([stream[offset:offset + bptt]] * 2)
+        loss, state, _ = lm(ys, state, is_eval=True, n_caches=n_caches)
+        total_loss += loss.item() * (ys.shape[1] - 1)
+    assert lm.cache_ids.size(0) == 2
+    assert np.allclose(total_loss, sum(losses), rtol=1e-5)
+    assert len(lm.cache_attn) == n_caches
+    assert lm.cache_attn[-1].shape == (2, n_caches)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'lm_type': 'lstm', 'n_layers': 2}),
+        ({'lm_type': 'gru', 'n_layers': 2}),
+        ({'n_projs': 16}),
+        ({'residual': True}),
+        ({'n_units_null_context': 16}),
+        ({'use_glu': True, 'residual': True}),
+        ({'adaptive_softmax': True}),
+        ({'tie_embedding': True}),
+    ]
+)
+def test_decode_step(args):
+    args = make_args(**args)
+    batch_size = 4
+    ymax = 5
+
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module.RNNLM(args)
+    lm.eval()
+
+    ys = torch.randint(4, VOCAB, (batch_size, ymax), dtype=torch.int64)
+    with torch.no_grad():
+        logits, out, state = lm.decode(ys, None)
+        state_step = None
+        for t in range(ymax):
+            logits_step, out_step, state_step = lm.decode(ys[:, t:t + 1], state_step, incremental=True)
+            assert torch.allclose(logits_step[:, 0], logits[:, t], atol=1e-6)
+            assert torch.allclose(out_step[:, 0], out[:, t], atol=1e-6)
+    assert torch.allclose(state_step['hxs'], state['hxs'], atol=1e-6)
+    if args.lm_type == 'lstm':
+        assert torch.allclose(state_step['cxs'], state['cxs'], atol=1e-6)
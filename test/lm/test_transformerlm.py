@@ -7,6 +7,7 @@ import argparse
 import importlib
 import numpy as np
 import pytest
+import torch
 
 
 VOCAB = 100  # large for adaptive softmax
@@ -32,6 +33,7 @@ def make_args(**kwargs):
         lsm_prob=0.0,
         transformer_param_init='xavier_uniform',
         mem_len=0,
+        recog_kv_cache_len=0,
         recog_mem_len=0,
         adaptive_softmax=False,
         tie_embedding=False,
@@ -79,3 +81,50 @@ def test_forward(args):
     # assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'transformer_n_heads': 4}),
+        ({'adaptive_softmax': True}),
+        ({'tie_embedding': True}),
+        ({'recog_kv_cache_len': 4}),
+    ]
+)
+def test_decode_incremental(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    ymax = 8
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.lm.transformerlm')
+    lm = module.TransformerLM(args)
+    lm = lm.to(device)
+    lm.eval()
+
+    ys = torch.randint(0, VOCAB, (batch_size, ymax), dtype=torch.int64)
+    mems = None
+    with torch.no_grad():
+        state = None
+        for t in range(ymax):
+            lmout, state, log_probs = lm.predict(ys[:, :t + 1], None, mems=mems, cache=state)
+            assert lmout.size() == (batch_size, 1, args.transformer_d_model)
+            assert len(state) == args.n_layers
+            if args.recog_kv_cache_len > 0:
+                assert state[0].size(1) <= args.recog_kv_cache_len
+            else:
+                logits_ref, out_ref, _ = lm.decode(ys[:, :t + 1], mems=mems)
+                assert torch.allclose(lmout[:, -1], out_ref[:, -1], atol=1e-5)
+
+        # reorder states across hypotheses
+        perm = torch.LongTensor([2, 0, 3, 1])
+        state = None
+        for t in range(ymax):
+            if t == ymax // 2:
+                state = [state_l.index_select(0, perm) for state_l in state]
+            ys_t = ys[perm, :t + 1] if t >= ymax // 2 else ys[:, :t + 1]
+            lmout, state, _ = lm.predict(ys_t, None, mems=mems, cache=state)
+        if args.recog_kv_cache_len == 0:
+            _, out_ref, _ = lm.decode(ys[perm], mems=mems)
+            assert torch.allclose(lmout[:, -1], out_ref[:, -1], atol=1e-5)
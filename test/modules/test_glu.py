@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for convolutional GLU block."""
+
+import importlib
+import pytest
+import torch
+
+
+def make_args(**kwargs):
+    args = dict(
+        kernel_size=3,
+        in_ch=16,
+        out_ch=16,
+        bottlececk_dim=0,
+        dropout=0.1,
+    )
+    args.update(kwargs)
+    return args
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'kernel_size': 3}),
+        ({'kernel_size': 1}),
+        ({'out_ch': 32}),
+        ({'bottlececk_dim': 8}),
+    ]
+)
+def test_remove_weight_norm(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    max_len = 40
+    device = "cpu"
+
+    xs = torch.randn(batch_size, args['in_ch'], max_len, 1, device=device)
+
+    module = importlib.import_module('neural_sp.models.modules.glu')
+    block = module.ConvGLUBlock(**args)
+    block = block.to(device)
+    block.eval()
+
+    with torch.no_grad():
+        out_ref = block(xs)
+    assert out_ref.size() == (batch_size, args['out_ch'], max_len, 1)
+
+    n_removed = 0
+    for m in block.modules():
+        if hasattr(m, 'weight_g'):
+            torch.nn.utils.remove_weight_norm(m)
+            n_removed += 1
+    assert n_removed > 0
+    assert not any(hasattr(m, 'weight_g') or hasattr(m, 'weight_v') for m in block.modules())
+
+    with torch.no_grad():
+        out = block(xs)
+    assert torch.allclose(out, out_ref, atol=1e-6)
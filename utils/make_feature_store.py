@@ -0,0 +1,50 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Pack Kaldi features into a memory-mapped sharded feature store."""
+
+import argparse
+import codecs
+import os
+
+from neural_sp.datasets.feature_store import benchmark_read
+from neural_sp.datasets.feature_store import make_feature_store
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--feat', type=str,
+                    help='feats.scp file')
+parser.add_argument('--out', type=str, default='', nargs='?',
+                    help='prefix of output files (the same as the scp file by default)')
+parser.add_argument('--dtype', type=str, default='float16',
+                    choices=['float16', 'float32'],
+                    help='data type of stored features')
+parser.add_argument('--shard_size', type=int, default=1024,
+                    help='maximum size of each shard [MB]')
+parser.add_argument('--benchmark', action='store_true',
+                    help='compare read throughput with the Kaldi ark files')
+args = parser.parse_args()
+
+
+def read_scp(scp_path):
+    with codecs.open(scp_path, 'r', encoding="utf-8") as f:
+        return [line.strip().split(' ', 1)[1] for line in f if line.strip() != '']
+
+
+def main():
+
+    out_prefix = args.out if args.out else os.path.splitext(args.feat)[0] + '.store'
+    out_scp_path = make_feature_store(args.feat, out_prefix, args.dtype,
+                                      shard_size=args.shard_size * 1024 ** 2)
+    print(out_scp_path)
+
+    if args.benchmark:
+        for name, scp_path in [('ark', args.feat), ('store', out_scp_path)]:
+            n_bytes_per_sec, utts_per_sec = benchmark_read(read_scp(scp_path))
+            print('%s: %.1f MB/s, %.1f utts/s' % (name, n_bytes_per_sec / 1024 ** 2, utts_per_sec))
+
+
+if __name__ == '__main__':
+    main()
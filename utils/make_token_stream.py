@@ -0,0 +1,32 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Pack a dataset tsv file into a memory-mapped token stream for LM training."""
+
+import argparse
+import os
+
+from neural_sp.datasets.asr import count_vocab_size
+from neural_sp.datasets.lm import make_token_stream
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--tsv', type=str,
+                    help='dataset tsv file')
+parser.add_argument('--dict', type=str,
+                    help='dictionary file')
+parser.add_argument('--out', type=str, default='', nargs='?',
+                    help='prefix of output files (the same as the tsv file by default)')
+args = parser.parse_args()
+
+
+def main():
+
+    out_prefix = args.out if args.out else os.path.splitext(args.tsv)[0]
+    print(make_token_stream(args.tsv, out_prefix, count_vocab_size(args.dict)))
+
+
+if __name__ == '__main__':
+    main()